@@ -3,13 +3,20 @@
 Startup script for Control System Web.
 '''
 
-import sys, os.path, glob
+import sys, os.path, glob, optparse
 
 # Setup python search path before importing modules from 'csweb' #
 csweb_home = os.path.dirname(os.path.abspath(os.path.dirname(sys.argv[0])))
 sys.path.append(csweb_home)
 
 
+# Worker processes are started with the listening socket (see 'config/12-process.py').
+parser = optparse.OptionParser()
+parser.add_option("--worker-fd", dest="worker_fd", type="int", default=None, help=optparse.SUPPRESS_HELP)
+(options, args) = parser.parse_args()
+csweb_worker_fd = options.worker_fd
+
+
 # Execute configuration scripts from '$(csweb_home)/config' directory.
 config_path = os.path.join(csweb_home, 'config')
 if not os.path.isdir(config_path):
@@ -0,0 +1,29 @@
+# coding=UTF-8
+'''
+Configure multiple processes.
+'''
+
+import os.path
+
+from csweb.device.remote import DeviceServerFactory
+from csweb.util.ring import RingWriter
+
+# To scale with the number of cores, start 'processWorkers' front-end processes
+# that share the web site port and get device data from this (backend) process
+# over the UNIX socket at 'processBackend'. The backend owns all device
+# subscriptions, so each PV has one CA monitor however many workers subscribe.
+# Updates are written once to the memory-mapped ring buffer at 'processRing'
+# of 'processRingSize' bytes, shared by all workers (None to send the updates
+# to each worker). Workers that fall behind by more than the size of the ring
+# get the latest data of their subscriptions again.
+processWorkers = 0
+processBackend = os.path.join(csweb_home, "cswebd.sock")
+processRing = os.path.join(csweb_home, "cswebd.ring")
+processRingSize = 64 * 1024 * 1024
+
+if csweb_worker_fd is None and processWorkers > 0:
+    backendRing = None
+    if processRing is not None:
+        backendRing = RingWriter(processRing, processRingSize)
+    backendPort = reactor.listenUNIX(processBackend, DeviceServerFactory(deviceManager, backendRing), wantPID=True)
+    log.msg('process.py: Backend listening on socket: %(p)s', p=processBackend, logLevel=_INFO)
@@ -2,8 +2,45 @@
 Configure EPICS device provider.
 '''
 
-from csweb.epics.provider import EpicsDeviceFactory
-
-epicsDeviceFactory = EpicsDeviceFactory();
-deviceManager.addFactory(epicsDeviceFactory)
-log.msg('epics.py: Add EpicsDeviceFactory: %(d)s', d=epicsDeviceFactory, logLevel=_INFO)
+# Data read by GET (without an existing subscription) is cached for 'readTTL' seconds
+# and reads fail after 'readTimeout' seconds (ie EpicsDeviceFactory(readTTL=1.0, readTimeout=5.0)).
+# The number of subscriptions with different parameters for each PV can be limited
+# by 'maxDerived' (ie EpicsDeviceFactory(maxDerived=20)).
+# Channels stay connected for 'lingerTime' seconds after the last subscription is removed,
+# so a page reload does not reconnect every PV, at most 'maxLinger' idle channels are kept
+# (ie EpicsDeviceFactory(lingerTime=10.0, maxLinger=1000), lingerTime=0 to disconnect immediately).
+# Channel Access callbacks are called in the reactor thread in batches of at most
+# 'maxBatchSize' per reactor iteration, after waiting 'latency' seconds for more
+# callbacks (ie csweb.epics.client.configureCallbacks(maxBatchSize=1000, latency=0.0)),
+# the queue depth and drain time are available from csweb.epics.client.callbackCounters().
+# Channels are created in batches of at most 'maxBatchSize' per reactor iteration, after
+# waiting 'delay' seconds for more subscriptions (ie csweb.epics.client.configureConnections(maxBatchSize=500, delay=0.0)),
+# the connect latency percentiles are available from csweb.epics.client.connectionCounters().
+# Array (ie waveform) PVs larger than 16 KB require the environment variable
+# EPICS_CA_MAX_ARRAY_BYTES to be increased (ie os.environ['EPICS_CA_MAX_ARRAY_BYTES'] = '8000000'),
+# clients can reduce large arrays with the 'points' parameter (ie epics:WAVEFORM?points=1000).
+# Simulated PVs generate updates in process, to load test the subscriptions, serialization
+# and WebSocket fan-out of the server on one machine (without an IOC), so enable only for
+# testing (ie simDevices = True). The URL specifies the pattern, the rate (in Hz) and the
+# size of arrays (ie sim:ramp?hz=50&n=1000, sim:sine?n=1000&period=2.0) and the connect and
+# disconnect behaviour (ie sim:random?delay=1.0&uptime=10.0&downtime=2.0), the parameters
+# of EPICS PVs also apply (ie sim:ramp?hz=100&rate=1.0), the rate and the size are limited
+# by 'maxRate' and 'maxSize' (ie SimDeviceFactory(maxRate=1000.0, maxSize=1000000)).
+simDevices = False
+if csweb_worker_fd is None:
+    from csweb.epics.provider import EpicsDeviceFactory
+    epicsDeviceFactory = EpicsDeviceFactory();
+    deviceManager.addFactory(epicsDeviceFactory)
+    log.msg('epics.py: Add EpicsDeviceFactory: %(d)s', d=epicsDeviceFactory, logLevel=_INFO)
+    if simDevices:
+        from csweb.epics.provider import SimDeviceFactory
+        simDeviceFactory = SimDeviceFactory()
+        deviceManager.addFactory(simDeviceFactory)
+        log.msg('epics.py: Add SimDeviceFactory: %(d)s', d=simDeviceFactory, logLevel=_INFO)
+else:
+    # Worker processes get EPICS data from the backend process (without loading PyEpics).
+    from csweb.device.remote import RemoteDeviceFactory
+    remoteDeviceFactory = RemoteDeviceFactory(("epics", "sim") if simDevices else ("epics",), ring=processRing)
+    remoteDeviceFactory.connect(processBackend)
+    deviceManager.addFactory(remoteDeviceFactory)
+    log.msg('epics.py: Add RemoteDeviceFactory: %(d)s', d=remoteDeviceFactory, logLevel=_INFO)
@@ -23,5 +23,15 @@ website = Site(webroot)
 log.msg('website.py: Site: %(r)s', r=webroot, logLevel=_INFO)
 
 webport = 8080
-reactor.listenTCP(webport, website)
-log.msg('website.py: Site listening on port: %(p)s', p=str(webport), logLevel=_INFO)
+if csweb_worker_fd is not None:
+    from csweb.util.process import adoptPort
+    adoptPort(csweb_worker_fd, website)
+    log.msg('website.py: Worker site listening on port: %(p)s', p=str(webport), logLevel=_INFO)
+elif processWorkers > 0:
+    from csweb.util.process import WorkerPool
+    workerPool = WorkerPool(processWorkers, [ os.path.abspath(sys.argv[0]) ], webport)
+    workerPool.start()
+    log.msg('website.py: Site listening on port: %(p)s with %(n)s workers', p=str(webport), n=processWorkers, logLevel=_INFO)
+else:
+    reactor.listenTCP(webport, website)
+    log.msg('website.py: Site listening on port: %(p)s', p=str(webport), logLevel=_INFO)
@@ -0,0 +1,16 @@
+# coding=UTF-8
+'''
+Initialize API resources.
+'''
+
+from csweb.service.snapshot import SnapshotResource
+
+apiResource = Resource()
+webroot.putChild("api", apiResource)
+log.msg('api.py: Resource added at "/api": %(r)s', r=apiResource, logLevel=_DEBUG)
+
+# Get the latest data of many devices (ie /api/snapshot?url=epics:PV1&url=epics:PV2)
+# as JSON, or as MessagePack with the header 'Accept: application/msgpack'.
+snapshotResource = SnapshotResource()
+apiResource.putChild("snapshot", snapshotResource)
+log.msg('api.py: Resource added at "/api/snapshot": %(r)s', r=snapshotResource, logLevel=_DEBUG)
@@ -0,0 +1,16 @@
+# coding=UTF-8
+'''
+Initialize event source (Server-Sent Events) resource.
+'''
+
+from csweb.service.eventsource import EventSourceDeviceResource
+
+eventsourceResource = Resource()
+webroot.putChild("eventsource", eventsourceResource)
+log.msg('eventsource.py: Resource added at "/eventsource": %(r)s', r=eventsourceResource, logLevel=_DEBUG)
+
+# Devices are specified by the 'url' parameters (ie /eventsource/device?url=epics:PV1&url=epics:PV2)
+# and a heartbeat comment is sent every 'heartbeatInterval' seconds to keep proxies from closing the stream.
+eventsourceDeviceResource = EventSourceDeviceResource(heartbeatInterval=15.0)
+eventsourceResource.putChild("device", eventsourceDeviceResource)
+log.msg('eventsource.py: Resource added at "/eventsource/device": %(r)s', r=eventsourceDeviceResource, logLevel=_DEBUG)
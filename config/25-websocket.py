@@ -10,6 +10,19 @@ websocketResource = Resource()
 webroot.putChild("websocket", websocketResource)
 log.msg('websocket.py: Resource added at "/websocket": %(r)s', r=websocketResource, logLevel=_DEBUG)
 
-websocketDeviceResource = WebSocketsResource(WebSocketDeviceProtocolFactory())
+# To coalesce device updates into one message per connection, specify
+# the flush interval in seconds (ie WebSocketDeviceProtocolFactory(flushInterval=0.1)).
+# Updates to slow clients are conflated once the bytes pending in the transport
+# reach 'highWatermark' until they fall to 'lowWatermark' (ie 64KiB and 16KiB).
+# To compress messages with the permessage-deflate extension specify 'deflate=True',
+# compressed messages are shared between connections unless 'deflateContextTakeover=True'
+# and messages smaller than 'deflateMinSize' bytes are not compressed.
+# Connections are closed if a received message exceeds 'maxMessageSize' bytes.
+# To limit the number of connections (closed with status 1013 'Try Again Later'),
+# subscriptions per connection and queued requests per connection specify
+# 'maxConnections', 'maxSubscriptions' and 'maxQueuedRequests', requests
+# exceeding the limits are rejected with an error message for the URL
+# (ie WebSocketDeviceProtocolFactory(maxConnections=1000, maxSubscriptions=500)).
+websocketDeviceResource = WebSocketsResource(WebSocketDeviceProtocolFactory(), highWatermark=65536, lowWatermark=16384)
 websocketResource.putChild("device", websocketDeviceResource)
 log.msg('websocket.py: Resource added at "/websocket/device": %(r)s', r=websocketDeviceResource, logLevel=_DEBUG)
@@ -20,6 +20,16 @@ class DeviceProvider():
         raise NotImplementedError()
 
 
+    def sequence(self):
+        '''
+        Override this default implementation to support conditional GET operations.
+
+        The implementation must return a value that changes whenever the value
+        of the device returned by GET changes, or else None if it is unknown.
+        '''
+        return None
+
+
     def put(self, value):
         '''
         Override this abstract implementation to handle the PUT operation.
@@ -73,3 +83,12 @@ class NotSupportedError(ValueError):
     For example the scheme of the URI may be different than expected by the factory.
     '''
     pass
+
+
+class LimitError(Exception):
+    '''
+    A custom exception class to indicate that a request was rejected because a limit was reached.
+
+    For example the maximum number of subscriptions derived from a device.
+    '''
+    pass
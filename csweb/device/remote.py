@@ -0,0 +1,734 @@
+# coding=UTF-8
+'''
+Share the device subscriptions of one (backend) process with other (front-end) processes.
+
+The backend serves the devices of its DeviceManager with DeviceServerFactory
+(ie on a UNIX socket) and each front-end adds a RemoteDeviceFactory connected
+to the backend. A front-end subscribes to each URL only once, however many
+local protocols subscribe, and the backend only subscribes once to each device,
+however many front-ends subscribe, so each EPICS PV still has one CA monitor.
+
+If the backend has a ring buffer (see util.ring) then the updates are written
+to the ring once for all front-ends, and the front-ends are notified to read
+the ring, instead of sending the updates to each front-end. The initial data
+of subscriptions, and the latest data after a front-end is overrun, are sent
+with the sequence number of the ring, so older updates in the ring are ignored.
+
+The messages are JSON arrays prefixed by their length (32-bit):
+    ["SUB", url]                      Subscribe to the device (front-end to backend)
+    ["UNSUB", url]                    Release the subscription to the device
+    ["GET", id, url]                  Get the data of the device
+    ["SUBSCRIBED", url]               Subscription successful (backend to front-end)
+    ["ERROR", url, error, message]    Subscription failed
+    ["RESYNC", lost]                  Send the latest data of all subscriptions
+    ["DATA", url, data, sequence]     Data of the subscription
+    ["RING", sequence]                Updates written to the ring
+    ["RESULT", id, data]              Result of GET
+    ["FAILURE", id, error, message]   GET failed
+
+The DATA of a device with an array value (see arrays.isBinary) is instead sent
+as an encoded array (see arrays.encode) with the 'sequence' in the header, so
+the bytes of the array are copied, not converted to a list of numbers, and the
+front-end receives the array. The updates written to the ring are encoded alike.
+'''
+
+import copy
+
+from itertools import count
+
+from ..util import log, json, arrays
+from ..util.dist import DistributingProtocol, DistributingTransport
+from ..util.ring import RingReader, RingOverrun
+
+from .provider import DeviceProvider, DeviceFactory, NotSupportedError, LimitError
+
+from twisted.internet import defer, error, protocol, reactor
+from twisted.protocols.basic import Int32StringReceiver
+from twisted.python.failure import Failure
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+# Maximum length of a message (ie the data of a large waveform).
+_MAX_LENGTH = 64 * 1024 * 1024
+
+# Errors that are raised again by the front-end, others are raised as Exception.
+_ERRORS = (LimitError, ValueError)
+
+
+def _encodeMessage(message):
+    return json.stringify(message, sanitize=True)
+
+
+def _encodeData(url, data, sequence):
+    if arrays.isBinary(data):
+        return "".join(arrays.encode(url, data, sequence=sequence))
+    return _encodeMessage([ "DATA", url, data, sequence ])
+
+
+def _encodeUpdate(url, data):
+    if arrays.isBinary(data):
+        return "".join(arrays.encode(url, data))
+    return _encodeMessage(data)
+
+
+def _decodeUpdate(payload):
+    if arrays.isEncoded(payload):
+        return arrays.decode(payload)[1]
+    return json.parse(payload)
+
+
+def _encodeError(failure):
+    for errorType in _ERRORS:
+        if failure.check(errorType):
+            return errorType.__name__, failure.getErrorMessage()
+    return Exception.__name__, failure.getErrorMessage()
+
+
+def _decodeError(name, message):
+    for errorType in _ERRORS:
+        if errorType.__name__ == name:
+            return errorType(message)
+    return Exception(message)
+
+
+def _str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+class DeviceServerFactory(protocol.ServerFactory):
+    '''
+    Serve the devices of the specified DeviceManager to front-end processes,
+    with an optional RingWriter for the updates.
+    '''
+
+    def __init__(self, manager, ring=None):
+        self._manager = manager
+        self._ring = ring
+        self._protocols = set()
+        self._notifyCall = None
+
+
+    def buildProtocol(self, addr):
+        log.msg("DeviceServerFactory: buildProtocol: Front-end connected from %(a)s", a=addr, logLevel=_DEBUG)
+        protocol = DeviceServerProtocol(self._manager)
+        protocol.factory = self
+        return protocol
+
+
+    def registerProtocol(self, protocol):
+        self._protocols.add(protocol)
+
+
+    def unregisterProtocol(self, protocol):
+        self._protocols.discard(protocol)
+
+
+    def sequence(self):
+        '''
+        Return the sequence number of the last update written to the ring, or None.
+        '''
+        if self._ring is None:
+            return None
+        return self._ring.sequence()
+
+
+    def publish(self, url, data):
+        '''
+        Write the update to the ring and return the sequence number, or None
+        if there is no ring or the update is too large for the ring.
+        '''
+        if self._ring is None:
+            return None
+        try:
+            sequence = self._ring.publish(url, _encodeUpdate(url, data))
+        except ValueError as e:
+            log.msg("DeviceServerFactory: publish: Update not written to ring: %(e)s", e=e, logLevel=_DEBUG)
+            return None
+        if self._notifyCall is None:
+            self._notifyCall = reactor.callLater(0, self._notify)
+        return sequence
+
+
+    def _notify(self):
+        # One notification for all the updates written in a reactor iteration.
+        self._notifyCall = None
+        message = [ "RING", self._ring.sequence() ]
+        for protocol in self._protocols:
+            protocol.sendMessage(message)
+
+
+class DeviceServerProtocol(Int32StringReceiver):
+    '''
+    Protocol to handle the requests of one front-end process.
+    '''
+
+    MAX_LENGTH = _MAX_LENGTH
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._subscriptions = {}
+
+
+    def connectionMade(self):
+        self.factory.registerProtocol(self)
+
+
+    def stringReceived(self, string):
+        try:
+            message = json.parse(string)
+        except ValueError as e:
+            log.msg("DeviceServerProtocol: stringReceived: Invalid message: %(e)s", e=e, logLevel=_WARN)
+            return
+        if not isinstance(message, list) or len(message) < 2:
+            log.msg("DeviceServerProtocol: stringReceived: Invalid message: %(m)r", m=message, logLevel=_WARN)
+            return
+        action = message[0]
+        if action == 'SUB':
+            self._subscribe(_str(message[1]))
+        elif action == 'UNSUB':
+            self._unsubscribe(_str(message[1]))
+        elif action == 'GET' and len(message) == 3:
+            self._get(message[1], _str(message[2]))
+        elif action == 'RESYNC':
+            self._resync(message[1])
+        else:
+            log.msg("DeviceServerProtocol: stringReceived: Unsupported message: %(m)r", m=message, logLevel=_WARN)
+
+
+    def connectionLost(self, reason):
+        log.msg("DeviceServerProtocol: connectionLost: Release %(n)d subscriptions", n=len(self._subscriptions), logLevel=_DEBUG)
+        self.factory.unregisterProtocol(self)
+        subscriptions = self._subscriptions.values()
+        self._subscriptions.clear()
+        for subscription in subscriptions:
+            subscription.loseConnection()
+
+
+    def sendMessage(self, message):
+        try:
+            self.sendString(_encodeMessage(message))
+        except Exception as e:
+            log.msg("DeviceServerProtocol: sendMessage: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+
+
+    def sendData(self, url, data, transport, initial):
+        '''
+        Write the update of the subscription to the ring, or send the data,
+        the ring record or message is shared with the other front-ends that
+        subscribe to the same URL.
+        '''
+        try:
+            if not initial and transport.encodedData(data, ('ring', url), lambda: self.factory.publish(url, data)) is not None:
+                return
+            message = transport.encodedData(data, ('remote', url), lambda: _encodeData(url, data, self.factory.sequence()))
+        except Exception as e:
+            log.msg("DeviceServerProtocol: sendData: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+            return
+        self.sendString(message)
+
+
+    def subscriptionMade(self, url, subscription):
+        if self._subscriptions.get(url) is subscription:
+            self.sendMessage([ "SUBSCRIBED", url ])
+
+
+    def subscriptionFailed(self, url, subscription, failure):
+        if self._subscriptions.get(url) is subscription:
+            del self._subscriptions[url]
+            self.sendMessage([ "ERROR", url ] + list(_encodeError(failure)))
+
+
+    def _subscribe(self, url):
+        if url in self._subscriptions:
+            log.msg("DeviceServerProtocol: _subscribe: Subscription found for URL %(u)s", u=url, logLevel=_DEBUG)
+            self.sendMessage([ "SUBSCRIBED", url ])
+            return
+        try:
+            provider = self._manager.buildProvider(url)
+        except ValueError as e:
+            log.msg("DeviceServerProtocol: _subscribe: Error building provider: %(e)s", e=e, logLevel=_WARN)
+            self.sendMessage([ "ERROR", url, ValueError.__name__, str(e) ])
+            return
+        subscription = _ServerSubscription(url, self)
+        self._subscriptions[url] = subscription
+        subscription.subscribe(provider)
+
+
+    def _unsubscribe(self, url):
+        subscription = self._subscriptions.pop(url, None)
+        if subscription is None:
+            log.msg("DeviceServerProtocol: _unsubscribe: No subscription for URL %(u)s", u=url, logLevel=_DEBUG)
+            return
+        subscription.loseConnection()
+
+
+    def _resync(self, lost):
+        log.msg("DeviceServerProtocol: _resync: Front-end overrun, %(n)s updates lost", n=lost, logLevel=_WARN)
+        sequence = self.factory.sequence()
+        for url, subscription in self._subscriptions.items():
+            data = subscription.lastData()
+            if data is None:
+                continue
+            try:
+                self.sendString(_encodeData(url, data, sequence))
+            except Exception as e:
+                log.msg("DeviceServerProtocol: _resync: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+
+
+    def _get(self, id, url):
+        try:
+            deferred = self._manager.buildProvider(url).get()
+        except (ValueError, NotImplementedError) as e:
+            log.msg("DeviceServerProtocol: _get: Error getting %(u)s: %(e)s", u=url, e=e, logLevel=_DEBUG)
+            deferred = defer.fail(e)
+        deferred.addCallbacks(self._getCallback, self._getErrback, callbackArgs=(id,), errbackArgs=(id,))
+
+
+    def _getCallback(self, data, id):
+        self.sendMessage([ "RESULT", id, data ])
+
+
+    def _getErrback(self, failure, id):
+        log.msg("DeviceServerProtocol: _getErrback: Failure %(f)s", f=failure.getErrorMessage(), logLevel=_DEBUG)
+        self.sendMessage([ "FAILURE", id ] + list(_encodeError(failure)))
+
+
+class _ServerSubscription:
+    '''
+    The subscription of a front-end to one device.
+    '''
+
+    def __init__(self, url, server):
+        self._url = url
+        self._server = server
+        self._protocol = None
+        self._deferred = None
+
+
+    def subscribe(self, provider):
+        self._deferred = provider.subscribe(_ServerSubscriptionProtocolFactory(self._url, self._server))
+        self._deferred.addCallbacks(self._subscribeCallback, self._subscribeErrback)
+
+
+    def loseConnection(self):
+        if self._protocol is not None:
+            log.msg("_ServerSubscription: loseConnection: Protocol %(p)s", p=self._protocol, logLevel=_DEBUG)
+            self._protocol.transport.loseConnection()
+        elif self._deferred is not None:
+            log.msg("_ServerSubscription: loseConnection: Deferred %(d)s", d=self._deferred, logLevel=_DEBUG)
+            self._deferred.cancel()
+
+
+    def lastData(self):
+        if self._protocol is None:
+            return None
+        return self._protocol.lastData
+
+
+    def _subscribeCallback(self, protocol):
+        self._protocol = protocol
+        self._server.subscriptionMade(self._url, self)
+
+
+    def _subscribeErrback(self, failure):
+        log.msg("_ServerSubscription: _subscribeErrback: Failure %(f)s", f=failure.getErrorMessage(), logLevel=_DEBUG)
+        self._server.subscriptionFailed(self._url, self, failure)
+
+
+class _ServerSubscriptionProtocol(protocol.Protocol):
+    '''
+    Protocol to send the data of a device subscription to a front-end.
+    '''
+
+    def __init__(self, url, server):
+        self.url = url
+        self.lastData = None
+        self._server = server
+
+
+    def dataReceived(self, data):
+        log.msg("_ServerSubscriptionProtocol: dataReceived: Data type %(t)s", t=type(data), logLevel=_TRACE)
+        initial = self.lastData is None
+        self.lastData = data
+        self._server.sendData(self.url, data, self.transport, initial)
+
+
+    def connectionLost(self, reason):
+        log.msg("_ServerSubscriptionProtocol: connectionLost: Reason %(r)s", r=reason, logLevel=_DEBUG)
+
+
+class _ServerSubscriptionProtocolFactory(protocol.Factory):
+
+    def __init__(self, url, server):
+        self._url = url
+        self._server = server
+
+
+    def buildProtocol(self, addr):
+        return _ServerSubscriptionProtocol(self._url, self._server)
+
+
+class RemoteDeviceProvider(DeviceProvider):
+    '''
+    Implementation of DeviceProvider interface for the devices of a backend process.
+    '''
+
+    def __init__(self, client, url):
+        self._client = client
+        self._url = url
+
+
+    def get(self):
+        '''
+        Get the most recent data of a local subscription, or else from the backend.
+        '''
+        data = self._client.lastData(self._url)
+        if data is not None:
+            return defer.succeed(copy.copy(data))
+        return self._client.get(self._url)
+
+
+    def sequence(self):
+        return self._client.lastSequence(self._url)
+
+
+    def subscribe(self, protocolFactory):
+        return self._client.subscribe(self._url, protocolFactory)
+
+
+class RemoteDeviceFactory(DeviceFactory):
+    '''
+    Implementation of DeviceFactory interface for the devices of a backend process.
+
+    The URLs with the specified schemes are provided by the backend, which
+    validates the URLs and reports any errors. If the backend has a ring
+    buffer then specify the path of the ring.
+    '''
+
+    def __init__(self, schemes, cacheable=True, ring=None):
+        self._schemes = schemes
+        self._cacheable = cacheable
+        self._client = DeviceClientFactory(ring)
+
+
+    def connect(self, address):
+        '''
+        Connect to the backend listening on the UNIX socket at the specified address.
+        '''
+        log.msg("RemoteDeviceFactory: connect: Connect to backend %(a)s", a=address, logLevel=_DEBUG)
+        return reactor.connectUNIX(address, self._client)
+
+
+    def cacheable(self):
+        return self._cacheable
+
+
+    def buildProvider(self, url):
+        scheme = str(url).partition(':')[0]
+        if scheme not in self._schemes:
+            raise NotSupportedError("Scheme (%s) not supported by RemoteDeviceProvider" % (scheme,))
+        return RemoteDeviceProvider(self._client, str(url))
+
+
+class DeviceClientFactory(protocol.ReconnectingClientFactory):
+    '''
+    Client of the backend process, shared by the local subscriptions to each URL.
+
+    If the connection is lost then the subscriptions are made again when reconnected.
+    The ring buffer at the specified path (if any) is opened when connected.
+    '''
+
+    maxDelay = 10
+
+    def __init__(self, ring=None):
+        self._subscriptions = {}
+        self._gets = {}
+        self._ids = count(1)
+        self._protocol = None
+        self._ringPath = ring
+        self._ring = None
+        self.overruns = 0
+
+
+    def buildProtocol(self, addr):
+        self.resetDelay()
+        protocol = DeviceClientProtocol()
+        protocol.factory = self
+        return protocol
+
+
+    def clientConnected(self, protocol):
+        log.msg("DeviceClientFactory: clientConnected: Subscribe to %(n)d URLs", n=len(self._subscriptions), logLevel=_DEBUG)
+        self._protocol = protocol
+        if self._ringPath is not None:
+            self._openRing()
+        for url, subscription in self._subscriptions.items():
+            # The backend may have restarted with new sequence numbers.
+            subscription.sequence = 0
+            protocol.sendMessage([ "SUB", url ])
+
+
+    def clientDisconnected(self, protocol):
+        log.msg("DeviceClientFactory: clientDisconnected: Fail %(n)d gets", n=len(self._gets), logLevel=_DEBUG)
+        self._protocol = None
+        gets = self._gets.values()
+        self._gets.clear()
+        for deferred in gets:
+            deferred.errback(error.ConnectionLost("Connection to backend lost"))
+
+
+    def subscribe(self, url, protocolFactory):
+        if url not in self._subscriptions:
+            log.msg("DeviceClientFactory: subscribe: No subscription for URL %(u)s", u=url, logLevel=_DEBUG)
+            self._subscriptions[url] = _RemoteSubscription(url, self)
+            self._sendMessage([ "SUB", url ])
+        return self._subscriptions[url].addProtocolFactory(protocolFactory)
+
+
+    def release(self, subscription):
+        if self._subscriptions.get(subscription.url) is subscription:
+            log.msg("DeviceClientFactory: release: Release subscription for URL %(u)s", u=subscription.url, logLevel=_DEBUG)
+            del self._subscriptions[subscription.url]
+            self._sendMessage([ "UNSUB", subscription.url ])
+
+
+    def get(self, url):
+        if self._protocol is None:
+            return defer.fail(error.NotConnectingError("Not connected to backend"))
+        id = next(self._ids)
+        deferred = defer.Deferred()
+        self._gets[id] = deferred
+        self._sendMessage([ "GET", id, url ])
+        return deferred
+
+
+    def lastData(self, url):
+        if url not in self._subscriptions:
+            return None
+        return self._subscriptions[url].lastData()
+
+
+    def lastSequence(self, url):
+        if url not in self._subscriptions:
+            return None
+        return self._subscriptions[url].lastSequence()
+
+
+    def messageReceived(self, message):
+        action = message[0]
+        if action == 'DATA' and len(message) == 4:
+            subscription = self._subscriptions.get(_str(message[1]))
+            if subscription is not None:
+                subscription.updateReceived(message[2], message[3], False)
+        elif action == 'RING':
+            self._readRing()
+        elif action == 'SUBSCRIBED':
+            subscription = self._subscriptions.get(_str(message[1]))
+            if subscription is not None:
+                subscription.subscribed()
+        elif action == 'ERROR' and len(message) == 4:
+            subscription = self._subscriptions.pop(_str(message[1]), None)
+            if subscription is not None:
+                subscription.failed(_decodeError(message[2], message[3]))
+        elif action == 'RESULT' and len(message) == 3:
+            deferred = self._gets.pop(message[1], None)
+            if deferred is not None:
+                deferred.callback(message[2])
+        elif action == 'FAILURE' and len(message) == 4:
+            deferred = self._gets.pop(message[1], None)
+            if deferred is not None:
+                deferred.errback(_decodeError(message[2], message[3]))
+        else:
+            log.msg("DeviceClientFactory: messageReceived: Unsupported message: %(m)r", m=message, logLevel=_WARN)
+
+
+    def _sendMessage(self, message):
+        if self._protocol is not None:
+            self._protocol.sendMessage(message)
+
+
+    def _openRing(self):
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        try:
+            self._ring = RingReader(self._ringPath)
+        except (IOError, ValueError) as e:
+            log.msg("DeviceClientFactory: _openRing: Error opening ring: %(e)s", e=e, logLevel=_WARN)
+
+
+    def _readRing(self):
+        if self._ring is None:
+            return
+        try:
+            updates = []
+            for sequence, key, payload in self._ring.read():
+                subscription = self._subscriptions.get(key)
+                if subscription is not None:
+                    updates.append((subscription, sequence, _decodeUpdate(str(payload))))
+            self._ring.validate()
+        except RingOverrun as e:
+            log.msg("DeviceClientFactory: _readRing: %(e)s", e=e, logLevel=_WARN)
+            self.overruns += 1
+            self._sendMessage([ "RESYNC", e.lost ])
+            return
+        for subscription, sequence, data in updates:
+            subscription.updateReceived(data, sequence, True)
+
+
+class DeviceClientProtocol(Int32StringReceiver):
+    '''
+    Protocol of the connection to the backend process.
+    '''
+
+    MAX_LENGTH = _MAX_LENGTH
+
+    def connectionMade(self):
+        log.msg("DeviceClientProtocol: connectionMade: Connected to backend", logLevel=_DEBUG)
+        self.factory.clientConnected(self)
+
+
+    def connectionLost(self, reason):
+        log.msg("DeviceClientProtocol: connectionLost: Reason %(r)s", r=reason, logLevel=_DEBUG)
+        self.factory.clientDisconnected(self)
+
+
+    def stringReceived(self, string):
+        try:
+            if arrays.isEncoded(string):
+                header = arrays.decodeHeader(string)
+                message = [ "DATA", header["url"], header["data"], header.get("sequence") ]
+            else:
+                message = json.parse(string)
+        except ValueError as e:
+            log.msg("DeviceClientProtocol: stringReceived: Invalid message: %(e)s", e=e, logLevel=_WARN)
+            return
+        if not isinstance(message, list) or len(message) < 2:
+            log.msg("DeviceClientProtocol: stringReceived: Invalid message: %(m)r", m=message, logLevel=_WARN)
+            return
+        self.factory.messageReceived(message)
+
+
+    def sendMessage(self, message):
+        self.sendString(_encodeMessage(message))
+
+
+class _RemoteSubscriptionCanceller:
+
+    def __init__(self, url):
+        self._url = url
+        self.cancelled = False
+
+
+    def cancel(self, deferred):
+        self.cancelled = True
+        if not deferred.called:
+            deferred.errback(Exception("Subscription to '%s' cancelled." % (self._url,)))
+
+
+class _RemoteSubscription(DistributingProtocol):
+    '''
+    Distribute the data of a backend subscription to the local protocols.
+
+    The protocols are added when the backend confirms the subscription.
+    '''
+
+    def __init__(self, url, client):
+        DistributingProtocol.__init__(self, None, [])
+        self.url = url
+        self.sequence = 0
+        self._client = client
+        self._subscribed = False
+        self._waiting = []
+
+
+    def addProtocolFactory(self, protocolFactory):
+        canceller = _RemoteSubscriptionCanceller(self.url)
+        deferred = defer.Deferred(canceller.cancel)
+        if self._subscribed:
+            reactor.callLater(0, self._addProtocol, deferred, canceller, protocolFactory)
+        else:
+            self._waiting.append((deferred, canceller, protocolFactory))
+        return deferred
+
+
+    def subscribed(self):
+        self._subscribed = True
+        waiting, self._waiting = self._waiting, []
+        for args in waiting:
+            self._addProtocol(*args)
+
+
+    def failed(self, reason):
+        '''
+        The backend rejected the subscription (ie after reconnecting), the
+        protocols lose the connection with the reason as a Failure, so they
+        can tell the subscription will not be made again.
+        '''
+        log.msg("_RemoteSubscription: failed: Reason %(r)s", r=reason, logLevel=_DEBUG)
+        waiting, self._waiting = self._waiting, []
+        for deferred, canceller, _ in waiting:
+            if not canceller.cancelled:
+                deferred.errback(reason)
+        protocols, self._protocols = self._protocols, []
+        for protocol in protocols:
+            protocol.connectionLost(Failure(reason))
+
+
+    def updateReceived(self, data, sequence, ring):
+        '''
+        Distribute the data unless it is older than the data already distributed.
+
+        The data sent by the backend is at least as recent as the last update
+        written to the ring (or None if there is no ring), and the data read
+        from the ring has the sequence number of the update.
+        '''
+        if sequence is not None:
+            if sequence < self.sequence or (ring and sequence == self.sequence):
+                log.msg("_RemoteSubscription: updateReceived: Ignore update %(s)d (%(l)d)", s=sequence, l=self.sequence, logLevel=_TRACE)
+                return
+            self.sequence = sequence
+        self.dataReceived(data)
+
+
+    def removeProtocol(self, protocol):
+        if protocol in self._protocols:
+            log.msg("_RemoteSubscription: removeProtocol: Remove protocol: %(p)s", p=protocol, logLevel=_DEBUG)
+            protocol.connectionLost("Connection closed cleanly")
+            self._protocols.remove(protocol)
+            if len(self._protocols) == 0:
+                self._client.release(self)
+        else:
+            log.msg("_RemoteSubscription: removeProtocol: Protocol not found %(p)s", p=protocol, logLevel=_WARN)
+
+
+    def _addProtocol(self, deferred, canceller, protocolFactory):
+        if canceller.cancelled:
+            if len(self._protocols) == 0:
+                log.msg("_RemoteSubscription: _addProtocol: Cancelled and no protocols, so release", logLevel=_DEBUG)
+                self._client.release(self)
+            return
+        protocol = protocolFactory.buildProtocol(None)
+        log.msg("_RemoteSubscription: _addProtocol: Append %(p)s (length: %(l)d+1)", p=protocol, l=len(self._protocols), logLevel=_DEBUG)
+        self._protocols.append(protocol)
+        deferred.callback(protocol)
+        protocol.makeConnection(_RemoteSubscriptionTransport(self, protocol))
+        if self._lastData is not None:
+            protocol.dataReceived(self._lastData)
+
+
+class _RemoteSubscriptionTransport(DistributingTransport):
+
+    def __init__(self, subscription, protocol):
+        DistributingTransport.__init__(self, None, subscription)
+        self._subscription = subscription
+        self._protocol = protocol
+
+
+    def loseConnection(self):
+        log.msg("_RemoteSubscriptionTransport: loseConnection: Remove protocol %(p)s", p=self._protocol, logLevel=_DEBUG)
+        self._subscription.removeProtocol(self._protocol)
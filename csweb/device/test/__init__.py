@@ -0,0 +1,4 @@
+# coding=UTF-8
+'''
+Declare package "test".
+'''
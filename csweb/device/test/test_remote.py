@@ -0,0 +1,258 @@
+# coding=UTF-8
+'''
+Tests for device 'remote'.
+'''
+
+from ..provider import LimitError
+from .. import remote
+from ..remote import DeviceServerFactory, DeviceClientFactory
+from ...epics.subs.sub import EpicsSubscription, EpicsSubscriptionCanceller, EpicsSubscriptionProtocol
+from ...util import arrays
+from ...util.ring import RingWriter
+
+from twisted.internet import defer, protocol, task
+from twisted.trial import unittest
+from twisted.test import iosim
+from twisted.test.proto_helpers import StringTransport
+
+
+
+class _FakeProvider:
+    '''
+    Provider of a connected subscription protocol shared by all subscribers.
+    '''
+    def __init__(self, manager, url):
+        self._manager = manager
+        self._url = url
+
+    def get(self):
+        return defer.succeed({ "value":self._url })
+
+    def subscribe(self, protocolFactory):
+        if self._url.startswith("epics:LIMIT"):
+            return defer.fail(LimitError("Too many"))
+        distributor = self._manager.distributor(self._url)
+        canceller = EpicsSubscriptionCanceller(distributor._subscription)
+        deferred = defer.Deferred(canceller.cancel)
+        distributor.addProtocolFactory(deferred, canceller, protocolFactory)
+        return deferred
+
+
+
+class _FakeManager:
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.distributors = {}
+
+    def buildProvider(self, url):
+        if not url.startswith("epics:"):
+            raise ValueError("Invalid URL")
+        return _FakeProvider(self, url)
+
+    def distributor(self, url):
+        if url not in self.subscriptions:
+            distributor = EpicsSubscriptionProtocol(None, EpicsSubscription(url, self.subscriptions))
+            distributor.makeConnection(StringTransport())
+            distributor.connectionMade()
+            self.distributors[url] = distributor
+        return self.distributors[url]
+
+    def publish(self, url, data):
+        # The initial data of subscribers (see EpicsClientSubscription).
+        self.distributor(url)._data = data
+        self.distributor(url).dataReceived(data)
+
+
+
+class _Receiver(protocol.Protocol):
+
+    def __init__(self, received):
+        self._received = received
+
+    def dataReceived(self, data):
+        self._received.append(data)
+
+
+
+class _ReceiverFactory(protocol.Factory):
+
+    def __init__(self):
+        self.received = []
+
+    def buildProtocol(self, addr):
+        return _Receiver(self.received)
+
+
+
+class TestRemote(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(remote, "reactor", self.clock)
+        self.manager = _FakeManager()
+        self.server = DeviceServerFactory(self.manager)
+        self.pumps = []
+
+
+    def _connect(self, client=None, ring=None):
+        if client is None:
+            client = DeviceClientFactory(ring)
+        _, _, pump = iosim.connectedServerAndClient(lambda: self.server.buildProtocol(None), lambda: client.buildProtocol(None))
+        self.pumps.append(pump)
+        return client, pump
+
+
+    def _flush(self):
+        for pump in self.pumps:
+            pump.flush()
+
+
+    def _subscribe(self, client, url):
+        factory = _ReceiverFactory()
+        results = []
+        client.subscribe(url, factory).addBoth(results.append)
+        self._flush()
+        self.clock.advance(0)
+        return factory, results
+
+
+    def test_shared_subscription(self):
+        clients = [ self._connect()[0] for _ in range(2) ]
+        self.encodings = 0
+        encodeMessage = remote._encodeMessage
+        def countingEncodeMessage(message):
+            if message[0] == "DATA":
+                self.encodings += 1
+            return encodeMessage(message)
+        self.patch(remote, "_encodeMessage", countingEncodeMessage)
+        subscribers = [ self._subscribe(client, "epics:A") for client in clients for _ in range(2) ]
+        distributor = self.manager.distributors["epics:A"]
+        # One backend subscription for each front-end.
+        self.assertEqual(len(distributor._protocols), 2)
+        distributor.dataReceived({ "value":1 })
+        self._flush()
+        self.assertEqual(self.encodings, 1)
+        for factory, results in subscribers:
+            self.assertEqual(factory.received, [ { "value":1 } ])
+        # The backend subscription is released with the last local subscription.
+        for _, results in subscribers[:2]:
+            results[0].transport.loseConnection()
+        self._flush()
+        self.assertEqual(len(distributor._protocols), 1)
+
+
+    def test_initial_data(self):
+        client, _ = self._connect()
+        self.manager.publish("epics:A", { "value":1 })
+        factory, results = self._subscribe(client, "epics:A")
+        self.assertEqual(factory.received, [ { "value":1 } ])
+        factory, results = self._subscribe(client, "epics:A")
+        self.assertEqual(factory.received, [ { "value":1 } ])
+
+
+    def test_errors(self):
+        client, _ = self._connect()
+        _, results = self._subscribe(client, "http:A")
+        results[0].trap(ValueError)
+        _, results = self._subscribe(client, "epics:LIMIT")
+        results[0].trap(LimitError)
+        self.assertEqual(client._subscriptions, {})
+
+
+    def test_get(self):
+        client, _ = self._connect()
+        results = []
+        client.get("epics:A").addBoth(results.append)
+        client.get("http:A").addBoth(results.append)
+        self._flush()
+        self.assertEqual(results[0], { "value":"epics:A" })
+        results[1].trap(ValueError)
+
+
+    def test_reconnect(self):
+        client, pump = self._connect()
+        factory, _ = self._subscribe(client, "epics:A")
+        pump.client.transport.loseConnection()
+        self._flush()
+        self.assertEqual(self.manager.subscriptions, {})
+        self.manager.publish("epics:A", { "value":2 })
+        # The subscriptions are made again by the new connection.
+        self._connect(client)
+        self.assertEqual(factory.received, [ { "value":2 } ])
+
+
+    def test_array(self):
+        if not arrays.available():
+            raise unittest.SkipTest("NumPy library not available")
+        client, _ = self._connect()
+        factory, _ = self._subscribe(client, "epics:A")
+        # The initial data is sent, the update is written to the ring (if any).
+        self.manager.publish("epics:A", { "value":arrays.numpy.arange(4, dtype="<f8"), "units":"mA" })
+        self.manager.distributor("epics:A").dataReceived({ "value":arrays.numpy.arange(3, dtype="<i2") })
+        self.clock.advance(0)
+        self._flush()
+        self.assertEqual(len(factory.received), 2)
+        for data, expected in zip(factory.received, [ [ 0.0, 1.0, 2.0, 3.0 ], [ 0, 1, 2 ] ]):
+            self.assertTrue(arrays.isArray(data["value"]))
+            self.assertEqual(data["value"].tolist(), expected)
+        self.assertEqual(factory.received[0]["units"], "mA")
+        self.assertEqual(factory.received[1]["value"].dtype.str, "<i2")
+
+
+
+class TestRemoteRing(TestRemote):
+
+    def setUp(self):
+        TestRemote.setUp(self)
+        self.ring = RingWriter(self.mktemp(), capacity=1024)
+        self.addCleanup(self.ring.close)
+        self.server = DeviceServerFactory(self.manager, self.ring)
+
+
+    def _connect(self, client=None):
+        return TestRemote._connect(self, client, self.ring.path)
+
+
+    def test_shared_subscription(self):
+        clients = [ self._connect()[0] for _ in range(2) ]
+        subscribers = [ self._subscribe(client, "epics:A") for client in clients ]
+        # The first data is sent as initial data.
+        self.manager.publish("epics:A", { "value":0 })
+        self.clock.advance(0)
+        self._flush()
+        self.assertEqual(self.ring.sequence(), 0)
+        self.manager.distributor("epics:A").dataReceived({ "value":1 })
+        self.manager.distributor("epics:A").dataReceived({ "value":2 })
+        # The updates are written once and the front-ends are notified once.
+        self.assertEqual(self.ring.sequence(), 2)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(0)
+        self._flush()
+        for factory, _ in subscribers:
+            self.assertEqual(factory.received, [ { "value":v } for v in range(3) ])
+
+
+    def test_initial_data(self):
+        client, _ = self._connect()
+        factory, _ = self._subscribe(client, "epics:A")
+        self.manager.distributor("epics:A").dataReceived({ "value":1 })
+        self.manager.distributor("epics:A").dataReceived({ "value":2 })
+        self.clock.advance(0)
+        # The initial data is sent after the updates have been written to the ring.
+        self.manager.distributor("epics:A")._data = { "value":2 }
+        factory2, _ = self._subscribe(self._connect()[0], "epics:A")
+        self._flush()
+        self.assertEqual(factory.received, [ { "value":1 }, { "value":2 } ])
+        self.assertEqual(factory2.received, [ { "value":2 } ])
+
+
+    def test_overrun(self):
+        client, _ = self._connect()
+        factory, _ = self._subscribe(client, "epics:A")
+        for n in range(50):
+            self.manager.distributor("epics:A").dataReceived({ "value":n })
+        self.clock.advance(0)
+        self._flush()
+        self.assertEqual(client.overruns, 1)
+        self.assertEqual(factory.received, [ { "value":0 }, { "value":49 } ])
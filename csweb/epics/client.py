@@ -3,9 +3,11 @@
 Implementation of Twisted ClientEndpoint interface for an EPICS Process Variable (PV).
 '''
 
-import socket, math
+import socket, math, time, threading
 
-from epics import pv, ca
+from collections import deque
+
+from epics import pv, ca, dbr
 
 from ..util import log
 
@@ -15,6 +17,211 @@ _TRACE = log.TRACE
 _DEBUG = log.DEBUG
 _WARN = log.WARN
 
+# Event mask of property (ie control metadata) changes.
+_DBE_PROPERTY = getattr(dbr, 'DBE_PROPERTY', 8)
+
+# Control metadata merged into the data of the value monitor.
+_CTRL_KEYS = ('units', 'precision', 'enum_strs', 'upper_disp_limit', 'lower_disp_limit', 'upper_alarm_limit',
+              'lower_alarm_limit', 'upper_warning_limit', 'lower_warning_limit', 'upper_ctrl_limit', 'lower_ctrl_limit')
+
+
+class _CallbackQueue:
+    '''
+    Queue of Channel Access callbacks to be called in the reactor thread.
+
+    The callbacks are put in the queue by the Channel Access threads and the
+    reactor is woken up once for each batch, after the latency (in seconds),
+    then at most the maximum batch size of callbacks are called per reactor
+    iteration until the queue is empty.
+    '''
+
+    def __init__(self, maxBatchSize=1000, latency=0.0):
+        self.maxBatchSize = maxBatchSize
+        self.latency = latency
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._events = 0
+        self._batches = 0
+        self._wakeups = 0
+        self._maxDepth = 0
+        self._drainTime = 0.0
+        self._maxDrainTime = 0.0
+
+
+    def put(self, callback, kwargs):
+        '''
+        Put the callback in the queue, called from any thread.
+        '''
+        self._queue.append((callback, kwargs))
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        reactor.callFromThread(self._wakeup)
+
+
+    def counters(self):
+        '''
+        Return the current and maximum queue depth, the number of callbacks,
+        batches and wakeups, and the last and maximum drain time (in seconds).
+        '''
+        return { "depth":len(self._queue), "maxDepth":self._maxDepth, "events":self._events, "batches":self._batches,
+                 "wakeups":self._wakeups, "drainTime":self._drainTime, "maxDrainTime":self._maxDrainTime }
+
+
+    def _wakeup(self):
+        self._wakeups += 1
+        if self.latency > 0:
+            reactor.callLater(self.latency, self._drain)
+        else:
+            self._drain()
+
+
+    def _drain(self):
+        start = time.time()
+        depth = len(self._queue)
+        count = 0
+        while count < self.maxBatchSize:
+            try:
+                callback, kwargs = self._queue.popleft()
+            except IndexError:
+                break
+            count += 1
+            try:
+                callback(**kwargs)
+            except Exception:
+                log.err("_CallbackQueue: _drain: Error calling callback")
+        self._drainTime = time.time() - start
+        self._maxDrainTime = max(self._maxDrainTime, self._drainTime)
+        self._maxDepth = max(self._maxDepth, depth)
+        self._events += count
+        self._batches += 1
+        log.msg("_CallbackQueue: _drain: %(n)d callbacks in %(t)gs", n=count, t=self._drainTime, logLevel=_TRACE)
+        with self._lock:
+            if len(self._queue) == 0:
+                self._scheduled = False
+                return
+        # Let the reactor handle other events before the next batch.
+        reactor.callLater(0, self._drain)
+
+
+_callbacks = _CallbackQueue()
+
+
+def configureCallbacks(maxBatchSize=None, latency=None):
+    '''
+    Configure the maximum number of Channel Access callbacks called per
+    reactor iteration and the latency (in seconds) to wait for more callbacks.
+    '''
+    if maxBatchSize is not None:
+        _callbacks.maxBatchSize = maxBatchSize
+    if latency is not None:
+        _callbacks.latency = latency
+
+
+def callbackCounters():
+    '''
+    Return the counters of the Channel Access callback queue (see _CallbackQueue.counters).
+    '''
+    return _callbacks.counters()
+
+
+def _percentile(values, percent):
+    '''
+    Return the percentile (nearest rank) of the sorted values, or None if empty.
+    '''
+    if len(values) == 0:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class _ConnectScheduler:
+    '''
+    Schedule the creation of Channel Access channels in batches.
+
+    The connectors requested in the same reactor iteration (or within the
+    delay, in seconds) are created together, at most the maximum batch size
+    per reactor iteration, and the search requests of each batch are sent
+    with a single flush. The latency from the request to the connection
+    of the channel is kept for the most recent connections.
+    '''
+
+    def __init__(self, maxBatchSize=500, delay=0.0, samples=1000):
+        self.maxBatchSize = maxBatchSize
+        self.delay = delay
+        self._pending = deque()
+        self._call = None
+        self._latencies = deque(maxlen=samples)
+        self._created = 0
+        self._batches = 0
+
+
+    def schedule(self, connector):
+        self._pending.append(connector)
+        if self._call is None:
+            self._call = reactor.callLater(self.delay, self._create)
+
+
+    def connected(self, latency):
+        self._latencies.append(latency)
+
+
+    def counters(self):
+        '''
+        Return the number of pending and created channels, the number of batches and
+        the percentiles (50, 90, 99 and 100) of the latency (in seconds) to connect.
+        '''
+        latencies = sorted(self._latencies)
+        return { "pending":len(self._pending), "created":self._created, "batches":self._batches,
+                 "connectP50":_percentile(latencies, 50), "connectP90":_percentile(latencies, 90),
+                 "connectP99":_percentile(latencies, 99), "connectMax":_percentile(latencies, 100) }
+
+
+    def _create(self):
+        self._call = None
+        count = 0
+        while count < self.maxBatchSize and len(self._pending) > 0:
+            connector = self._pending.popleft()
+            try:
+                if connector.connect():
+                    count += 1
+            except Exception:
+                log.err("_ConnectScheduler: _create: Error creating channel")
+        if count > 0:
+            try:
+                ca.flush_io()
+            except Exception as e:
+                log.msg("_ConnectScheduler: _create: Error flushing: %(e)s", e=e, logLevel=_WARN)
+            self._created += count
+            self._batches += 1
+        log.msg("_ConnectScheduler: _create: Created %(n)d channels, %(p)d pending", n=count, p=len(self._pending), logLevel=_DEBUG)
+        if len(self._pending) > 0:
+            # Let the reactor handle other events before the next batch.
+            self._call = reactor.callLater(0, self._create)
+
+
+_connections = _ConnectScheduler()
+
+
+def configureConnections(maxBatchSize=None, delay=None):
+    '''
+    Configure the maximum number of channels created per reactor iteration
+    and the delay (in seconds) to wait for more channels to create.
+    '''
+    if maxBatchSize is not None:
+        _connections.maxBatchSize = maxBatchSize
+    if delay is not None:
+        _connections.delay = delay
+
+
+def connectionCounters():
+    '''
+    Return the counters of the channel creation scheduler (see _ConnectScheduler.counters).
+    '''
+    return _connections.counters()
+
 
 class ProcessVariableClientEndpoint:
     '''
@@ -31,7 +238,7 @@ class ProcessVariableClientEndpoint:
         deferred = defer.Deferred(canceller.cancel)
         canceller.connector = _ProcessVariableConnector(self.pvname, canceller, deferred, protocolFactory)
         log.msg("ProcessVariableClientEndpoint: connect: Process Variable Connector %(c)s", c=canceller.connector, logLevel=_DEBUG)
-        reactor.callLater(0, canceller.connector.connect)
+        _connections.schedule(canceller.connector)
         return deferred
         
 
@@ -65,23 +272,34 @@ class _ProcessVariableConnector:
         self._protocolFactory = protocolFactory
         self._protocol = None
         self._connected = False
-        self._units = None
+        self._ctrl = {}
+        self._ctrlSubscription = None
         self._data = None
         self._pv = None
+        self._requested = time.time()
 
 
     def connect(self):
+        '''
+        Create the channel, return True if created (or False if cancelled).
+        '''
         if self._canceller.cancelled:
             log.msg("_ProcessVariableConnector: connect: Connection cancelled.", logLevel=_TRACE)
-            return
+            return False
         
         log.msg("_ProcessVariableConnector: connect: PV: %(p)s", p=self._pvname, logLevel=_DEBUG)
-        self._pv = pv.PV(self._pvname, form='ctrl', callback=self._pvValueCallback, connection_callback=self._pvConnCallback)
+        # The value monitor only carries the time (and alarm) metadata,
+        # the control metadata is monitored separately (see _subscribeCtrl).
+        # Large arrays are not monitored by default, so always monitor.
+        self._pv = pv.PV(self._pvname, form='time', auto_monitor=True, callback=self._pvValueCallback, connection_callback=self._pvConnCallback)
+        return True
 
 
     def disconnect(self):
         log.msg("_ProcessVariableConnector: disconnect: PV: %(p)s", p=self._pvname, logLevel=_DEBUG)
-        
+
+        self._clearCtrl()
+
         if self._pv is not None:
             self._pv.disconnect()
             self._pv = None
@@ -93,6 +311,7 @@ class _ProcessVariableConnector:
 
     def stopConnecting(self):
         if self._pv is not None and self._protocol is None:
+            self._clearCtrl()
             self._pv.disconnect()
             self._pv = None
 
@@ -105,7 +324,7 @@ class _ProcessVariableConnector:
         '''
         Ensure thread safety by executing callback in reactor thread.
         '''
-        reactor.callFromThread(self._connCallback, **kwargs)
+        _callbacks.put(self._connCallback, kwargs)
     
     
     def _connCallback(self, **kwargs):
@@ -139,7 +358,9 @@ class _ProcessVariableConnector:
         elif conn == True:
             log.msg("_ProcessVariableConnector: _connCallback: Process Variable (Re)connected", logLevel=_DEBUG)
             self._connected = True
+            self._subscribeCtrl(pv)
             if self._protocol is None:
+                _connections.connected(time.time() - self._requested)
                 #
                 self._protocol = self._protocolFactory.buildProtocol(self._pvname)
                 log.msg("_ProcessVariableConnector: _connCallback: Build protocol: %(p)s", p=self._protocol, logLevel=_DEBUG)
@@ -163,11 +384,63 @@ class _ProcessVariableConnector:
             self._protocol.connectionLost("Process Variable lost connection.")
     
 
+    def _subscribeCtrl(self, pv):
+        '''
+        Subscribe to the control metadata of the channel for property changes.
+
+        Channel Access sends the current metadata when the subscription is made
+        (and when the channel reconnects), then only when the properties change.
+        '''
+        if self._ctrlSubscription is not None:
+            return
+        try:
+            self._ctrlSubscription = ca.create_subscription(pv.chid, use_ctrl=True, mask=_DBE_PROPERTY, callback=self._pvCtrlCallback)
+        except Exception as e:
+            log.msg("_ProcessVariableConnector: _subscribeCtrl: Error creating subscription: %(e)s", e=e, logLevel=_WARN)
+
+
+    def _clearCtrl(self):
+        if self._ctrlSubscription is not None:
+            # The subscription is (callback, user argument, event id).
+            try:
+                ca.clear_subscription(self._ctrlSubscription[2])
+            except Exception as e:
+                log.msg("_ProcessVariableConnector: _clearCtrl: Error clearing subscription: %(e)s", e=e, logLevel=_WARN)
+            self._ctrlSubscription = None
+
+
+    def _pvCtrlCallback(self, **kwargs):
+        '''
+        Ensure thread safety by executing callback in reactor thread.
+        '''
+        _callbacks.put(self._ctrlCallback, kwargs)
+
+
+    def _ctrlCallback(self, **kwargs):
+        '''
+        Actually handle Channel Access property change callback.
+        '''
+        ctrl = {}
+        for key in _CTRL_KEYS:
+            if key in kwargs:
+                ctrl[key] = kwargs[key]
+        if 'enum_strs' not in ctrl and 'strs' in kwargs and 'no_str' in kwargs:
+            ctrl['enum_strs'] = tuple([ str(s).rstrip('\x00') for s in kwargs['strs'][:kwargs['no_str']] ])
+        log.msg("_ProcessVariableConnector: _ctrlCallback: Control metadata %(c)s", c=ctrl, logLevel=_TRACE)
+        if ctrl == self._ctrl:
+            return
+        self._ctrl = ctrl
+        # Send the data again with the new metadata.
+        if self._data is not None and self._protocol is not None:
+            self._data.update(self._ctrl)
+            self._protocol.dataReceived(self._data)
+
+
     def _pvValueCallback(self, **kwargs):
         '''
         Ensure thread safety by executing callback in reactor thread.
         '''
-        reactor.callFromThread(self._valueCallback, **kwargs)
+        _callbacks.put(self._valueCallback, kwargs)
         
         
     def _valueCallback(self, **kwargs):
@@ -180,12 +453,10 @@ class _ProcessVariableConnector:
 
         self._data.update(kwargs)
 
-        # The true 'units' string only appears in the first callback, after
-        # that it is just an empty string. Must be a bug in PyEpics3 v3.2.0!
-        if ("units" in self._data) and (self._data["units"] != ""):
-            self._units = self._data["units"]
-        elif self._units is not None:
-            self._data["units"] = self._units
+        # Merge the control metadata, unless already merged.
+        for key, value in self._ctrl.iteritems():
+            if key in kwargs or key not in self._data:
+                self._data[key] = value
 
         # Transformation/Sanitization of the data
         # parameters can be done here if required.
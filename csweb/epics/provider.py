@@ -3,12 +3,13 @@
 DeviceProvider interface for EPICS PVs.
 
 Supported URL:
-    epics:ProcessVariable[?[buffer=<size>][&[rate=<interval>]|[ratelimit=<interval>][&lowedge=<value>][&highedge=<value>][&threshold=<value>][&name=<value>][&units=<value>][&precision=<value>][&scale=<value>][&offset=<value>]]]
+    epics:ProcessVariable[?[buffer=<size>][&[rate=<interval>]|[ratelimit=<interval>][&points=<size>][&lowedge=<value>][&highedge=<value>][&threshold=<value>][&name=<value>][&units=<value>][&precision=<value>][&scale=<value>][&offset=<value>]]]
 
 Supported Parameters:
     buffer=<size>
     rate=<interval>
     ratelimit=<interval>
+    points=<size>
     lowedge=<value>
     highedge=<value>
     threshold=<value>
@@ -17,9 +18,26 @@ Supported Parameters:
     precision=<value>
     scale=<value>
     offset=<value>
+
+Supported URL (simulated PVs, see SimDeviceFactory):
+    sim:Pattern[?[hz=<rate>][&n=<size>][&low=<value>][&high=<value>][&period=<seconds>][&delay=<seconds>][&uptime=<seconds>][&downtime=<seconds>][&<parameters as above>]]
+
+Supported Patterns:
+    ramp, sine, square, random, const
+
+Supported Parameters (simulated PVs):
+    hz=<rate>
+    n=<size>
+    low=<value>
+    high=<value>
+    period=<seconds>
+    delay=<seconds>
+    uptime=<seconds>
+    downtime=<seconds>
 '''
 
 from .subs.client import EpicsClientSubscription
+from .subs.client import EpicsLingerPool
 from .subs.buffer import EpicsBufferSubscription
 from .subs.rate import EpicsRateSubscription
 from .subs.rate import EpicsRateLimitSubscription
@@ -30,11 +48,19 @@ from .subs.set import EpicsSetSubscription
 from .subs.set import EpicsSetPrecisionSubscription
 from .subs.scale import EpicsScaleSubscription
 from .subs.scale import EpicsOffsetSubscription
+from .subs.points import EpicsPointsSubscription
+from .subs.sim import EpicsSimSubscription
+
+from .sim import SIM_PATTERNS
 
 from ..util.url import URL
-from ..util import log
+from ..util import log, dist
+
+from ..device.provider import DeviceProvider, DeviceFactory, NotSupportedError, LimitError
+
+import copy
 
-from ..device.provider import DeviceProvider, DeviceFactory, NotSupportedError
+from twisted.internet import defer, error, protocol, reactor
 
 
 _TRACE = log.TRACE
@@ -53,6 +79,17 @@ _EPICS_PARAM_UNITS = 'units'
 _EPICS_PARAM_PRECISION = 'precision'
 _EPICS_PARAM_SCALE = 'scale'
 _EPICS_PARAM_OFFSET = 'offset'
+_EPICS_PARAM_POINTS = 'points'
+
+_SIM_DEFAULT_SCHEME = 'sim'
+_SIM_PARAM_RATE = 'hz'
+_SIM_PARAM_SIZE = 'n'
+_SIM_PARAM_LOW = 'low'
+_SIM_PARAM_HIGH = 'high'
+_SIM_PARAM_PERIOD = 'period'
+_SIM_PARAM_DELAY = 'delay'
+_SIM_PARAM_UPTIME = 'uptime'
+_SIM_PARAM_DOWNTIME = 'downtime'
 
 
 class EpicsDeviceProvider(DeviceProvider):
@@ -60,10 +97,58 @@ class EpicsDeviceProvider(DeviceProvider):
     Implementation of DeviceProvider interface for accessing EPICS Channel Access.
     '''
 
-    def __init__(self, subscriptions, url):
+    # Parameters of the subscription at the root of the chain (ie the source of the data).
+    _sourceParams = ()
+
+    def __init__(self, subscriptions, url, reads=None, maxDerived=None, linger=None):
         self._subscriptions = subscriptions
         self._url = url
-        
+        self._reads = reads
+        self._maxDerived = maxDerived
+        self._linger = linger
+
+
+    def _buildSourceSubscription(self, url):
+        '''
+        Build the subscription at the root of the chain, the Channel Access client.
+        '''
+        pvname = URL.decode(url.path)
+        return EpicsClientSubscription(pvname, str(url), self._subscriptions, self._linger)
+
+
+    def get(self):
+        '''
+        Get the most recent data of the specified EPICS PV.
+
+        The data is taken from an existing subscription if possible, otherwise
+        the data is read with a short-lived subscription, shared with all other
+        reads of the same URL and cached for the time to live of the reads.
+        '''
+        url = str(self._url)
+        if url in self._subscriptions:
+            data = self._subscriptions[url].lastData()
+            if data is not None:
+                log.msg("EpicsDeviceProvider: get: Data found for subscription '%(u)s'", u=url, logLevel=_DEBUG)
+                return defer.succeed(copy.copy(data))
+
+        if self._reads is None:
+            self._reads = _EpicsReadCache()
+        return self._reads.read(url, self.subscribe)
+
+
+    def sequence(self):
+        '''
+        Return the sequence number of the data that would be returned by GET, or None.
+        '''
+        url = str(self._url)
+        if url in self._subscriptions:
+            sequence = self._subscriptions[url].lastSequence()
+            if sequence is not None:
+                return sequence
+        if self._reads is None:
+            return None
+        return self._reads.sequence(url)
+
 
     def subscribe(self, protocolFactory):
         '''
@@ -74,13 +159,23 @@ class EpicsDeviceProvider(DeviceProvider):
         query = dict(url.query)
         url.query.clear()
 
+        for key in self._sourceParams:
+            if key in query:
+                url.query[key] = query[key]
+
+        source = str(url)
+
+        if self._maxDerived is not None and str(self._url) not in self._subscriptions:
+            if self._subscriptions.derived(source) >= self._maxDerived:
+                log.msg("EpicsDeviceProvider: subscribe: Derived subscription limit reached for '%(u)s'", u=url, logLevel=_WARN)
+                return defer.fail(LimitError("Derived subscription limit (%d) reached for '%s'" % (self._maxDerived, url)))
+
         if str(url) in self._subscriptions:
             subscription = self._subscriptions[str(url)]
-            log.msg("EpicsDeviceProvider: subscribe: EpicsClientSubscription found for '%(u)s'", u=url, logLevel=_DEBUG)
+            log.msg("EpicsDeviceProvider: subscribe: Source subscription found for '%(u)s'", u=url, logLevel=_DEBUG)
         else:
-            pvname = URL.decode(url.path)
-            subscription = EpicsClientSubscription(pvname, str(url), self._subscriptions)
-            log.msg("EpicsDeviceProvider: subscribe: EpicsClientSubscription not found for '%(u)s'", u=url, logLevel=_DEBUG)
+            subscription = self._buildSourceSubscription(url)
+            log.msg("EpicsDeviceProvider: subscribe: Source subscription not found for '%(u)s'", u=url, logLevel=_DEBUG)
 
         if _EPICS_PARAM_RATE in query:
             url.query[_EPICS_PARAM_RATE] = query[_EPICS_PARAM_RATE]
@@ -92,6 +187,16 @@ class EpicsDeviceProvider(DeviceProvider):
                 subscription = EpicsRateSubscription(subscription, interval, str(url), self._subscriptions)
                 log.msg("EpicsDeviceProvider: subscribe: EpicsRateSubscription not found for '%(u)s'", u=url, logLevel=_DEBUG)
 
+        if _EPICS_PARAM_POINTS in query:
+            url.query[_EPICS_PARAM_POINTS] = query[_EPICS_PARAM_POINTS]
+            if str(url) in self._subscriptions:
+                subscription = self._subscriptions[str(url)]
+                log.msg("EpicsDeviceProvider: subscribe: EpicsPointsSubscription found for '%(u)s'", u=url, logLevel=_DEBUG)
+            else:
+                points = query[_EPICS_PARAM_POINTS]
+                subscription = EpicsPointsSubscription(subscription, points, str(url), self._subscriptions)
+                log.msg("EpicsDeviceProvider: subscribe: EpicsPointsSubscription not found for '%(u)s'", u=url, logLevel=_DEBUG)
+
         if _EPICS_PARAM_SCALE in query:
             url.query[_EPICS_PARAM_SCALE] = query[_EPICS_PARAM_SCALE]
             if str(url) in self._subscriptions:
@@ -192,18 +297,33 @@ class EpicsDeviceProvider(DeviceProvider):
                 subscription = EpicsBufferSubscription(subscription, size, str(url), self._subscriptions)
                 log.msg("EpicsDeviceProvider: subscribe: EpicsBufferSubscription not found for '%(u)s'", u=url, logLevel=_DEBUG)
 
+        self._subscriptions.addDerived(source, str(url))
         return subscription.addProtocolFactory(protocolFactory)
 
 
 class EpicsDeviceFactory(DeviceFactory):
     '''
     Implementation of DeviceFactory interface for accessing EPICS Channel Access.
+
+    The number of distinct subscriptions derived from each PV (ie with different
+    parameters like 'epics:PV?rate=1.0') can be limited by 'maxDerived', only the
+    URLs subscribed by clients are counted (not the intermediate subscriptions).
+
+    The channel of a PV is kept connected for 'lingerTime' seconds after the
+    last subscription is removed, at most 'maxLinger' idle channels are kept.
     '''
 
-    def __init__(self, scheme=_EPICS_DEFAULT_SCHEME, cacheable=True):
+    # Parameters of the source (see EpicsDeviceProvider).
+    _sourceParams = ()
+
+    def __init__(self, scheme=_EPICS_DEFAULT_SCHEME, cacheable=True, readTTL=1.0, readTimeout=5.0, maxDerived=None,
+                 lingerTime=10.0, maxLinger=1000):
         self._scheme = scheme
         self._cacheable = cacheable
-        self._subscriptions = {}
+        self._maxDerived = maxDerived
+        self._subscriptions = _EpicsSubscriptions()
+        self._reads = _EpicsReadCache(readTTL, readTimeout)
+        self._linger = EpicsLingerPool(lingerTime, maxLinger)
         URL.register_scheme(scheme)
 
 
@@ -211,6 +331,13 @@ class EpicsDeviceFactory(DeviceFactory):
         return self._cacheable
 
 
+    def lingerCounters(self):
+        '''
+        Return the counters of the pool of idle channels (see EpicsLingerPool.counters).
+        '''
+        return self._linger.counters()
+
+
     def buildProvider(self, url):
         url = URL(str(url))
         if url.scheme != self._scheme:
@@ -227,7 +354,7 @@ class EpicsDeviceFactory(DeviceFactory):
         url.merge_params()
         url.params.set_sort_keys()
         url.params.set_lower_keys()
-        url.params.retain((_EPICS_PARAM_SCALE,_EPICS_PARAM_OFFSET,_EPICS_PARAM_LOWEDGE,_EPICS_PARAM_HIGHEDGE,_EPICS_PARAM_THRESHOLD,_EPICS_PARAM_RATE_LIMIT,_EPICS_PARAM_RATE,_EPICS_PARAM_NAME,_EPICS_PARAM_UNITS,_EPICS_PARAM_PRECISION,_EPICS_PARAM_BUFFER))
+        url.params.retain((_EPICS_PARAM_SCALE,_EPICS_PARAM_OFFSET,_EPICS_PARAM_LOWEDGE,_EPICS_PARAM_HIGHEDGE,_EPICS_PARAM_THRESHOLD,_EPICS_PARAM_RATE_LIMIT,_EPICS_PARAM_RATE,_EPICS_PARAM_NAME,_EPICS_PARAM_UNITS,_EPICS_PARAM_PRECISION,_EPICS_PARAM_BUFFER,_EPICS_PARAM_POINTS) + self._sourceParams)
 
         if _EPICS_PARAM_RATE in url.query and _EPICS_PARAM_RATE_LIMIT in url.query:
             raise ValueError("Parameters '%s' and '%s' are mutually exclusive" % (_EPICS_PARAM_RATE,_EPICS_PARAM_RATE_LIMIT))
@@ -240,6 +367,14 @@ class EpicsDeviceFactory(DeviceFactory):
             if url.query[_EPICS_PARAM_RATE] <= 0.0:
                 raise ValueError("Parameter (%s) value <= 0.0 (%d)" % (_EPICS_PARAM_RATE,url.query[_EPICS_PARAM_RATE]))
 
+        if _EPICS_PARAM_POINTS in url.query:
+            try:
+                url.query[_EPICS_PARAM_POINTS] = int(url.query[_EPICS_PARAM_POINTS])
+            except ValueError:
+                raise ValueError("Parameter (%s) non-integer value (%s)" % (_EPICS_PARAM_POINTS,url.query[_EPICS_PARAM_POINTS]))
+            if url.query[_EPICS_PARAM_POINTS] < 2:
+                raise ValueError("Parameter (%s) value < 2 (%d)" % (_EPICS_PARAM_POINTS,url.query[_EPICS_PARAM_POINTS]))
+
         if _EPICS_PARAM_SCALE in url.query:
             try:
                 url.query[_EPICS_PARAM_SCALE] = float(url.query[_EPICS_PARAM_SCALE])
@@ -308,4 +443,294 @@ class EpicsDeviceFactory(DeviceFactory):
             if url.query[_EPICS_PARAM_BUFFER] > 100000:
                 raise ValueError("Parameter (%s) value > 100000 (%d)" % (_EPICS_PARAM_BUFFER,url.query[_EPICS_PARAM_BUFFER]))
 
-        return EpicsDeviceProvider(self._subscriptions, url)
+        self._validateSource(url)
+
+        return self._buildProvider(url)
+
+
+    def _validateSource(self, url):
+        '''
+        Validate the path and the parameters of the source (ie for simulated PVs).
+        '''
+        pass
+
+
+    def _buildProvider(self, url):
+        return EpicsDeviceProvider(self._subscriptions, url, self._reads, self._maxDerived, self._linger)
+
+
+class SimDeviceProvider(EpicsDeviceProvider):
+    '''
+    Implementation of DeviceProvider interface for simulated PVs, which are the
+    source of the same chain of subscriptions as the PVs of Channel Access.
+    '''
+
+    _sourceParams = (_SIM_PARAM_RATE,_SIM_PARAM_SIZE,_SIM_PARAM_LOW,_SIM_PARAM_HIGH,_SIM_PARAM_PERIOD,_SIM_PARAM_DELAY,_SIM_PARAM_UPTIME,_SIM_PARAM_DOWNTIME)
+
+    def _buildSourceSubscription(self, url):
+        '''
+        Build the subscription at the root of the chain, a simulated PV.
+        '''
+        config = {}
+        for key, name in ((_SIM_PARAM_RATE,'rate'),(_SIM_PARAM_SIZE,'size'),(_SIM_PARAM_LOW,'low'),(_SIM_PARAM_HIGH,'high'),(_SIM_PARAM_PERIOD,'period'),
+                          (_SIM_PARAM_DELAY,'delay'),(_SIM_PARAM_UPTIME,'uptime'),(_SIM_PARAM_DOWNTIME,'downtime')):
+            if key in url.query:
+                config[name] = url.query[key]
+        return EpicsSimSubscription(url.path, config, str(url), self._subscriptions)
+
+
+class SimDeviceFactory(EpicsDeviceFactory):
+    '''
+    Implementation of DeviceFactory interface for simulated PVs (ie 'sim:ramp?hz=50&n=1000'),
+    which generate updates in process to load test the server without an IOC.
+
+    The update rate and the size of arrays are limited by 'maxRate' and 'maxSize'.
+    '''
+
+    _sourceParams = SimDeviceProvider._sourceParams
+
+    def __init__(self, scheme=_SIM_DEFAULT_SCHEME, cacheable=True, readTTL=1.0, readTimeout=5.0, maxDerived=None,
+                 maxRate=1000.0, maxSize=1000000):
+        # Simulated PVs are not kept after the last subscription is removed.
+        EpicsDeviceFactory.__init__(self, scheme, cacheable, readTTL, readTimeout, maxDerived, lingerTime=0.0)
+        self._maxRate = maxRate
+        self._maxSize = maxSize
+
+
+    def _validateSource(self, url):
+        if url.path not in SIM_PATTERNS:
+            raise NotSupportedError("Pattern (%s) not supported, pattern must be one of: %s" % (url.path, ", ".join(SIM_PATTERNS)))
+
+        if _SIM_PARAM_RATE in url.query:
+            try:
+                url.query[_SIM_PARAM_RATE] = float(url.query[_SIM_PARAM_RATE])
+            except:
+                raise ValueError("Parameter (%s) non-numeric value (%s)" % (_SIM_PARAM_RATE,url.query[_SIM_PARAM_RATE]))
+            if url.query[_SIM_PARAM_RATE] <= 0.0:
+                raise ValueError("Parameter (%s) value <= 0.0 (%s)" % (_SIM_PARAM_RATE,url.query[_SIM_PARAM_RATE]))
+            if url.query[_SIM_PARAM_RATE] > self._maxRate:
+                raise ValueError("Parameter (%s) value > %s (%s)" % (_SIM_PARAM_RATE,self._maxRate,url.query[_SIM_PARAM_RATE]))
+
+        if _SIM_PARAM_SIZE in url.query:
+            try:
+                url.query[_SIM_PARAM_SIZE] = int(url.query[_SIM_PARAM_SIZE])
+            except ValueError:
+                raise ValueError("Parameter (%s) non-integer value (%s)" % (_SIM_PARAM_SIZE,url.query[_SIM_PARAM_SIZE]))
+            if url.query[_SIM_PARAM_SIZE] < 1:
+                raise ValueError("Parameter (%s) value < 1 (%d)" % (_SIM_PARAM_SIZE,url.query[_SIM_PARAM_SIZE]))
+            if url.query[_SIM_PARAM_SIZE] > self._maxSize:
+                raise ValueError("Parameter (%s) value > %d (%d)" % (_SIM_PARAM_SIZE,self._maxSize,url.query[_SIM_PARAM_SIZE]))
+
+        for key in (_SIM_PARAM_LOW,_SIM_PARAM_HIGH):
+            if key in url.query:
+                try:
+                    url.query[key] = float(url.query[key])
+                except:
+                    raise ValueError("Parameter (%s) non-numeric value (%s)" % (key,url.query[key]))
+
+        if url.query.get(_SIM_PARAM_LOW, 0.0) > url.query.get(_SIM_PARAM_HIGH, 100.0):
+            raise ValueError("Parameter (%s) value > parameter (%s) value" % (_SIM_PARAM_LOW,_SIM_PARAM_HIGH))
+
+        for key in (_SIM_PARAM_PERIOD,_SIM_PARAM_UPTIME):
+            if key in url.query:
+                try:
+                    url.query[key] = float(url.query[key])
+                except:
+                    raise ValueError("Parameter (%s) non-numeric value (%s)" % (key,url.query[key]))
+                if url.query[key] <= 0.0:
+                    raise ValueError("Parameter (%s) value <= 0.0 (%s)" % (key,url.query[key]))
+
+        for key in (_SIM_PARAM_DELAY,_SIM_PARAM_DOWNTIME):
+            if key in url.query:
+                try:
+                    url.query[key] = float(url.query[key])
+                except:
+                    raise ValueError("Parameter (%s) non-numeric value (%s)" % (key,url.query[key]))
+                if url.query[key] < 0.0:
+                    raise ValueError("Parameter (%s) value < 0.0 (%s)" % (key,url.query[key]))
+
+
+    def _buildProvider(self, url):
+        return SimDeviceProvider(self._subscriptions, url, self._reads, self._maxDerived)
+
+
+class _EpicsSubscriptions(dict):
+    '''
+    Subscriptions by URL that count the derived subscriptions of each source (ie PV).
+
+    Only the subscriptions at the end of a chain (ie the URL subscribed by a client)
+    are counted, not the intermediate subscriptions of the chain or the source.
+    '''
+
+    def __init__(self):
+        dict.__init__(self)
+        self._derived = {}
+        self._sources = {}
+
+
+    def derived(self, url):
+        '''
+        Return the number of derived subscriptions of the source with the specified URL.
+        '''
+        return self._derived.get(url, 0)
+
+
+    def addDerived(self, url, key):
+        '''
+        Count the subscription (key) as derived from the source with the specified URL.
+        '''
+        if key != url and key in self and key not in self._sources:
+            self._sources[key] = url
+            self._derived[url] = self._derived.get(url, 0) + 1
+
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        url = self._sources.pop(key, None)
+        if url is not None:
+            count = self._derived.pop(url) - 1
+            if count > 0:
+                self._derived[url] = count
+
+
+class _EpicsReadCache:
+    '''
+    Cache of the data read by GET for the time to live (in seconds), concurrent
+    reads of the same URL share a single short-lived subscription.
+    '''
+
+    def __init__(self, ttl=1.0, timeout=5.0):
+        self._ttl = ttl
+        self._timeout = timeout
+        self._cache = {}
+        self._sequences = {}
+        self._reads = {}
+
+
+    def sequence(self, url):
+        return self._sequences.get(url)
+
+
+    def read(self, url, subscribe):
+        if url in self._cache:
+            log.msg("_EpicsReadCache: read: Cached data found for '%(u)s'", u=url, logLevel=_DEBUG)
+            return defer.succeed(copy.copy(self._cache[url]))
+        if url in self._reads:
+            log.msg("_EpicsReadCache: read: Read in progress for '%(u)s'", u=url, logLevel=_DEBUG)
+            return self._reads[url].addWaiter()
+        log.msg("_EpicsReadCache: read: Subscribe to read '%(u)s'", u=url, logLevel=_DEBUG)
+        read = _EpicsRead(url, self)
+        self._reads[url] = read
+        deferred = read.addWaiter()
+        read.start(subscribe, self._timeout)
+        return deferred
+
+
+    def readDone(self, url, data):
+        self._reads.pop(url, None)
+        if data is not None and self._ttl > 0:
+            self._cache[url] = data
+            self._sequences[url] = dist.nextSequence()
+            reactor.callLater(self._ttl, self._expire, url)
+
+
+    def _expire(self, url):
+        self._cache.pop(url, None)
+        self._sequences.pop(url, None)
+
+
+class _EpicsRead(protocol.Factory):
+    '''
+    Read the first data of a short-lived subscription.
+    '''
+
+    def __init__(self, url, cache):
+        self._url = url
+        self._cache = cache
+        self._waiters = []
+        self._protocol = None
+        self._deferred = None
+        self._timeoutCall = None
+        self._done = False
+        self._released = False
+
+
+    def start(self, subscribe, timeout):
+        self._timeoutCall = reactor.callLater(timeout, self._readTimeout)
+        self._deferred = subscribe(self)
+        self._deferred.addCallbacks(self._subscribeCallback, self._subscribeErrback)
+
+
+    def addWaiter(self):
+        deferred = defer.Deferred()
+        self._waiters.append(deferred)
+        return deferred
+
+
+    def buildProtocol(self, addr):
+        return _EpicsReadProtocol(self)
+
+
+    def dataReceived(self, protocol, data):
+        if self._done:
+            # Connected after the timeout, release the subscription.
+            self._release(protocol)
+            return
+        data = copy.copy(data)
+        self._finish(data)
+        for waiter in self._waiters:
+            waiter.callback(copy.copy(data))
+        self._release(protocol)
+
+
+    def _release(self, protocol):
+        if self._released:
+            return
+        self._released = True
+        # Avoid removing the protocol while the data is being distributed.
+        reactor.callLater(0, protocol.transport.loseConnection)
+
+
+    def _subscribeCallback(self, protocol):
+        self._protocol = protocol
+
+
+    def _subscribeErrback(self, failure):
+        if self._done:
+            return
+        log.msg("_EpicsRead: _subscribeErrback: Failure %(f)s", f=failure, logLevel=_DEBUG)
+        self._finish(None)
+        for waiter in self._waiters:
+            waiter.errback(failure)
+
+
+    def _readTimeout(self):
+        self._timeoutCall = None
+        log.msg("_EpicsRead: _readTimeout: Timeout reading '%(u)s'", u=self._url, logLevel=_DEBUG)
+        self._finish(None)
+        if self._protocol is None:
+            # The subscription is released when connected (see EpicsSubscriptionProtocol).
+            self._deferred.cancel()
+        elif self._protocol.transport is not None:
+            self._released = True
+            self._protocol.transport.loseConnection()
+        for waiter in self._waiters:
+            waiter.errback(error.TimeoutError("Timeout reading '%s'" % (self._url,)))
+
+
+    def _finish(self, data):
+        self._done = True
+        if self._timeoutCall is not None:
+            self._timeoutCall.cancel()
+            self._timeoutCall = None
+        self._cache.readDone(self._url, data)
+
+
+class _EpicsReadProtocol(protocol.Protocol):
+
+    def __init__(self, read):
+        self._read = read
+
+
+    def dataReceived(self, data):
+        self._read.dataReceived(self, data)
@@ -0,0 +1,247 @@
+# coding=UTF-8
+'''
+Simulated process variables, which generate updates in process (ie for load
+testing without an IOC), adapted to the Twisted Protocol interface like the
+Channel Access client (see ProcessVariableClientEndpoint).
+
+The value is generated with a pattern at a rate (in Hz), the value is an
+array (of floats) if the size is greater than one:
+    ramp    rises from 'low' to 'high' every 'period' seconds
+    sine    sine wave between 'low' and 'high' with 'period' seconds
+    square  alternates between 'high' and 'low' every half 'period' seconds
+    random  uniformly distributed between 'low' and 'high'
+    const   always 'low'
+
+The elements of an array are shifted in phase (ie the array is one period).
+
+The channel connects after 'delay' seconds and, if 'uptime' is specified,
+disconnects after 'uptime' seconds and reconnects after 'downtime' seconds.
+'''
+
+import math, random
+
+from ..util import log
+
+from twisted.internet import defer, task, reactor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+SIM_PATTERN_RAMP = 'ramp'
+SIM_PATTERN_SINE = 'sine'
+SIM_PATTERN_SQUARE = 'square'
+SIM_PATTERN_RANDOM = 'random'
+SIM_PATTERN_CONST = 'const'
+
+SIM_PATTERNS = (SIM_PATTERN_RAMP, SIM_PATTERN_SINE, SIM_PATTERN_SQUARE, SIM_PATTERN_RANDOM, SIM_PATTERN_CONST)
+
+
+def _scalar(pattern, phase, generator):
+    '''
+    Return the fraction (0.0 to 1.0) of the range of the value at the phase.
+    '''
+    if pattern == SIM_PATTERN_RAMP:
+        return phase
+    if pattern == SIM_PATTERN_SINE:
+        return 0.5 + 0.5 * math.sin(2.0 * math.pi * phase)
+    if pattern == SIM_PATTERN_SQUARE:
+        return 1.0 if phase < 0.5 else 0.0
+    if pattern == SIM_PATTERN_RANDOM:
+        return generator.random()
+    return 0.0
+
+
+def _array(pattern, phase, generator):
+    '''
+    Return the fractions (0.0 to 1.0) of the range of the values at the phases (an array).
+    '''
+    if pattern == SIM_PATTERN_RAMP:
+        return phase
+    if pattern == SIM_PATTERN_SINE:
+        return 0.5 + 0.5 * numpy.sin(2.0 * math.pi * phase)
+    if pattern == SIM_PATTERN_SQUARE:
+        return numpy.where(phase < 0.5, 1.0, 0.0)
+    if pattern == SIM_PATTERN_RANDOM:
+        return generator.random_sample(len(phase))
+    return numpy.zeros(len(phase))
+
+
+class SimulatedClientEndpoint:
+    '''
+    ClientEndpoint for connecting to a simulated process variable.
+    '''
+
+    def __init__(self, pvname, pattern, rate=1.0, size=1, low=0.0, high=100.0, period=10.0,
+                 delay=0.0, uptime=None, downtime=1.0):
+        self.pvname = pvname
+        self._pattern = pattern
+        self._rate = rate
+        self._size = size
+        self._low = low
+        self._high = high
+        self._period = period
+        self._delay = delay
+        self._uptime = uptime
+        self._downtime = downtime
+
+
+    def connect(self, protocolFactory):
+        log.msg("SimulatedClientEndpoint: connect: Protocol factory %(p)s", p=protocolFactory, logLevel=_DEBUG)
+        connector = _SimulatedConnector(self, protocolFactory)
+        deferred = defer.Deferred(connector.cancel)
+        connector.connect(deferred)
+        return deferred
+
+
+class _SimulatedConnector:
+    '''
+    Generate the updates of a simulated process variable.
+    '''
+
+    def __init__(self, endpoint, protocolFactory):
+        self._endpoint = endpoint
+        self._protocolFactory = protocolFactory
+        self._protocol = None
+        self._deferred = None
+        self._connected = False
+        self._data = None
+        self._call = None
+        self._loop = task.LoopingCall(self._update)
+        self._loop.clock = reactor
+        # Seeded by the name so the random values of a PV are reproducible.
+        seed = hash(endpoint.pvname) & 0xffffffff
+        if numpy is not None and endpoint._size > 1:
+            self._generator = numpy.random.RandomState(seed)
+        else:
+            self._generator = random.Random(seed)
+
+
+    def connect(self, deferred):
+        self._deferred = deferred
+        self._call = reactor.callLater(self._endpoint._delay, self._connect)
+
+
+    def cancel(self, deferred):
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+        if not deferred.called:
+            deferred.errback(Exception("Connection to '%s' canncelled." % (self._endpoint.pvname,)))
+
+
+    def disconnect(self):
+        log.msg("_SimulatedConnector: disconnect: PV: %(p)s", p=self._endpoint.pvname, logLevel=_DEBUG)
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+        if self._loop.running:
+            self._loop.stop()
+        if self._protocol is not None:
+            self._protocol.connectionLost("Process Variable disconncted cleanly.")
+            self._protocol = None
+
+
+    def _connect(self):
+        self._call = None
+        self._protocol = self._protocolFactory.buildProtocol(self._endpoint.pvname)
+        log.msg("_SimulatedConnector: _connect: Build protocol: %(p)s", p=self._protocol, logLevel=_DEBUG)
+        self._deferred.callback(self._protocol)
+        self._protocol.makeConnection(_SimulatedTransport(self))
+        self._connCallback(True)
+
+
+    def _connCallback(self, conn):
+        self._call = None
+        if conn:
+            log.msg("_SimulatedConnector: _connCallback: Process Variable (Re)connected", logLevel=_DEBUG)
+            self._connected = True
+            self._protocol.connectionMade()
+            self._loop.start(1.0 / self._endpoint._rate, now=True)
+            if self._endpoint._uptime is not None:
+                self._call = reactor.callLater(self._endpoint._uptime, self._connCallback, False)
+        else:
+            log.msg("_SimulatedConnector: _connCallback: Process Variable NOT connected", logLevel=_DEBUG)
+            self._connected = False
+            self._loop.stop()
+            # Indicate the process variable is not connected by resending the data with property 'connected' as False.
+            if self._data is not None:
+                self._data['connected'] = False
+                self._protocol.dataReceived(self._data)
+            self._protocol.connectionLost("Process Variable lost connection.")
+            self._call = reactor.callLater(self._endpoint._downtime, self._connCallback, True)
+
+
+    def _value(self, now):
+        endpoint = self._endpoint
+        phase = now / endpoint._period
+        if endpoint._size == 1:
+            fraction = _scalar(endpoint._pattern, phase % 1.0, self._generator)
+            return endpoint._low + (endpoint._high - endpoint._low) * fraction
+        if numpy is not None:
+            phases = (phase + numpy.arange(endpoint._size, dtype=float) / endpoint._size) % 1.0
+            return endpoint._low + (endpoint._high - endpoint._low) * _array(endpoint._pattern, phases, self._generator)
+        return [ endpoint._low + (endpoint._high - endpoint._low) * _scalar(endpoint._pattern, (phase + float(i) / endpoint._size) % 1.0, self._generator)
+                 for i in xrange(endpoint._size) ]
+
+
+    def _update(self):
+        endpoint = self._endpoint
+        now = reactor.seconds()
+        value = self._value(now)
+
+        if self._data is None:
+            # Similar to the data of a Channel Access monitor (with the control metadata).
+            self._data = { "pvname":endpoint.pvname, "name":endpoint.pvname, "host":"sim", "status":0, "severity":0,
+                           "count":endpoint._size, "nelm":endpoint._size, "type":"time_double", "typefull":"time_double",
+                           "ftype":20, "access":"read-only", "read_access":True, "write_access":False, "units":"",
+                           "precision":3, "upper_disp_limit":endpoint._high, "lower_disp_limit":endpoint._low }
+
+        # The data is updated in place, like the data of the Channel Access client.
+        self._data["value"] = value
+        if endpoint._size == 1:
+            self._data["char_value"] = "%.3f" % (value,)
+        else:
+            self._data["char_value"] = "<array size=%d, type=time_double>" % (endpoint._size,)
+        self._data["timestamp"] = now
+        self._data["posixseconds"] = int(now)
+        self._data["nanoseconds"] = int((now % 1.0) * 1e9)
+        self._data["connected"] = self._connected
+
+        log.msg("_SimulatedConnector: _update: Call dataReceived %(p)s", p=self._protocol, logLevel=_TRACE)
+        self._protocol.dataReceived(self._data)
+
+
+class _SimulatedTransport:
+    '''
+    Implementation of Twisted Transport interface for a simulated process variable.
+    '''
+
+    def __init__(self, connector):
+        self._connector = connector
+
+
+    def write(self, data):
+        log.msg("_SimulatedTransport: write: Method not supported.", logLevel=_WARN)
+
+
+    def writeSequence(self, data):
+        log.msg("_SimulatedTransport: writeSequence: Method not supported.", logLevel=_WARN)
+
+
+    def loseConnection(self):
+        log.msg("_SimulatedTransport: loseConnection: Connector: %(c)s", c=self._connector, logLevel=_DEBUG)
+        self._connector.disconnect()
+
+
+    def getPeer(self):
+        return "sim"
+
+
+    def getHost(self):
+        return "sim"
@@ -12,6 +12,8 @@ from ..client import ProcessVariableClientEndpoint
 
 from ...util import log, dist
 
+from collections import OrderedDict
+
 from twisted.internet import defer, protocol, reactor
 
 _TRACE = log.TRACE
@@ -21,13 +23,94 @@ _WARN = log.WARN
 
 class EpicsClientSubscription(EpicsSubscription):
 
-    def __init__(self, pvname, subkey, subscriptions):
+    def __init__(self, pvname, subkey, subscriptions, linger=None):
         EpicsSubscription.__init__(self, subkey, subscriptions)
+        self._linger = linger
         self._protocolFactory = _EpicsClientSubscriptionProtocolFactory(self)
         self._pvclient = ProcessVariableClientEndpoint(pvname)
         self._pvclient.connect(self._protocolFactory)
 
 
+    def release(self, transport):
+        '''
+        Keep the channel connected in the linger pool (if any), instead of releasing it immediately.
+        '''
+        if self._linger is None:
+            EpicsSubscription.release(self, transport)
+        else:
+            self._linger.add(self, transport)
+
+
+    def addProtocolFactory(self, protocolFactory):
+        if self._linger is not None:
+            self._linger.remove(self)
+        return EpicsSubscription.addProtocolFactory(self, protocolFactory)
+
+
+class EpicsLingerPool:
+    '''
+    Pool of idle client subscriptions (ie without protocols), which keep their
+    channels connected (with the latest data) for the linger time (in seconds),
+    so new subscriptions to the same PV are attached without reconnecting.
+
+    At most 'maxIdle' subscriptions are kept, if exceeded then the least
+    recently used subscription is released.
+    '''
+
+    def __init__(self, lingerTime=10.0, maxIdle=1000):
+        self._lingerTime = lingerTime
+        self._maxIdle = maxIdle
+        self._idle = OrderedDict()
+        self.reattached = 0
+        self.expired = 0
+        self.evicted = 0
+
+
+    def add(self, subscription, transport):
+        self._cancel(subscription)
+        if self._lingerTime <= 0.0 or self._maxIdle <= 0:
+            EpicsSubscription.release(subscription, transport)
+            return
+        log.msg("EpicsLingerPool: add: Subscription '%(s)s' is idle for %(t)ss", s=subscription, t=self._lingerTime, logLevel=_DEBUG)
+        call = reactor.callLater(self._lingerTime, self._expire, subscription)
+        self._idle[subscription] = (transport, call)
+        while len(self._idle) > self._maxIdle:
+            evicted, (transport, call) = self._idle.popitem(last=False)
+            call.cancel()
+            self.evicted += 1
+            log.msg("EpicsLingerPool: add: Pool is full, release subscription '%(s)s'", s=evicted, logLevel=_DEBUG)
+            EpicsSubscription.release(evicted, transport)
+
+
+    def remove(self, subscription):
+        if self._cancel(subscription):
+            self.reattached += 1
+            log.msg("EpicsLingerPool: remove: Subscription '%(s)s' is reattached", s=subscription, logLevel=_DEBUG)
+
+
+    def counters(self):
+        '''
+        Return the number of idle subscriptions and the number of
+        subscriptions reattached, expired and evicted (ie pool is full).
+        '''
+        return { "idle":len(self._idle), "reattached":self.reattached, "expired":self.expired, "evicted":self.evicted }
+
+
+    def _cancel(self, subscription):
+        entry = self._idle.pop(subscription, None)
+        if entry is None:
+            return False
+        entry[1].cancel()
+        return True
+
+
+    def _expire(self, subscription):
+        transport, _ = self._idle.pop(subscription)
+        self.expired += 1
+        log.msg("EpicsLingerPool: _expire: Release subscription '%(s)s'", s=subscription, logLevel=_DEBUG)
+        EpicsSubscription.release(subscription, transport)
+
+
 class _EpicsClientSubscriptionProtocolFactory(EpicsSubscriptionProtocolFactory):
      
     def __init__(self, subscription):
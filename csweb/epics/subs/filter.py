@@ -55,6 +55,7 @@ class _EpicsHighEdgeSubscriptionProtocol(EpicsSubscriptionProtocol):
             log.msg("_EpicsHighEdgeSubscriptionProtocol: dataReceived: New value >= %(v)f", v=self._value, logLevel=_TRACE)
             if self._data == False:
                 log.msg("_EpicsHighEdgeSubscriptionProtocol: dataReceived: High edge transition reached.", logLevel=_TRACE)
+                data = dict(data) # Important to copy the dictionary before modification.
                 data["char_value"] = ">" + str(self._value)
                 EpicsSubscriptionProtocol.dataReceived(self, data)
         else:
@@ -101,6 +102,7 @@ class _EpicsLowEdgeSubscriptionProtocol(EpicsSubscriptionProtocol):
             log.msg("_EpicsLowEdgeSubscriptionProtocol: dataReceived: New value <= %(v)f", v=self._value, logLevel=_TRACE)
             if self._data == False:
                 log.msg("_EpicsLowEdgeSubscriptionProtocol: dataReceived: Low edge transition reached.", logLevel=_TRACE)
+                data = dict(data) # Important to copy the dictionary before modification.
                 data["char_value"] = "<" + str(self._value)
                 EpicsSubscriptionProtocol.dataReceived(self, data)
         else:
@@ -151,8 +153,10 @@ class _EpicsThresholdSubscriptionProtocol(EpicsSubscriptionProtocol):
         if self._data != result:
                 log.msg("_EpicsThresholdSubscriptionProtocol: dataReceived: Threshold reached.", logLevel=_TRACE)
                 if result == True:
+                    data = dict(data) # Important to copy the dictionary before modification.
                     data["char_value"] = "<" + str(self._value)
                 else:
+                    data = dict(data) # Important to copy the dictionary before modification.
                     data["char_value"] = ">" + str(self._value)
                 EpicsSubscriptionProtocol.dataReceived(self, data)
         self._data = result
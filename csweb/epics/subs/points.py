@@ -0,0 +1,54 @@
+'''
+EPICS Points (ie decimation of arrays) Subscription
+'''
+
+from .sub import EpicsSubscription
+from .sub import EpicsSubscriptionProtocol
+from .sub import EpicsSubscriptionProtocolFactory
+
+from ...util import log, arrays
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+
+
+class EpicsPointsSubscription(EpicsSubscription):
+
+    def __init__(self, sub, points, subkey, subscriptions):
+        EpicsSubscription.__init__(self, subkey, subscriptions)
+        self._protocolFactory = _EpicsPointsSubscriptionProtocolFactory(points, self)
+        sub.addProtocolFactory(self._protocolFactory)
+
+
+class _EpicsPointsSubscriptionProtocolFactory(EpicsSubscriptionProtocolFactory):
+
+    def __init__(self, points, subscription):
+        EpicsSubscriptionProtocolFactory.__init__(self, subscription)
+        self._points = points
+
+
+    def buildProtocol(self, addr):
+        self._protocol = _EpicsPointsSubscriptionProtocol(addr, self._points, self._subscription)
+        log.msg("_EpicsPointsSubscriptionProtocolFactory: buildProtocol: Built protocol %(p)s", p=self._protocol, logLevel=_TRACE)
+        return EpicsSubscriptionProtocolFactory.buildProtocol(self, addr)
+
+
+class _EpicsPointsSubscriptionProtocol(EpicsSubscriptionProtocol):
+
+    def __init__(self, address, points, subscription):
+        EpicsSubscriptionProtocol.__init__(self, address, subscription)
+        self._points = points
+
+
+    def dataReceived(self, data):
+        value = data.get("value")
+        if isinstance(value, (list, tuple)) or arrays.isArray(value) and value.ndim == 1:
+            if len(value) > self._points:
+                log.msg("_EpicsPointsSubscriptionProtocol: dataReceived: Decimate %(n)d to %(p)d points", n=len(value), p=self._points, logLevel=_TRACE)
+                data = dict(data) # Important to copy the dictionary before modification.
+                data["value"] = arrays.decimate(value, self._points)
+        else:
+            log.msg("_EpicsPointsSubscriptionProtocol: dataReceived: Value is not an array", logLevel=_TRACE)
+        EpicsSubscriptionProtocol.dataReceived(self, data)
@@ -54,7 +54,7 @@ class _EpicsRateSubscriptionProtocol(EpicsSubscriptionProtocol):
         if self._data is not None:
             if 'timestamp' in self._data:
                 # update the timestamp of the event #
-                self._data['timestamp'] = time.time()
+                self._data = dict(self._data, timestamp=time.time())
             EpicsSubscriptionProtocol.dataReceived(self, self._data)
 
 
@@ -109,7 +109,7 @@ class _EpicsRateLimitSubscriptionProtocol(EpicsSubscriptionProtocol):
         if self._dataReceived:
             if 'timestamp' in self._data:
                 # update the timestamp of the event #
-                self._data['timestamp'] = time.time()
+                self._data = dict(self._data, timestamp=time.time())
             EpicsSubscriptionProtocol.dataReceived(self, self._data)
             self._dataReceived = False
         else:
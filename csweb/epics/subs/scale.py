@@ -45,7 +45,7 @@ class _EpicsScaleSubscriptionProtocol(EpicsSubscriptionProtocol):
     
 
     def dataReceived(self, data):
-        value = self.float_value_from_data(data)
+        value = self.numeric_value_from_data(data)
         if value is not None:
             log.msg("_EpicsScaleSubscriptionProtocol: dataReceived: Scale: %(s)s", s=self._value, logLevel=_TRACE)
             data = dict(data) # Important to copy the dictionary before modification.
@@ -87,7 +87,7 @@ class _EpicsOffsetSubscriptionProtocol(EpicsSubscriptionProtocol):
     
 
     def dataReceived(self, data):
-        value = self.float_value_from_data(data)
+        value = self.numeric_value_from_data(data)
         if value is not None:
             log.msg("_EpicsOffsetSubscriptionProtocol: dataReceived: Offset: %(o)s", o=self._value, logLevel=_TRACE)
             data = dict(data) # Important to copy the dictionary before modification.
@@ -0,0 +1,53 @@
+# coding=UTF-8
+'''
+Epics Simulated Subscription
+'''
+
+
+from .sub import EpicsSubscription
+from .sub import EpicsSubscriptionProtocol
+from .sub import EpicsSubscriptionProtocolFactory
+
+from ..sim import SimulatedClientEndpoint
+
+from ...util import log
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+
+class EpicsSimSubscription(EpicsSubscription):
+    '''
+    Subscription to a simulated process variable (see SimulatedClientEndpoint),
+    at the root of a chain of subscriptions like the client subscription.
+    '''
+
+    def __init__(self, pattern, config, subkey, subscriptions):
+        EpicsSubscription.__init__(self, subkey, subscriptions)
+        self._protocolFactory = _EpicsSimSubscriptionProtocolFactory(self)
+        self._simclient = SimulatedClientEndpoint(subkey, pattern, **config)
+        self._simclient.connect(self._protocolFactory)
+
+
+class _EpicsSimSubscriptionProtocolFactory(EpicsSubscriptionProtocolFactory):
+
+    def __init__(self, subscription):
+        EpicsSubscriptionProtocolFactory.__init__(self, subscription)
+
+
+    def buildProtocol(self, addr):
+        self._protocol = _EpicsSimSubscriptionProtocol(addr, self._subscription)
+        log.msg("_EpicsSimSubscriptionProtocolFactory: buildProtocol: Built protocol %(p)s", p=self._protocol, logLevel=_DEBUG)
+        return EpicsSubscriptionProtocolFactory.buildProtocol(self, addr)
+
+
+class _EpicsSimSubscriptionProtocol(EpicsSubscriptionProtocol):
+
+    def __init__(self, address, subscription):
+        EpicsSubscriptionProtocol.__init__(self, address, subscription)
+
+
+    def dataReceived(self, data):
+        self._data = data
+        EpicsSubscriptionProtocol.dataReceived(self, data)
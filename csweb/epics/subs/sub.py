@@ -4,7 +4,7 @@ EPICS Subscription Abstract Classes
 '''
 
 
-from ...util import log
+from ...util import log, arrays
 
 from ...util.dist import DistributingProtocol
 from ...util.dist import DistributingProtocolFactory
@@ -36,6 +36,34 @@ class EpicsSubscription:
         del self._subscriptions[self._subkey]
 
 
+    def release(self, transport):
+        '''
+        Release the subscription and its connection when the last protocol is removed.
+        '''
+        transport.loseConnection()
+        self.unsubscribe()
+
+
+    def lastData(self):
+        '''
+        Return the data most recently distributed by this subscription, or None.
+        '''
+        protocol = self._protocolFactory._protocol
+        if protocol is None:
+            return None
+        return protocol.lastData()
+
+
+    def lastSequence(self):
+        '''
+        Return the sequence number of the data most recently distributed by this subscription, or None.
+        '''
+        protocol = self._protocolFactory._protocol
+        if protocol is None:
+            return None
+        return protocol.lastSequence()
+
+
     def _connCallback(self, protocol):
         log.msg("EpicsSubscription: _connCallback: Protocol %(p)s", p=protocol, logLevel=_DEBUG)
     
@@ -95,12 +123,26 @@ class EpicsSubscriptionProtocol(DistributingProtocol):
         DistributingProtocol.__init__(self, address, [])
         self._subscription = subscription
         self._data = None
+        self._releaseOnConnect = False
+        self._releaseCall = None
     
 
     def addProtocolFactory(self, deferred, canceller, protocolFactory):
         if canceller.cancelled:
+            if len(self._protocols) == 0:
+                if self.transport is not None:
+                    log.msg('EpicsSubscriptionProtocol: addProtocolFactory: Cancelled and no protocols, so loseConnection', logLevel=_DEBUG)
+                    self._subscription.release(self.transport)
+                else:
+                    log.msg('EpicsSubscriptionProtocol: addProtocolFactory: Cancelled before connected, so loseConnection when connected', logLevel=_DEBUG)
+                    self._releaseOnConnect = True
             return None
 
+        self._releaseOnConnect = False
+        if self._releaseCall is not None:
+            self._releaseCall.cancel()
+            self._releaseCall = None
+
         protocol = protocolFactory.buildProtocol(self._address)
         log.msg('EpicsSubscriptionProtocol: addProtocolFactory: Append %(p)s (length: %(l)d+1)', p=protocol, l=len(self._protocols), logLevel=_DEBUG)
         self._protocols.append(protocol)
@@ -129,8 +171,7 @@ class EpicsSubscriptionProtocol(DistributingProtocol):
 
             if len(self._protocols) == 0:
                 log.msg('EpicsSubscriptionProtocol: removeProtocol: No protocols remaining, so loseConnection', logLevel=_DEBUG)
-                self.transport.loseConnection()
-                self._subscription.unsubscribe()
+                self._subscription.release(self.transport)
             
         else:
             log.msg('EpicsSubscriptionProtocol: removeProtocol: Protocol not found %(p)s', p=protocol, logLevel=_WARN)
@@ -146,6 +187,17 @@ class EpicsSubscriptionProtocol(DistributingProtocol):
         for protocol in self._protocols:
             log.msg('EpicsSubscriptionProtocol: makeConnection: Distribute to %(p)s', p=protocol, logLevel=_TRACE)
             protocol.makeConnection(EpicsSubscriptionTransport(transport, protocol, self))
+        if self._releaseOnConnect:
+            # Every protocol was cancelled before connected, release once the connection is made.
+            self._releaseOnConnect = False
+            self._releaseCall = reactor.callLater(0, self._releaseUnused)
+
+
+    def _releaseUnused(self):
+        self._releaseCall = None
+        if self.transport is not None and len(self._protocols) == 0:
+            log.msg('EpicsSubscriptionProtocol: _releaseUnused: No protocols, so loseConnection', logLevel=_DEBUG)
+            self._subscription.release(self.transport)
 
 
     def float_value_from_data(self, data):
@@ -155,12 +207,25 @@ class EpicsSubscriptionProtocol(DistributingProtocol):
         
         try:
             return float(data['value'])
-        except ValueError as error:
+        except (ValueError, TypeError) as error:
             log.msg('_EpicsFilterSubscriptionProtocol: _value_from_data_recieved: Value error: %(e)s', e=error, logLevel=_WARN)
             return None
 
 
+    def numeric_value_from_data(self, data):
+        '''
+        Return the value as a float, or a copy of the value as an array of floats.
+        '''
+        if arrays.isArray(data.get('value')):
+            return data['value'].astype(float)
+        return self.float_value_from_data(data)
+
+
     def refresh_char_value_from_data(self, data, value=None):
+        if arrays.isArray(value):
+            # The character value of an array only describes the array.
+            return
+
         if value is None:
             value = self.float_value_from_data(data)
             if value is None:
@@ -175,7 +240,7 @@ class EpicsSubscriptionProtocol(DistributingProtocol):
 class EpicsSubscriptionTransport(DistributingTransport):
     
     def __init__(self, transport, protocol, epicsProtocol):
-        DistributingTransport.__init__(self, transport)
+        DistributingTransport.__init__(self, transport, epicsProtocol)
         self._epicsProtocol = epicsProtocol
         self._protocol = protocol
 
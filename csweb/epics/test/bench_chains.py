@@ -0,0 +1,95 @@
+# coding=UTF-8
+'''
+Benchmark the allocations per update of typical chains of subscriptions.
+
+Every update of a PV (with about 25 fields) is distributed through a chain
+of subscriptions to one protocol outside of the chain, each subscription
+that changes a field copies the data (ie dict(data)).
+
+Reports the objects and bytes allocated for the data of each update, and
+the time per update.
+
+Usage: python -m csweb.epics.test.bench_chains
+'''
+
+import sys, time
+
+from twisted.internet import defer, protocol
+
+from ..subs.sub import EpicsSubscriptionCanceller
+from ..subs.scale import _EpicsScaleSubscriptionProtocol, _EpicsOffsetSubscriptionProtocol
+from ..subs.set import _EpicsSetSubscriptionProtocol, _EpicsSetPrecisionSubscriptionProtocol
+
+from ...util import log
+
+
+_DATA = { "pvname":"PV", "name":"PV", "value":1.0, "char_value":"1.000", "status":0, "severity":0,
+          "timestamp":0.0, "posixseconds":0, "nanoseconds":0, "host":"ioc:5064", "count":1, "nelm":1,
+          "type":"time_double", "typefull":"time_double", "ftype":20, "access":"read-only",
+          "read_access":True, "write_access":False, "units":"mA", "precision":3, "upper_disp_limit":10.0,
+          "lower_disp_limit":0.0, "upper_alarm_limit":9.0, "lower_alarm_limit":1.0, "connected":True }
+
+
+class _Sink(protocol.Protocol):
+
+    def dataReceived(self, data):
+        self.data = data
+
+
+_CHAINS = [
+    ("scale", lambda: [ _EpicsScaleSubscriptionProtocol(None, 2.0, None) ]),
+    ("scale,offset,precision", lambda: [ _EpicsScaleSubscriptionProtocol(None, 2.0, None), _EpicsOffsetSubscriptionProtocol(None, 1.0, None),
+                                         _EpicsSetPrecisionSubscriptionProtocol(None, 1, None) ]),
+    ("scale,offset,name,units,precision", lambda: [ _EpicsScaleSubscriptionProtocol(None, 2.0, None), _EpicsOffsetSubscriptionProtocol(None, 1.0, None),
+                                                    _EpicsSetSubscriptionProtocol(None, "name", "Current", None),
+                                                    _EpicsSetSubscriptionProtocol(None, "units", "A", None),
+                                                    _EpicsSetPrecisionSubscriptionProtocol(None, 1, None) ]),
+]
+
+
+def _connect(stages):
+    sink = _Sink()
+    for stage, following in zip(stages, stages[1:] + [ sink ]):
+        factory = protocol.Factory()
+        factory.buildProtocol = lambda addr, following=following: following
+        stage.addProtocolFactory(defer.Deferred(), EpicsSubscriptionCanceller(None), factory)
+    return stages, sink
+
+
+def _allocated(stages, source):
+    # The data distributed by each stage is allocated for the update.
+    objects = 0
+    size = 0
+    for stage in stages:
+        data = stage.lastData()
+        if data is source:
+            continue
+        objects += 1
+        size += sys.getsizeof(data)
+    return objects, size
+
+
+def _bench(stages, updates):
+    stages, sink = _connect(stages)
+    data = dict(_DATA)
+    stages[0].dataReceived(data)
+    objects, size = _allocated(stages, data)
+    start = time.time()
+    for n in xrange(updates):
+        # The data is updated in place, like the EPICS client does.
+        data["value"] = float(n)
+        stages[0].dataReceived(data)
+    elapsed = time.time() - start
+    return objects, size, elapsed / updates * 1e6
+
+
+def main(updates=100000):
+    log.setLevel(log.WARN)
+    print "%-36s%8s%12s%12s%10s" % ("chain", "stages", "objects/up", "bytes/up", "us/up")
+    for name, chain in _CHAINS:
+        objects, size, elapsed = _bench(chain(), updates)
+        print "%-36s%8d%12d%12d%10.2f" % (name, len(chain()), objects, size, elapsed)
+
+
+if __name__ == '__main__':
+    main()
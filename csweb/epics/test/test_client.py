@@ -0,0 +1,186 @@
+# coding=UTF-8
+'''
+Tests for EPICS 'client'.
+'''
+
+try:
+    from .. import client
+except ImportError:
+    client = None
+
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+
+class _Reactor(task.Clock):
+    '''
+    Clock that counts the wakeups from other threads.
+    '''
+    def __init__(self):
+        task.Clock.__init__(self)
+        self.wakeups = 0
+
+    def callFromThread(self, f, *args, **kwargs):
+        self.wakeups += 1
+        self.callLater(0, f, *args, **kwargs)
+
+
+
+class TestCallbackQueue(unittest.TestCase):
+
+    if client is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.reactor = _Reactor()
+        self.patch(client, "reactor", self.reactor)
+        self.called = []
+
+
+    def _callback(self, **kwargs):
+        self.called.append(kwargs["value"])
+
+
+    def test_batches(self):
+        queue = client._CallbackQueue(maxBatchSize=3)
+        for value in range(7):
+            queue.put(self._callback, { "value":value })
+        self.assertEqual(self.reactor.wakeups, 1)
+        self.reactor.advance(0)
+        # The remaining callbacks are called in later reactor iterations.
+        self.assertEqual(self.called, range(7))
+        counters = queue.counters()
+        self.assertEqual((counters["depth"], counters["maxDepth"], counters["events"], counters["batches"]), (0, 7, 7, 3))
+        # A new wakeup once the queue has been drained.
+        queue.put(self._callback, { "value":7 })
+        self.assertEqual(self.reactor.wakeups, 2)
+
+
+    def test_latency(self):
+        queue = client._CallbackQueue(latency=0.05)
+        queue.put(self._callback, { "value":0 })
+        self.reactor.advance(0)
+        queue.put(self._callback, { "value":1 })
+        self.assertEqual(self.called, [])
+        self.reactor.advance(0.05)
+        self.assertEqual(self.called, [ 0, 1 ])
+        self.assertEqual(self.reactor.wakeups, 1)
+
+
+
+class _FakeCA:
+
+    def __init__(self):
+        self.flushes = 0
+
+    def flush_io(self):
+        self.flushes += 1
+
+
+
+class _FakeConnector:
+
+    def __init__(self, created, cancelled=False):
+        self._created = created
+        self._cancelled = cancelled
+
+    def connect(self):
+        if self._cancelled:
+            return False
+        self._created.append(self)
+        return True
+
+
+
+class TestConnectScheduler(unittest.TestCase):
+
+    if client is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(client, "reactor", self.clock)
+        self.ca = _FakeCA()
+        self.patch(client, "ca", self.ca)
+        self.created = []
+
+
+    def test_batches(self):
+        scheduler = client._ConnectScheduler(maxBatchSize=2)
+        for _ in range(5):
+            scheduler.schedule(_FakeConnector(self.created))
+        scheduler.schedule(_FakeConnector(self.created, cancelled=True))
+        self.assertEqual(self.created, [])
+        self.clock.advance(0)
+        self.assertEqual(len(self.created), 5)
+        # The channels of each batch are flushed once.
+        self.assertEqual(self.ca.flushes, 3)
+        counters = scheduler.counters()
+        self.assertEqual((counters["pending"], counters["created"], counters["batches"]), (0, 5, 3))
+
+
+    def test_delay(self):
+        scheduler = client._ConnectScheduler(delay=0.1)
+        scheduler.schedule(_FakeConnector(self.created))
+        self.clock.advance(0.05)
+        scheduler.schedule(_FakeConnector(self.created))
+        self.clock.advance(0.05)
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(self.ca.flushes, 1)
+
+
+    def test_latency(self):
+        scheduler = client._ConnectScheduler()
+        self.assertIdentical(scheduler.counters()["connectP50"], None)
+        for latency in range(1, 101):
+            scheduler.connected(latency / 100.0)
+        counters = scheduler.counters()
+        self.assertEqual((counters["connectP50"], counters["connectP90"], counters["connectP99"], counters["connectMax"]), (0.5, 0.9, 0.99, 1.0))
+
+
+
+class _Protocol:
+
+    def __init__(self):
+        self.received = []
+
+    def dataReceived(self, data):
+        self.received.append(dict(data))
+
+
+
+class TestConnector(unittest.TestCase):
+
+    if client is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.connector = client._ProcessVariableConnector("PV", None, None, None)
+        self.protocol = _Protocol()
+        self.connector._protocol = self.protocol
+
+
+    def test_ctrl(self):
+        self.connector._ctrlCallback(value=0, units="mm", precision=3, upper_disp_limit=10.0, status=0)
+        self.assertEqual(self.protocol.received, [])
+        self.connector._valueCallback(value=1.5, units="", timestamp=100.0)
+        self.assertEqual(self.protocol.received[-1]["units"], "mm")
+        self.assertEqual(self.protocol.received[-1]["precision"], 3)
+        self.assertEqual(self.protocol.received[-1]["upper_disp_limit"], 10.0)
+        # The data is sent again when the properties change.
+        self.connector._ctrlCallback(value=0, units="cm", precision=3, upper_disp_limit=10.0)
+        self.assertEqual(self.protocol.received[-1]["units"], "cm")
+        self.assertEqual(self.protocol.received[-1]["value"], 1.5)
+        self.assertEqual(len(self.protocol.received), 2)
+        self.connector._ctrlCallback(value=0, units="cm", precision=3, upper_disp_limit=10.0)
+        self.assertEqual(len(self.protocol.received), 2)
+
+
+    def test_enum_strs(self):
+        self.connector._ctrlCallback(value=0, no_str=2, strs=[ "Off\x00\x00", "On\x00", "" ])
+        self.connector._valueCallback(value=1)
+        self.assertEqual(self.protocol.received[-1]["enum_strs"], ("Off", "On"))
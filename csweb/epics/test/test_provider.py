@@ -0,0 +1,376 @@
+# coding=UTF-8
+'''
+Tests for EPICS 'provider'.
+'''
+
+try:
+    from .. import provider
+    from ..subs import client
+except ImportError:
+    provider = None
+
+from ...util import arrays
+from ...util.dist import DistributingProtocol
+from .. import sim
+from ..subs import sub
+from ..subs import rate as rate_module
+from ..subs.sub import EpicsSubscription, EpicsSubscriptionCanceller, EpicsSubscriptionProtocol, EpicsSubscriptionProtocolFactory
+from ..subs.points import _EpicsPointsSubscriptionProtocol
+from ..subs.filter import _EpicsHighEdgeSubscriptionProtocol
+from ..subs.rate import _EpicsRateSubscriptionProtocol
+
+from twisted.internet import defer, error, protocol, task
+from twisted.trial import unittest
+from twisted.test.proto_helpers import StringTransport
+
+
+
+class _FakeSubscribe:
+    '''
+    Subscribe the protocol of a read to a distributor that the test controls.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.distributor = None
+        self.transport = None
+
+    def __call__(self, protocolFactory):
+        self.count += 1
+        protocol = protocolFactory.buildProtocol(None)
+        self.distributor = DistributingProtocol(None, [ protocol ])
+        self.transport = StringTransport()
+        self.distributor.makeConnection(self.transport)
+        return defer.succeed(protocol)
+
+
+
+class TestGet(unittest.TestCase):
+
+    if provider is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(provider, "reactor", self.clock)
+        self.reads = provider._EpicsReadCache(ttl=1.0, timeout=5.0)
+        self.subscribe = _FakeSubscribe()
+
+
+    def _results(self, deferreds):
+        results = []
+        for deferred in deferreds:
+            deferred.addBoth(results.append)
+        return results
+
+
+    def test_shared_read(self):
+        results = self._results([ self.reads.read("epics:PV", self.subscribe) for _ in range(3) ])
+        self.assertEqual(self.subscribe.count, 1)
+        self.assertEqual(results, [])
+        self.subscribe.distributor.dataReceived({ "value":1 })
+        self.assertEqual(results, [ { "value":1 } ] * 3)
+        # The short-lived subscription is released.
+        self.clock.advance(0)
+        self.assertTrue(self.subscribe.transport.disconnecting)
+
+
+    def test_ttl(self):
+        self.reads.read("epics:PV", self.subscribe)
+        self.subscribe.distributor.dataReceived({ "value":1 })
+        self.clock.advance(0.5)
+        results = self._results([ self.reads.read("epics:PV", self.subscribe) ])
+        self.assertEqual(results, [ { "value":1 } ])
+        self.assertEqual(self.subscribe.count, 1)
+        self.clock.advance(0.5)
+        self.reads.read("epics:PV", self.subscribe)
+        self.assertEqual(self.subscribe.count, 2)
+
+
+    def test_timeout(self):
+        results = self._results([ self.reads.read("epics:PV", self.subscribe) ])
+        self.clock.advance(5.0)
+        self.assertEqual(len(results), 1)
+        results[0].trap(error.TimeoutError)
+        self.assertTrue(self.subscribe.transport.disconnecting)
+        self.reads.read("epics:PV", self.subscribe)
+        self.assertEqual(self.subscribe.count, 2)
+
+
+    def test_connected_after_timeout(self):
+        protocols = []
+        def subscribe(protocolFactory):
+            # The protocol is added, but not connected before the timeout.
+            protocols.append(protocolFactory.buildProtocol(None))
+            return defer.succeed(protocols[0])
+        results = self._results([ self.reads.read("epics:PV", subscribe) ])
+        self.clock.advance(5.0)
+        results[0].trap(error.TimeoutError)
+        distributor = DistributingProtocol(None, protocols)
+        transport = StringTransport()
+        distributor.makeConnection(transport)
+        distributor.dataReceived({ "value":1 })
+        distributor.dataReceived({ "value":2 })
+        self.clock.advance(0)
+        self.assertTrue(transport.disconnecting)
+
+
+    def test_timeout_before_connect(self):
+        self.patch(client, "ProcessVariableClientEndpoint", _FakeEndpoint)
+        self.patch(sub, "reactor", self.clock)
+        factory = provider.EpicsDeviceFactory(readTimeout=5.0, lingerTime=0.0)
+        subscriptions = factory._subscriptions
+        results = self._results([ factory.buildProvider("epics:PV?scale=2").get() ])
+        self.clock.advance(5.0)
+        results[0].trap(error.TimeoutError)
+        # The PV connects after the read was cancelled, so the chain is released.
+        root = subscriptions["epics:PV"]
+        rootProtocol = root._protocolFactory.buildProtocol(None)
+        transport = StringTransport()
+        rootProtocol.makeConnection(transport)
+        rootProtocol.connectionMade()
+        rootProtocol.dataReceived({ "value":1 })
+        self.clock.advance(0)
+        self.assertEqual(dict(subscriptions), {})
+        self.assertTrue(transport.disconnecting)
+
+
+    def test_existing_subscription(self):
+        subscriptions = {}
+        subscription = EpicsSubscription("epics:PV", subscriptions)
+        subscription._protocolFactory = EpicsSubscriptionProtocolFactory(subscription)
+        subscription._protocolFactory._protocol = EpicsSubscriptionProtocol(None, subscription)
+        subscription._protocolFactory._protocol.dataReceived({ "value":2 })
+        deviceProvider = provider.EpicsDeviceProvider(subscriptions, "epics:PV", self.reads)
+        results = self._results([ deviceProvider.get() ])
+        self.assertEqual(results, [ { "value":2 } ])
+
+
+    def test_sequence(self):
+        subscriptions = {}
+        deviceProvider = provider.EpicsDeviceProvider(subscriptions, "epics:PV", self.reads)
+        self.assertIdentical(deviceProvider.sequence(), None)
+        deviceProvider.subscribe = self.subscribe
+        deviceProvider.get()
+        self.subscribe.distributor.dataReceived({ "value":1 })
+        sequence = deviceProvider.sequence()
+        self.assertNotIdentical(sequence, None)
+        self.clock.advance(1.0)
+        self.assertIdentical(deviceProvider.sequence(), None)
+
+
+
+class TestLimit(unittest.TestCase):
+
+    if provider is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.patch(client, "ProcessVariableClientEndpoint", _FakeEndpoint)
+
+
+    def test_derived(self):
+        factory = provider.EpicsDeviceFactory(maxDerived=2)
+        subscriptions = factory._subscriptions
+        factory.buildProvider("epics:PV").subscribe(protocol.Factory())
+        self.assertEqual(subscriptions.derived("epics:PV"), 0)
+        # Only the end of the chain is counted, not the intermediate subscriptions.
+        factory.buildProvider("epics:PV?rate=1.0&scale=2").subscribe(protocol.Factory())
+        self.assertEqual(subscriptions.derived("epics:PV"), 1)
+        factory.buildProvider("epics:PV?rate=1.0").subscribe(protocol.Factory())
+        self.assertEqual(subscriptions.derived("epics:PV"), 2)
+        deferred = factory.buildProvider("epics:PV?offset=1").subscribe(protocol.Factory())
+        self.failureResultOf(deferred).trap(provider.LimitError)
+        # Existing subscriptions are not limited.
+        factory.buildProvider("epics:PV?rate=1.0&scale=2").subscribe(protocol.Factory())
+        self.assertEqual(subscriptions.derived("epics:OTHER"), 0)
+        subscriptions["epics:PV?rate=1.0&scale=2.0"].unsubscribe()
+        self.assertEqual(subscriptions.derived("epics:PV"), 1)
+        subscriptions["epics:PV?rate=1.0"].unsubscribe()
+        self.assertEqual(subscriptions.derived("epics:PV"), 0)
+
+
+    def test_source(self):
+        factory = provider.SimDeviceFactory(maxDerived=1)
+        subscriptions = factory._subscriptions
+        # The simulated PVs are not connected.
+        self.patch(sim, "reactor", task.Clock())
+        factory.buildProvider("sim:ramp?hz=50").subscribe(protocol.Factory())
+        factory.buildProvider("sim:ramp?hz=10").subscribe(protocol.Factory())
+        self.assertEqual(subscriptions.derived("sim:ramp"), 0)
+        self.assertEqual(subscriptions.derived("sim:ramp?hz=50.0"), 0)
+        factory.buildProvider("sim:ramp?hz=50&scale=2").subscribe(protocol.Factory())
+        self.assertEqual(subscriptions.derived("sim:ramp?hz=50.0"), 1)
+
+
+
+class _Received(protocol.Protocol):
+
+    def __init__(self):
+        self.received = []
+
+    def dataReceived(self, data):
+        self.received.append(data)
+
+
+
+class TestPoints(unittest.TestCase):
+
+    def setUp(self):
+        self.points = _EpicsPointsSubscriptionProtocol(None, 4, None)
+        self.received = _Received()
+        factory = protocol.Factory()
+        factory.buildProtocol = lambda addr: self.received
+        self.points.addProtocolFactory(defer.Deferred(), EpicsSubscriptionCanceller(None), factory)
+
+
+    def test_list(self):
+        data = { "value":range(10), "count":10 }
+        self.points.dataReceived(data)
+        self.assertEqual(self.received.received, [ { "value":[ 0, 3, 6, 9 ], "count":10 } ])
+        # The data distributed to other subscriptions is not modified.
+        self.assertEqual(data["value"], range(10))
+
+
+    def test_array(self):
+        if not arrays.available():
+            raise unittest.SkipTest("NumPy library not available")
+        self.points.dataReceived({ "value":arrays.numpy.arange(100.0) })
+        self.assertEqual(self.received.received[0]["value"].tolist(), [ 0.0, 49.0, 50.0, 99.0 ])
+
+
+    def test_scalar(self):
+        data = { "value":1.0 }
+        self.points.dataReceived(data)
+        self.assertIdentical(self.received.received[0], data)
+
+
+    def test_parameter(self):
+        if provider is None:
+            raise unittest.SkipTest("PyEpics library not available")
+        factory = provider.EpicsDeviceFactory()
+        self.assertEqual(str(factory.buildProvider("epics:PV?points=100")._url), "epics:PV?points=100")
+        self.assertRaises(ValueError, factory.buildProvider, "epics:PV?points=1")
+        self.assertRaises(ValueError, factory.buildProvider, "epics:PV?points=all")
+
+
+
+class TestCopy(unittest.TestCase):
+
+    def _received(self, stage):
+        received = _Received()
+        factory = protocol.Factory()
+        factory.buildProtocol = lambda addr: received
+        stage.addProtocolFactory(defer.Deferred(), EpicsSubscriptionCanceller(None), factory)
+        return received
+
+
+    def test_edge(self):
+        edge = _EpicsHighEdgeSubscriptionProtocol(None, 1.0, None)
+        received = self._received(edge)
+        data = { "value":1.5, "char_value":"1.5" }
+        edge.dataReceived(data)
+        self.assertEqual(received.received, [ { "value":1.5, "char_value":">1.0" } ])
+        # The data distributed to other subscriptions is not modified.
+        self.assertEqual(data, { "value":1.5, "char_value":"1.5" })
+
+
+    def test_rate(self):
+        clock = task.Clock()
+        self.patch(rate_module.time, "time", clock.seconds)
+        rate = _EpicsRateSubscriptionProtocol(None, 1.0, None)
+        rate._clock.clock = clock
+        received = self._received(rate)
+        rate.dataReceived({ "value":1.5, "timestamp":-1.0 })
+        clock.advance(1.0)
+        # The timestamp is refreshed in a copy, not in the data already distributed.
+        self.assertEqual([ data["timestamp"] for data in received.received ], [ 0.0, 1.0 ])
+
+
+
+class _FakeEndpoint:
+
+    def __init__(self, pvname):
+        self.pvname = pvname
+
+    def connect(self, protocolFactory):
+        return defer.Deferred()
+
+
+
+class TestLinger(unittest.TestCase):
+
+    if provider is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(client, "reactor", self.clock)
+        self.patch(sub, "reactor", self.clock)
+        self.pool = client.EpicsLingerPool(lingerTime=10.0, maxIdle=2)
+        self.subscriptions = {}
+
+
+    def _idle(self, url):
+        subscription = EpicsSubscription(url, self.subscriptions)
+        transport = StringTransport()
+        self.pool.add(subscription, transport)
+        return subscription, transport
+
+
+    def test_expire(self):
+        _, transport = self._idle("epics:PV")
+        self.clock.advance(9.0)
+        self.assertFalse(transport.disconnecting)
+        self.assertIn("epics:PV", self.subscriptions)
+        self.clock.advance(1.0)
+        self.assertTrue(transport.disconnecting)
+        self.assertNotIn("epics:PV", self.subscriptions)
+        self.assertEqual(self.pool.counters(), { "idle":0, "reattached":0, "expired":1, "evicted":0 })
+
+
+    def test_reattach(self):
+        subscription, transport = self._idle("epics:PV")
+        self.pool.remove(subscription)
+        self.clock.advance(10.0)
+        self.assertFalse(transport.disconnecting)
+        self.assertEqual(self.pool.counters()["reattached"], 1)
+
+
+    def test_least_recently_used(self):
+        first, firstTransport = self._idle("epics:PV1")
+        second, secondTransport = self._idle("epics:PV2")
+        # Idle again, so the most recently used.
+        self.pool.add(first, firstTransport)
+        self._idle("epics:PV3")
+        self.assertTrue(secondTransport.disconnecting)
+        self.assertFalse(firstTransport.disconnecting)
+        self.assertEqual(sorted(self.subscriptions), [ "epics:PV1", "epics:PV3" ])
+        self.assertEqual(self.pool.counters()["evicted"], 1)
+
+
+    def test_subscription(self):
+        self.patch(client, "ProcessVariableClientEndpoint", _FakeEndpoint)
+        subscription = client.EpicsClientSubscription("PV", "epics:PV", self.subscriptions, self.pool)
+        first = _Received()
+        subscription.addProtocolFactory(protocol.Factory.forProtocol(lambda: first))
+        clientProtocol = subscription._protocolFactory.buildProtocol(None)
+        transport = StringTransport()
+        clientProtocol.makeConnection(transport)
+        clientProtocol.connectionMade()
+        clientProtocol.dataReceived({ "value":1 })
+        first.transport.loseConnection()
+        self.assertFalse(transport.disconnecting)
+        self.assertEqual(self.pool.counters()["idle"], 1)
+        # A new subscription gets the latest data without reconnecting.
+        second = _Received()
+        subscription.addProtocolFactory(protocol.Factory.forProtocol(lambda: second))
+        self.clock.advance(0)
+        self.assertEqual(second.received, [ { "value":1 } ])
+        self.assertEqual(self.pool.counters()["idle"], 0)
+        second.transport.loseConnection()
+        self.clock.advance(10.0)
+        self.assertTrue(transport.disconnecting)
+        self.assertNotIn("epics:PV", self.subscriptions)
@@ -0,0 +1,167 @@
+# coding=UTF-8
+'''
+Tests for simulated PVs ('sim').
+'''
+
+try:
+    from .. import provider
+except ImportError:
+    provider = None
+
+from .. import sim
+from ..subs import sub
+
+from ...util import arrays
+
+from twisted.internet import protocol, task
+from twisted.trial import unittest
+
+
+
+class _Received(protocol.Protocol):
+
+    def __init__(self):
+        self.received = []
+        self.events = []
+
+    def makeConnection(self, transport):
+        # Like the protocols of subscriptions, connectionMade is called by the connector.
+        self.transport = transport
+
+    def connectionMade(self):
+        self.events.append("made")
+
+    def dataReceived(self, data):
+        self.received.append(dict(data))
+
+    def connectionLost(self, reason):
+        self.events.append("lost")
+
+
+
+class TestSimulated(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(sim, "reactor", self.clock)
+        self.received = _Received()
+
+
+    def _connect(self, pattern, **config):
+        endpoint = sim.SimulatedClientEndpoint("sim:" + pattern, pattern, **config)
+        deferred = endpoint.connect(protocol.Factory.forProtocol(lambda: self.received))
+        # Connect after the delay, if any.
+        self.clock.advance(0)
+        return deferred
+
+
+    def test_ramp(self):
+        self._connect("ramp", rate=10.0, low=0.0, high=10.0, period=1.0)
+        self.clock.advance(0.25)
+        self.clock.advance(0.25)
+        self.assertEqual([ data["value"] for data in self.received.received ], [ 0.0, 2.5, 5.0 ])
+        self.assertEqual(self.received.received[1]["char_value"], "2.500")
+        self.assertEqual(self.received.received[1]["timestamp"], 0.25)
+        self.assertTrue(self.received.received[0]["connected"])
+
+
+    def test_rate(self):
+        self._connect("const", rate=50.0)
+        self.clock.pump([ 0.02 ] * 50)
+        self.assertEqual(len(self.received.received), 51)
+        self.assertEqual(self.received.received[-1]["value"], 0.0)
+
+
+    def test_array(self):
+        self._connect("square", size=4, period=1.0)
+        value = self.received.received[0]["value"]
+        self.assertEqual(list(value), [ 100.0, 100.0, 0.0, 0.0 ])
+        self.assertEqual(self.received.received[0]["count"], 4)
+        if arrays.available():
+            self.assertTrue(arrays.isBinary(self.received.received[0]))
+
+
+    def test_random(self):
+        self._connect("random", size=1000, low=-1.0, high=1.0)
+        value = self.received.received[0]["value"]
+        self.assertEqual(len(value), 1000)
+        self.assertTrue(-1.0 <= min(value) and max(value) <= 1.0)
+
+
+    def test_delay(self):
+        deferred = self._connect("sine", delay=2.0, period=1.0)
+        self.assertNoResult(deferred)
+        self.clock.advance(2.0)
+        self.assertIdentical(self.successResultOf(deferred), self.received)
+        self.assertEqual(self.received.events, [ "made" ])
+        self.assertEqual(self.received.received[0]["value"], 50.0)
+
+
+    def test_uptime(self):
+        self._connect("ramp", rate=1.0, uptime=2.0, downtime=1.0)
+        self.clock.advance(1.0)
+        self.clock.advance(1.0)
+        self.assertEqual(self.received.events, [ "made", "lost" ])
+        # The data is sent again, as not connected.
+        self.assertEqual([ data["connected"] for data in self.received.received ], [ True, True, False ])
+        self.clock.advance(1.0)
+        self.assertEqual(self.received.events, [ "made", "lost", "made" ])
+        self.assertEqual(len(self.received.received), 4)
+        self.assertTrue(self.received.received[-1]["connected"])
+
+
+    def test_lose_connection(self):
+        self._connect("ramp", rate=1.0, uptime=2.0)
+        self.received.transport.loseConnection()
+        self.assertEqual(self.received.events, [ "made", "lost" ])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_cancel(self):
+        deferred = self._connect("ramp", delay=1.0)
+        deferred.cancel()
+        self.failureResultOf(deferred)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+
+class TestSimProvider(unittest.TestCase):
+
+    if provider is None:
+        skip = "PyEpics library not available"
+
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(sim, "reactor", self.clock)
+        self.patch(sub, "reactor", self.clock)
+        self.factory = provider.SimDeviceFactory()
+
+
+    def test_parameters(self):
+        self.assertEqual(str(self.factory.buildProvider("sim:ramp?n=1000&hz=50&scale=2&other=1")._url), "sim:ramp?hz=50.0&n=1000&scale=2.0")
+        self.assertRaises(provider.NotSupportedError, self.factory.buildProvider, "sim:other")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?hz=0")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?hz=1001")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?n=0")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?n=1000001")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?low=10&high=1")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?period=0")
+        self.assertRaises(ValueError, self.factory.buildProvider, "sim:ramp?downtime=-1")
+
+
+    def test_chain(self):
+        subscriptions = self.factory._subscriptions
+        first = _Received()
+        self.factory.buildProvider("sim:ramp?hz=10&period=1&high=10&scale=2").subscribe(protocol.Factory.forProtocol(lambda: first))
+        second = _Received()
+        self.factory.buildProvider("sim:ramp?hz=10&period=1&high=10").subscribe(protocol.Factory.forProtocol(lambda: second))
+        self.assertEqual(sorted(subscriptions), [ "sim:ramp?high=10.0&hz=10.0&period=1.0", "sim:ramp?high=10.0&hz=10.0&period=1.0&scale=2.0" ])
+        self.clock.advance(0)
+        self.clock.advance(0.1)
+        self.assertEqual([ data["value"] for data in first.received ], [ 0.0, 2.0 ])
+        self.assertEqual([ data["value"] for data in second.received ], [ 0.0, 1.0 ])
+        first.transport.loseConnection()
+        second.transport.loseConnection()
+        self.assertEqual(subscriptions, {})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
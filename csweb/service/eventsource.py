@@ -0,0 +1,236 @@
+# coding=UTF-8
+'''
+Server-Sent Events (text/event-stream) resource to handle device subscriptions.
+
+The devices are specified by the 'url' query parameters of the request,
+for example '/eventsource/device?url=epics:PV1&url=epics:PV2%3Fbuffer%3D100'.
+Each event contains the data of one device as an object with the URL as the
+only key, the same as the messages of the WebSocket protocol.
+'''
+
+from .. import device
+
+from ..util import log, json
+
+import time
+
+from twisted.internet import protocol, reactor, task
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+# Heartbeat is a comment that keeps proxies from closing idle connections.
+_HEARTBEAT = ":\n\n"
+
+# Sequence numbers restart with the process, so the event ids include the start time.
+_INSTANCE = "%x" % (int(time.time() * 1000),)
+
+
+class EventSourceDeviceResource(Resource):
+    '''
+    Resource to stream device updates as Server-Sent Events.
+
+    The id of an event is the sequence number of the update (unique for all
+    URLs in this process). When the client reconnects with the 'Last-Event-ID'
+    header then the initial data of a subscription is only sent if it was
+    updated after that event. The entries of a buffer subscription
+    (ie 'epics:PV?buffer=100') are all sent again if any were missed, so the
+    client may receive some entries twice.
+
+    A heartbeat comment is written to all listeners every heartbeat interval
+    (in seconds).
+    '''
+
+    isLeaf = True
+
+    def __init__(self, heartbeatInterval=15.0):
+        Resource.__init__(self)
+        self._heartbeatInterval = heartbeatInterval
+        self._listeners = set()
+        self._heartbeat = None
+
+
+    def render_GET(self, request):
+        urls = request.args.get('url', [])
+        if len(urls) == 0:
+            request.setResponseCode(400)
+            return "Parameter 'url' is required"
+
+        request.setHeader("Content-Type", "text/event-stream")
+        request.setHeader("Cache-Control", "no-cache")
+        request.write("")
+
+        listener = _EventSourceListener(request, _lastEventId(request))
+        self._addListener(listener)
+        request.notifyFinish().addBoth(self._requestFinished, listener)
+        for url in urls:
+            listener.subscribe(url)
+        return NOT_DONE_YET
+
+
+    def _addListener(self, listener):
+        self._listeners.add(listener)
+        if self._heartbeat is None and self._heartbeatInterval:
+            self._heartbeat = task.LoopingCall(self._writeHeartbeat)
+            self._heartbeat.clock = reactor
+            self._heartbeat.start(self._heartbeatInterval, now=False)
+
+
+    def _requestFinished(self, result, listener):
+        log.msg("EventSourceDeviceResource: _requestFinished: Result %(r)s", r=result, logLevel=_DEBUG)
+        listener.loseConnection()
+        self._listeners.discard(listener)
+        if len(self._listeners) == 0 and self._heartbeat is not None:
+            self._heartbeat.stop()
+            self._heartbeat = None
+
+
+    def _writeHeartbeat(self):
+        log.msg("EventSourceDeviceResource: _writeHeartbeat: Listeners %(n)d", n=len(self._listeners), logLevel=_TRACE)
+        for listener in self._listeners:
+            listener.write(_HEARTBEAT)
+
+
+def _lastEventId(request):
+    '''
+    Return the sequence number of the 'Last-Event-ID' header, or None if the
+    event was sent by another process (ie before a restart).
+    '''
+    lastEventId = request.getHeader("Last-Event-ID")
+    if lastEventId is None:
+        return None
+    instance, _, sequence = lastEventId.partition("-")
+    if instance != _INSTANCE:
+        log.msg("_lastEventId: 'Last-Event-ID' from another process: %(i)s", i=lastEventId, logLevel=_DEBUG)
+        return None
+    try:
+        return int(sequence)
+    except ValueError:
+        log.msg("_lastEventId: Invalid 'Last-Event-ID': %(i)s", i=lastEventId, logLevel=_WARN)
+        return None
+
+
+def _encodeEvent(url, data, sequence):
+    '''
+    Encode an event with the sequence number of the update (if any) as the event id.
+    '''
+    event = "data: " + json.stringify({ url:data }, sanitize=True) + "\n\n"
+    if sequence is not None:
+        return "id: %s-%d\n" % (_INSTANCE, sequence) + event
+    return event
+
+
+class _EventSourceListener:
+    '''
+    The subscriptions of a single event stream request.
+    '''
+
+    def __init__(self, request, lastEventId=None):
+        self._request = request
+        self._lastEventId = lastEventId
+        self._subscriptions = {}
+        self._finished = False
+
+
+    def subscribe(self, url):
+        if url in self._subscriptions:
+            return
+        try:
+            provider = device.manager.buildProvider(url)
+        except ValueError as error:
+            log.msg("_EventSourceListener: subscribe: Error building provider: %(e)s", e=error, logLevel=_WARN)
+            return
+        deferred = provider.subscribe(ESDeviceSubscriptionProtocolFactory(url, self))
+        self._subscriptions[url] = _EventSourceDeviceSubscription(deferred)
+
+
+    def write(self, data):
+        if not self._finished:
+            self._request.write(data)
+
+
+    def writeData(self, url, data, transport, initial):
+        '''
+        Write the event for the data, the encoding is shared by all listeners.
+        The initial data is not written if the client received it before the
+        last event id.
+        '''
+        sequence = transport.lastSequence()
+        if initial and self._lastEventId is not None and sequence is not None:
+            if sequence <= self._lastEventId:
+                log.msg("_EventSourceListener: writeData: Skip initial data %(s)d (%(l)d)", s=sequence, l=self._lastEventId, logLevel=_DEBUG)
+                return
+        self.write(transport.encodedData(data, ('eventsource', url), lambda: _encodeEvent(url, data, sequence)))
+
+
+    def loseConnection(self):
+        self._finished = True
+        for subscription in self._subscriptions.values():
+            subscription.loseConnection()
+        self._subscriptions.clear()
+
+
+class _EventSourceDeviceSubscription:
+
+    def __init__(self, deferred):
+        self._protocol = None
+        self._deferred = deferred
+        self._deferred.addCallbacks(self._subscribeCallback, self._subscribeErrback)
+
+
+    def loseConnection(self):
+        if self._protocol is not None:
+            log.msg("_EventSourceDeviceSubscription: loseConnection: Protocol %(p)s", p=self._protocol, logLevel=_DEBUG)
+            self._protocol.transport.loseConnection()
+        else:
+            log.msg("_EventSourceDeviceSubscription: loseConnection: Deferred %(d)s", d=self._deferred, logLevel=_DEBUG)
+            self._deferred.cancel()
+
+
+    def _subscribeCallback(self, protocol):
+        self._protocol = protocol
+
+
+    def _subscribeErrback(self, failure):
+        log.msg("_EventSourceDeviceSubscription: _subscribeErrback: Failure %(f)s", f=failure, logLevel=_DEBUG)
+
+
+class ESDeviceSubscriptionProtocol(protocol.Protocol):
+    '''
+    Protocol to handle a device subscription of an event stream.
+    '''
+
+    def __init__(self, url, listener):
+        self.url = url
+        self._listener = listener
+        self._initial = True
+
+
+    def dataReceived(self, data):
+        log.msg("ESDeviceSubscriptionProtocol: dataReceived: Data type %(t)s", t=type(data), logLevel=_TRACE)
+        try:
+            self._listener.writeData(self.url, data, self.transport, self._initial)
+        except Exception as e:
+            log.msg("ESDeviceSubscriptionProtocol: dataReceived: Error encoding event: %(e)s", e=e, logLevel=_WARN)
+        self._initial = False
+
+
+    def connectionLost(self, reason):
+        log.msg("ESDeviceSubscriptionProtocol: connectionLost: Reason %(r)s", r=reason, logLevel=_DEBUG)
+
+
+class ESDeviceSubscriptionProtocolFactory(protocol.Factory):
+    '''
+    Protocol factory for ESDeviceSubscriptionProtocol.
+    '''
+
+    def __init__(self, url, listener):
+        self._url = url
+        self._listener = listener
+
+
+    def buildProtocol(self, addr):
+        return ESDeviceSubscriptionProtocol(self._url, self._listener)
@@ -0,0 +1,141 @@
+# coding=UTF-8
+'''
+HTTP resource to get a snapshot of the data of many devices.
+
+The devices are specified by the 'url' query parameters of the request,
+for example '/api/snapshot?url=epics:PV1&url=epics:PV2'. The response is
+an object with the device URLs as keys and the data as values (or null if
+the data is not available), encoded as JSON or as MessagePack if requested
+by the 'Accept' header.
+'''
+
+import time
+
+from hashlib import sha1
+
+from .. import device
+
+from ..util import log, json, msgpack
+
+from twisted.internet import defer
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+# Sequence numbers restart with the process, so make the ETags unique.
+_ETAG_SALT = "%x" % (int(time.time() * 1000),)
+
+_MSGPACK_TYPE = "application/msgpack"
+
+
+class SnapshotResource(Resource):
+    '''
+    Resource to get the latest data of many devices in one response.
+
+    The ETag of the response is derived from the update sequence numbers of
+    the data, so a request with a matching 'If-None-Match' header gets a
+    '304 Not Modified' response without getting or encoding the data.
+
+    The response has no ETag until the sequence numbers of all the valid
+    URLs are known (ie each device has a subscription with data), so the
+    first requests for a device that nobody subscribes to are not cached.
+    '''
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        urls = request.args.get('url', [])
+        if len(urls) == 0:
+            request.setResponseCode(400)
+            return "Parameter 'url' is required"
+
+        providers = []
+        for url in urls:
+            try:
+                providers.append(device.manager.buildProvider(url))
+            except ValueError as error:
+                log.msg("SnapshotResource: render_GET: Error building provider: %(e)s", e=error, logLevel=_WARN)
+                providers.append(None)
+
+        accept = request.getHeader("Accept") or ""
+        if _MSGPACK_TYPE in accept and msgpack.available():
+            contentType = _MSGPACK_TYPE
+        else:
+            contentType = "application/json"
+
+        etag = _etag(urls, providers, contentType)
+        if etag is not None and etag in _ifNoneMatch(request):
+            log.msg("SnapshotResource: render_GET: Not modified %(e)s", e=etag, logLevel=_TRACE)
+            request.setResponseCode(304)
+            request.setHeader("ETag", etag)
+            request.setHeader("Cache-Control", "no-cache")
+            request.setHeader("Vary", "Accept")
+            return ""
+
+        deferreds = [ _get(provider) for provider in providers ]
+        finished = []
+        request.notifyFinish().addErrback(finished.append)
+        deferred = defer.DeferredList(deferreds, consumeErrors=True)
+        deferred.addCallback(self._writeSnapshot, request, urls, contentType, etag, finished)
+        return NOT_DONE_YET
+
+
+    def _writeSnapshot(self, results, request, urls, contentType, etag, finished):
+        if len(finished) > 0:
+            log.msg("SnapshotResource: _writeSnapshot: Request finished before snapshot", logLevel=_DEBUG)
+            return
+        snapshot = {}
+        for url, (success, data) in zip(urls, results):
+            if success:
+                snapshot[url] = data
+            else:
+                log.msg("SnapshotResource: _writeSnapshot: Error getting %(u)s: %(f)s", u=url, f=data.getErrorMessage(), logLevel=_DEBUG)
+                snapshot[url] = None
+
+        request.setHeader("Content-Type", contentType)
+        if contentType == _MSGPACK_TYPE:
+            body = msgpack.stringify(snapshot)
+        else:
+            body = json.stringify(snapshot, sanitize=True)
+
+        # The data of known sequence numbers is available immediately, so the
+        # ETag matches the data, otherwise the data may have changed meanwhile.
+        if etag is not None:
+            request.setHeader("ETag", etag)
+        request.setHeader("Cache-Control", "no-cache")
+        request.setHeader("Vary", "Accept")
+        request.write(body)
+        request.finish()
+
+
+def _get(provider):
+    if provider is None:
+        return defer.fail(ValueError("Device URL not supported"))
+    try:
+        return provider.get()
+    except NotImplementedError as error:
+        return defer.fail(error)
+
+
+def _etag(urls, providers, contentType):
+    '''
+    Return the ETag for the current data of the providers in the specified
+    content type or None if any sequence number is unknown.
+    '''
+    sequences = []
+    for provider in providers:
+        sequence = None if provider is None else provider.sequence()
+        if provider is not None and sequence is None:
+            return None
+        sequences.append(sequence)
+    return '"%s"' % (sha1(repr((_ETAG_SALT, contentType, urls, sequences))).hexdigest(),)
+
+
+def _ifNoneMatch(request):
+    header = request.getHeader("If-None-Match")
+    if header is None:
+        return []
+    return [ tag.strip() for tag in header.split(",") ]
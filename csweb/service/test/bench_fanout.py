@@ -0,0 +1,69 @@
+# coding=UTF-8
+'''
+Benchmark the CPU time per PV update as the websocket fan-out grows.
+
+Compares encoding shared by all connections (the distributing protocol
+caches the encoded frame) with encoding for every connection.
+
+Usage: python -m csweb.service.test.bench_fanout
+'''
+
+import time
+
+from ...util import log
+from ...util.dist import DistributingProtocol, DistributingTransport
+from ..websocket import WSDeviceSubscriptionProtocol
+from .test_websocket import connectWebSocket
+
+from twisted.test.proto_helpers import StringTransport
+
+
+_URL = "epics:BENCH:PV"
+
+_DATA = {
+    "pvname":"BENCH:PV", "name":"BENCH:PV", "value":1.25, "char_value":"1.25",
+    "units":"mA", "precision":3, "severity":0, "status":0, "connected":True,
+    "upper_disp_limit":100.0, "lower_disp_limit":0.0, "upper_alarm_limit":90.0,
+    "lower_alarm_limit":10.0, "upper_warning_limit":80.0, "lower_warning_limit":20.0,
+    "upper_ctrl_limit":100.0, "lower_ctrl_limit":0.0, "timestamp":1350000000.0,
+    "count":1, "type":"ctrl_double", "host":"ioc.example.com:5064", "enum_strs":None,
+    "access":"read-only", "read_access":True, "write_access":False,
+}
+
+
+class _UnsharedDistributingProtocol(DistributingProtocol):
+    '''
+    Distribute without sharing encodings, equivalent to encoding per connection.
+    '''
+    def makeConnection(self, transport):
+        self.transport = transport
+        for protocol in self._protocols:
+            protocol.makeConnection(DistributingTransport(transport))
+
+
+def _bench(distributorClass, fanout, updates):
+    connections = [ connectWebSocket() for _ in range(fanout) ]
+    protocols = [ WSDeviceSubscriptionProtocol(_URL, p) for p, _ in connections ]
+    distributor = distributorClass(None, protocols)
+    distributor.makeConnection(StringTransport())
+    data = dict(_DATA)
+    start = time.clock()
+    for idx in range(updates):
+        data["value"] = float(idx)
+        distributor.dataReceived(data)
+        for _, transport in connections:
+            transport.clear()
+    return (time.clock() - start) / updates
+
+
+def main(fanouts=(1, 10, 100, 500, 1000, 2000), updates=20):
+    log.setLevel(log.WARN)
+    print "%8s %16s %16s %8s" % ("fan-out", "unshared (ms)", "shared (ms)", "speedup")
+    for fanout in fanouts:
+        unshared = _bench(_UnsharedDistributingProtocol, fanout, updates)
+        shared = _bench(DistributingProtocol, fanout, updates)
+        print "%8d %16.3f %16.3f %8.1f" % (fanout, unshared*1e3, shared*1e3, unshared/shared)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# coding=UTF-8
+'''
+Tests for service 'eventsource'.
+'''
+
+from ... import device
+from ...util import json
+from ...epics.subs.sub import EpicsSubscription, EpicsSubscriptionCanceller, EpicsSubscriptionProtocol
+from .. import eventsource
+from ..eventsource import EventSourceDeviceResource
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+from twisted.test.proto_helpers import StringTransport
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyRequest
+
+
+
+class _FakeProvider:
+    '''
+    Provider of a connected subscription protocol shared by all subscribers.
+    '''
+    def __init__(self, subscriptionProtocol):
+        self._subscriptionProtocol = subscriptionProtocol
+
+    def subscribe(self, protocolFactory):
+        canceller = EpicsSubscriptionCanceller(self._subscriptionProtocol._subscription)
+        deferred = defer.Deferred(canceller.cancel)
+        self._subscriptionProtocol.addProtocolFactory(deferred, canceller, protocolFactory)
+        return deferred
+
+
+
+def parseEvents(request):
+    '''
+    Parse the events written to the request as (id, data) tuples and clear it.
+    '''
+    events = []
+    for block in "".join(request.written).split("\n\n"):
+        if block == "" or block.startswith(":"):
+            continue
+        fields = dict([ line.split(": ", 1) for line in block.split("\n") ])
+        events.append((fields.get("id"), json.parse(fields["data"])))
+    request.written[:] = []
+    return events
+
+
+
+class TestEventSource(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(eventsource, "reactor", self.clock)
+        self.subscriptions = {}
+        self.distributors = {}
+        def buildProvider(url):
+            if url not in self.distributors:
+                self.distributors[url] = self._connect(url)
+            return _FakeProvider(self.distributors[url])
+        self.patch(device.manager, "buildProvider", buildProvider)
+        self.resource = EventSourceDeviceResource(heartbeatInterval=10.0)
+
+
+    def _connect(self, url):
+        distributor = EpicsSubscriptionProtocol(None, EpicsSubscription(url, self.subscriptions))
+        distributor.makeConnection(StringTransport())
+        distributor.connectionMade()
+        return distributor
+
+
+    def _request(self, urls, lastEventId=None):
+        request = DummyRequest([])
+        request.args = { "url":urls }
+        if lastEventId is not None:
+            request.requestHeaders.setRawHeaders("Last-Event-ID", [ lastEventId ])
+        self.assertEqual(self.resource.render_GET(request), NOT_DONE_YET)
+        return request
+
+
+    def test_shared_events(self):
+        self.encodings = 0
+        encodeEvent = eventsource._encodeEvent
+        def countingEncodeEvent(url, data, sequence):
+            self.encodings += 1
+            return encodeEvent(url, data, sequence)
+        self.patch(eventsource, "_encodeEvent", countingEncodeEvent)
+        requests = [ self._request([ "epics:A" ]) for _ in range(3) ]
+        self.assertEqual(requests[0].responseHeaders.getRawHeaders("Content-Type"), [ "text/event-stream" ])
+        self.distributors["epics:A"].dataReceived({ "value":1, "timestamp":100.5 })
+        self.assertEqual(self.encodings, 1)
+        eventId = self._eventId("epics:A")
+        for request in requests:
+            self.assertEqual(parseEvents(request), [ (eventId, { "epics:A":{ "value":1, "timestamp":100.5 } }) ])
+
+
+    def test_heartbeat(self):
+        request = self._request([ "epics:A" ])
+        self.clock.advance(10.0)
+        self.assertEqual(request.written[-1], ":\n\n")
+        request.processingFailed(Exception("Connection lost"))
+        self.assertEqual(self.distributors["epics:A"]._protocols, [])
+        self.assertEqual(self.subscriptions, {})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_resume(self):
+        self._request([ "epics:A", "epics:B" ])
+        self._update("epics:A", { "value":1 })
+        self._update("epics:B", { "value":2 })
+        lastEventId = self._eventId("epics:A")
+        # Only the update of 'epics:B' was missed.
+        request = self._request([ "epics:A", "epics:B" ], lastEventId=lastEventId)
+        self.assertEqual(parseEvents(request), [ (self._eventId("epics:B"), { "epics:B":{ "value":2 } }) ])
+        request = self._request([ "epics:A", "epics:B" ], lastEventId=self._eventId("epics:B"))
+        self.assertEqual(parseEvents(request), [])
+
+
+    def test_resume_other_process(self):
+        self._request([ "epics:A" ])
+        self._update("epics:A", { "value":1 })
+        request = self._request([ "epics:A" ], lastEventId="0-%d" % (self.distributors["epics:A"].lastSequence(),))
+        self.assertEqual(parseEvents(request), [ (self._eventId("epics:A"), { "epics:A":{ "value":1 } }) ])
+
+
+    def _update(self, url, data):
+        # The initial data of a subscription is the most recent update.
+        self.distributors[url]._data = data
+        self.distributors[url].dataReceived(data)
+
+
+    def _eventId(self, url):
+        return "%s-%d" % (eventsource._INSTANCE, self.distributors[url].lastSequence())
+
+
+    def test_url_required(self):
+        request = DummyRequest([])
+        self.assertEqual(self.resource.render_GET(request), "Parameter 'url' is required")
+        self.assertEqual(request.responseCode, 400)
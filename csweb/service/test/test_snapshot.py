@@ -0,0 +1,117 @@
+# coding=UTF-8
+'''
+Tests for service 'snapshot'.
+'''
+
+from ... import device
+from ...device.provider import DeviceProvider
+from ...util import dist, json, msgpack
+from ..snapshot import SnapshotResource
+
+from twisted.internet import defer
+from twisted.trial import unittest
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyRequest
+
+
+
+class _FakeProvider(DeviceProvider):
+
+    def __init__(self, devices, url):
+        self._devices = devices
+        self._url = url
+
+    def get(self):
+        self._devices.gets += 1
+        if self._url not in self._devices:
+            return defer.fail(Exception("Not connected"))
+        return defer.succeed(self._devices[self._url][1])
+
+    def sequence(self):
+        if self._url not in self._devices:
+            return None
+        return self._devices[self._url][0]
+
+
+
+class _Devices(dict):
+
+    gets = 0
+
+    def update(self, url, data):
+        self[url] = (dist.nextSequence(), data)
+
+
+
+class TestSnapshot(unittest.TestCase):
+
+    urls = [ "epics:A", "epics:B" ]
+
+
+    def setUp(self):
+        self.devices = _Devices()
+        self.devices.update("epics:A", { "value":1 })
+        self.devices.update("epics:B", { "value":2 })
+        def buildProvider(url):
+            if url == "invalid":
+                raise ValueError("Scheme not supported")
+            return _FakeProvider(self.devices, url)
+        self.patch(device.manager, "buildProvider", buildProvider)
+        self.resource = SnapshotResource()
+
+
+    def _render(self, urls, headers={}):
+        request = DummyRequest([])
+        request.args = { "url":urls }
+        for name, value in headers.items():
+            request.requestHeaders.setRawHeaders(name, [ value ])
+        body = self.resource.render_GET(request)
+        if body == NOT_DONE_YET:
+            self.assertEqual(request.finished, 1)
+            body = "".join(request.written)
+        return request, body
+
+
+    def test_snapshot(self):
+        request, body = self._render(self.urls + [ "invalid" ])
+        self.assertEqual(json.parse(body), { "epics:A":{ "value":1 }, "epics:B":{ "value":2 }, "invalid":None })
+        self.assertEqual(request.responseHeaders.getRawHeaders("Content-Type"), [ "application/json" ])
+        self.assertEqual(request.responseHeaders.getRawHeaders("Vary"), [ "Accept" ])
+
+
+    def test_not_modified(self):
+        request, _ = self._render(self.urls)
+        etag = request.responseHeaders.getRawHeaders("ETag")[0]
+        gets = self.devices.gets
+        request, body = self._render(self.urls, { "If-None-Match":etag })
+        self.assertEqual(request.responseCode, 304)
+        self.assertEqual(body, "")
+        self.assertEqual(self.devices.gets, gets)
+        self.assertEqual(request.responseHeaders.getRawHeaders("Vary"), [ "Accept" ])
+        self.devices.update("epics:B", { "value":3 })
+        request, body = self._render(self.urls, { "If-None-Match":etag })
+        self.assertNotEqual(request.responseCode, 304)
+        self.assertEqual(json.parse(body)["epics:B"], { "value":3 })
+        self.assertNotEqual(request.responseHeaders.getRawHeaders("ETag")[0], etag)
+
+
+    def test_unknown_sequence(self):
+        request, body = self._render(self.urls + [ "epics:C" ])
+        self.assertEqual(json.parse(body)["epics:C"], None)
+        self.assertEqual(request.responseHeaders.getRawHeaders("ETag"), None)
+        # Without an ETag the full response is sent for any 'If-None-Match'.
+        etag = self._render(self.urls)[0].responseHeaders.getRawHeaders("ETag")[0]
+        request, body = self._render(self.urls + [ "epics:C" ], { "If-None-Match":etag })
+        self.assertNotEqual(request.responseCode, 304)
+        self.assertEqual(json.parse(body)["epics:A"], { "value":1 })
+        self.assertEqual(request.responseHeaders.getRawHeaders("ETag"), None)
+
+
+    def test_messagepack(self):
+        if not msgpack.available():
+            raise unittest.SkipTest("MessagePack library not available")
+        request, body = self._render(self.urls, { "Accept":"application/msgpack" })
+        self.assertEqual(msgpack.parse(body), { "epics:A":{ "value":1 }, "epics:B":{ "value":2 } })
+        etag = request.responseHeaders.getRawHeaders("ETag")[0]
+        request, _ = self._render(self.urls)
+        self.assertNotEqual(request.responseHeaders.getRawHeaders("ETag")[0], etag)
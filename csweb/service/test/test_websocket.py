@@ -0,0 +1,630 @@
+# coding=UTF-8
+'''
+Tests for service 'websocket'.
+'''
+
+from ...util import json, msgpack, arrays
+from ... import device
+from ...device.provider import LimitError
+from ...device.remote import DeviceClientFactory, RemoteDeviceProvider
+from .. import websocket
+from ...util.dist import DistributingProtocol
+from ...epics.subs import sub
+from ...epics.subs.sub import EpicsSubscription, EpicsSubscriptionProtocol, EpicsSubscriptionProtocolFactory
+from ...epics.subs.rate import EpicsRateSubscription
+from ...twisted.websockets import _WebSocketsFactory, _parseFrames
+from ..websocket import WebSocketDeviceProtocolFactory, WSDeviceSubscriptionProtocol
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+from twisted.test.proto_helpers import StringTransport
+
+
+
+def connectWebSocket(factory=None, codec=None):
+    '''
+    Build a WebSocketDeviceProtocol connected through a WebSockets wrapper to a StringTransport.
+    '''
+    if factory is None:
+        factory = WebSocketDeviceProtocolFactory()
+    wsprotocol = _WebSocketsFactory(factory).buildProtocol(None)
+    wsprotocol.codec = codec
+    transport = StringTransport()
+    wsprotocol.makeConnection(transport)
+    transport.clear()
+    return wsprotocol.wrappedProtocol, transport
+
+
+
+def receivedMessages(transport):
+    '''
+    Parse the JSON messages written to the transport and clear it.
+    '''
+    frames, _ = _parseFrames(transport.value())
+    transport.clear()
+    return [ json.parse(data) for _, data, _ in frames ]
+
+
+
+class TestEncodedFanOut(unittest.TestCase):
+
+    url = "epics:TEST:PV"
+
+    data = { "pvname":"TEST:PV", "value":1.5, "char_value":"1.5", "units":"mA" }
+
+
+    def setUp(self):
+        self.encodings = []
+        stringify = json.stringify
+        def countingStringify(obj, sanitize=True):
+            self.encodings.append(obj)
+            return stringify(obj, sanitize)
+        self.patch(json, "stringify", countingStringify)
+
+
+    def _distribute(self, count):
+        connections = [ connectWebSocket() for _ in range(count) ]
+        protocols = [ WSDeviceSubscriptionProtocol(self.url, p) for p, _ in connections ]
+        distributor = DistributingProtocol(None, protocols)
+        distributor.makeConnection(StringTransport())
+        distributor.connectionMade()
+        return distributor, connections
+
+
+    def test_encode_once(self):
+        distributor, connections = self._distribute(5)
+        distributor.dataReceived(self.data)
+        self.assertEqual(len(self.encodings), 1)
+        frames = [ t.value() for _, t in connections ]
+        self.assertEqual(len(set(frames)), 1)
+        self.assertEqual(json.parse(frames[0][2:]), { self.url:self.data })
+
+
+    def test_encode_each_update(self):
+        distributor, connections = self._distribute(3)
+        distributor.dataReceived(self.data)
+        update = dict(self.data, value=2.5, char_value="2.5")
+        distributor.dataReceived(update)
+        self.assertEqual(len(self.encodings), 2)
+        for _, transport in connections:
+            self.assertIn('"value": 2.5', transport.value())
+
+
+
+class TestCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(websocket, "reactor", self.clock)
+        self.wsdp, self.transport = connectWebSocket(WebSocketDeviceProtocolFactory(flushInterval=0.1))
+        self.subscriptions = {}
+        for url in ("epics:A", "epics:B"):
+            protocol = WSDeviceSubscriptionProtocol(url, self.wsdp)
+            distributor = DistributingProtocol(None, [ protocol ])
+            distributor.makeConnection(StringTransport())
+            self.subscriptions[url] = distributor
+
+
+    def test_latest_value_per_url(self):
+        self.subscriptions["epics:A"].dataReceived({ "value":1 })
+        self.subscriptions["epics:B"].dataReceived({ "value":2 })
+        self.subscriptions["epics:A"].dataReceived({ "value":3 })
+        self.assertEqual(self.transport.value(), "")
+        self.clock.advance(0.1)
+        frame = self.transport.value()
+        self.assertEqual(json.parse(frame[2:]), { "epics:A":{ "value":3 }, "epics:B":{ "value":2 } })
+
+
+    def test_single_url(self):
+        self.subscriptions["epics:A"].dataReceived({ "value":1 })
+        self.subscriptions["epics:A"].dataReceived({ "value":2 })
+        self.clock.advance(0.1)
+        self.assertEqual(json.parse(self.transport.value()[2:]), { "epics:A":{ "value":2 } })
+        self.transport.clear()
+        self.clock.advance(0.1)
+        self.assertEqual(self.transport.value(), "")
+
+
+    def test_connection_lost(self):
+        self.subscriptions["epics:A"].dataReceived({ "value":1 })
+        self.wsdp.connectionLost(None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(websocket, "reactor", self.clock)
+        self.protocols = {}
+        for flushInterval in (None, 0.5):
+            wsdp, transport = connectWebSocket(WebSocketDeviceProtocolFactory(flushInterval))
+            protocol = WSDeviceSubscriptionProtocol("epics:A", wsdp)
+            self.protocols[flushInterval] = (wsdp, transport, protocol)
+        # Both connections share the same subscription.
+        self.distributor = DistributingProtocol(None, [ p for _, _, p in self.protocols.values() ])
+        self.distributor.makeConnection(StringTransport())
+
+
+    def test_rate_limit(self):
+        wsdp, transport, _ = self.protocols[None]
+        wsdp.dataReceived("OPT ratelimit=2")
+        for value in range(4):
+            self.distributor.dataReceived({ "value":value })
+            self.clock.advance(0.5)
+        self.assertEqual(receivedMessages(transport), [ { "epics:A":{ "value":3 } } ])
+        # The other connection receives every update.
+        self.assertEqual(len(receivedMessages(self.protocols[0.5][1])), 4)
+        wsdp.dataReceived("OPT ratelimit=0")
+        self.distributor.dataReceived({ "value":4 })
+        self.assertEqual(receivedMessages(transport), [ { "epics:A":{ "value":4 } } ])
+
+
+    def test_minimum_interval(self):
+        wsdp, _, _ = self.protocols[0.5]
+        wsdp.dataReceived("OPT ratelimit=0.1")
+        self.assertEqual(wsdp._flushInterval, 0.5)
+        for invalid in ("-1", "nan", "inf", "fast"):
+            wsdp.dataReceived("OPT ratelimit=" + invalid)
+            self.assertEqual(wsdp._flushInterval, 0.5)
+
+
+
+class TestBackpressure(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = WebSocketDeviceProtocolFactory()
+        self.wsdp, self.transport = connectWebSocket(self.factory)
+        self.subscriptions = {}
+        for url in ("epics:A", "epics:B"):
+            protocol = WSDeviceSubscriptionProtocol(url, self.wsdp)
+            distributor = DistributingProtocol(None, [ protocol ])
+            distributor.makeConnection(StringTransport())
+            self.subscriptions[url] = distributor
+
+
+    def test_conflate_while_paused(self):
+        wsprotocol = self.transport.producer
+        wsprotocol.pauseProducing()
+        for value in range(5):
+            self.subscriptions["epics:A"].dataReceived({ "value":value })
+        self.subscriptions["epics:B"].dataReceived({ "value":10 })
+        self.assertEqual(self.transport.value(), "")
+        self.assertEqual(self.wsdp.dropped, 4)
+        self.assertEqual(self.wsdp.conflated, 0)
+        wsprotocol.resumeProducing()
+        frame = self.transport.value()
+        self.assertEqual(json.parse(frame[2:]), { "epics:A":{ "value":4 }, "epics:B":{ "value":10 } })
+        self.transport.clear()
+        self.subscriptions["epics:A"].dataReceived({ "value":5 })
+        self.assertEqual(json.parse(self.transport.value()[2:]), { "epics:A":{ "value":5 } })
+
+
+    def test_counters(self):
+        self.transport.producer.pauseProducing()
+        self.subscriptions["epics:A"].dataReceived({ "value":1 })
+        self.subscriptions["epics:A"].dataReceived({ "value":2 })
+        counters = self.factory.counters().values()
+        self.assertEqual(counters, [ { "conflated":0, "dropped":1, "paused":True, "rejected":0, "subscriptions":0, "queued":0 } ])
+        self.wsdp.connectionLost(None)
+        self.assertEqual(self.wsdp.dropped, 2)
+        self.assertEqual(self.factory.counters(), {})
+
+
+
+class _FakeProvider:
+    '''
+    Provider that delivers its data (if any) in the next reactor iteration,
+    as does an existing EPICS subscription.
+    '''
+    def __init__(self, clock, data):
+        self._clock = clock
+        self._data = data
+
+    def subscribe(self, protocolFactory):
+        protocol = protocolFactory.buildProtocol(None)
+        distributor = DistributingProtocol(None, [ protocol ])
+        distributor.makeConnection(StringTransport())
+        if self._data is not None:
+            self._clock.callLater(0, distributor.dataReceived, self._data)
+        return defer.succeed(protocol)
+
+    def get(self):
+        if self._data is None:
+            return defer.fail(Exception("Timeout"))
+        return defer.succeed(self._data)
+
+
+
+class TestBulk(unittest.TestCase):
+
+    data = { "epics:A":{ "value":1 }, "epics:B":{ "value":2 } }
+
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(websocket, "reactor", self.clock)
+        self.built = []
+        def buildProvider(url):
+            self.built.append(url)
+            return _FakeProvider(self.clock, self.data.get(url))
+        self.patch(device.manager, "buildProvider", buildProvider)
+        self.wsdp, self.transport = connectWebSocket()
+
+
+    def test_initial_data_batched(self):
+        self.wsdp.dataReceived(json.stringify([ [ "SUB", "epics:A" ], [ "SUB", "epics:B" ], [ "SUB", "epics:C" ] ]))
+        self.assertEqual(self.built, [ "epics:A", "epics:B", "epics:C" ])
+        self.clock.advance(0)
+        self.assertEqual(receivedMessages(self.transport), [ self.data ])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        # Subsequent updates are not held.
+        self.wsdp._subscriptions["epics:A"]._protocol.dataReceived({ "value":3 })
+        self.assertEqual(receivedMessages(self.transport), [ { "epics:A":{ "value":3 } } ])
+
+
+    def test_existing_subscriptions(self):
+        self.wsdp.dataReceived("SUB epics:A")
+        self.wsdp.dataReceived("SUB epics:B")
+        self.clock.advance(0)
+        self.assertEqual(len(receivedMessages(self.transport)), 2)
+        self.wsdp.dataReceived(json.stringify([ [ "SUB", "epics:A" ], [ "SUB", "epics:B" ] ]))
+        self.assertEqual(self.transport.value(), "")
+        self.clock.advance(0)
+        self.assertEqual(receivedMessages(self.transport), [ self.data ])
+
+
+
+class TestAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(websocket, "reactor", self.clock)
+        self.built = []
+        def buildProvider(url):
+            self.built.append(url)
+            if url.startswith("epics:X"):
+                return _LimitedProvider()
+            return _FakeProvider(self.clock, None)
+        self.patch(device.manager, "buildProvider", buildProvider)
+
+
+    def test_connection_limit(self):
+        factory = WebSocketDeviceProtocolFactory(maxConnections=1)
+        connectWebSocket(factory)
+        transport = StringTransport()
+        _WebSocketsFactory(factory).buildProtocol(None).makeConnection(transport)
+        self.assertTrue(transport.disconnecting)
+        frames, _ = _parseFrames(transport.value())
+        self.assertEqual(frames[-1][1], (1013, "Connection limit reached"))
+        self.assertEqual(len(factory.counters()), 1)
+
+
+    def test_subscription_limit(self):
+        wsdp, transport = connectWebSocket(WebSocketDeviceProtocolFactory(maxSubscriptions=2))
+        wsdp.dataReceived(json.stringify([ [ "SUB", "epics:A" ], [ "SUB", "epics:B" ], [ "SUB", "epics:C" ] ]))
+        self.assertEqual(sorted(wsdp._subscriptions.keys()), [ "epics:A", "epics:B" ])
+        self.assertEqual(receivedMessages(transport), [ { "epics:C":{ "connected":False, "error":"Subscription limit (2) reached" } } ])
+        self.assertEqual(wsdp.counters()["rejected"], 1)
+
+
+    def test_queue(self):
+        wsdp, transport = connectWebSocket(WebSocketDeviceProtocolFactory(maxQueuedRequests=150))
+        urls = [ "epics:PV%d" % i for i in range(200) ]
+        wsdp.dataReceived(json.stringify([ [ "SUB", url ] for url in urls ]))
+        # The first requests are handled immediately, the others in later iterations.
+        self.assertEqual(self.built, urls[:websocket._QUEUE_BATCH_SIZE])
+        self.assertEqual(len(receivedMessages(transport)), 50)
+        wsdp.dataReceived("UNSUB epics:PV0")
+        self.clock.advance(0)
+        self.assertEqual(self.built, urls[:150])
+        self.assertEqual(len(wsdp._subscriptions), 149)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_provider_limit(self):
+        wsdp, transport = connectWebSocket()
+        wsdp.dataReceived("SUB epics:X?scale=2")
+        self.assertEqual(wsdp._subscriptions, {})
+        self.assertEqual(receivedMessages(transport), [ { "epics:X?scale=2":{ "connected":False, "error":"Too many" } } ])
+
+
+
+class _LimitedProvider:
+
+    def subscribe(self, protocolFactory):
+        return defer.fail(LimitError("Too many"))
+
+
+
+class TestGet(unittest.TestCase):
+
+    def setUp(self):
+        self.built = []
+        def buildProvider(url):
+            self.built.append(url)
+            return _FakeProvider(None, TestBulk.data.get(url))
+        self.patch(device.manager, "buildProvider", buildProvider)
+        self.wsdp, self.transport = connectWebSocket()
+
+
+    def test_get(self):
+        self.wsdp.dataReceived("GET epics:A")
+        self.assertEqual(receivedMessages(self.transport), [ { "epics:A":{ "value":1 } } ])
+        self.assertEqual(self.wsdp._subscriptions, {})
+
+
+    def test_get_failed(self):
+        self.wsdp.dataReceived("GET epics:C")
+        self.assertEqual(self.transport.value(), "")
+
+
+
+class _ChainProvider:
+    '''
+    Provider of a rate subscription derived from a connected root subscription.
+    '''
+    def __init__(self, subscription):
+        self._subscription = subscription
+
+    def subscribe(self, protocolFactory):
+        return self._subscription.addProtocolFactory(protocolFactory)
+
+
+
+class TestUnsubscribe(unittest.TestCase):
+
+    url = "epics:A?rate=1"
+
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(websocket, "reactor", self.clock)
+        self.patch(sub, "reactor", self.clock)
+        self.subscriptions = {}
+        root = EpicsSubscription("epics:A", self.subscriptions)
+        root._protocolFactory = EpicsSubscriptionProtocolFactory(root)
+        rate = EpicsRateSubscription(root, 1.0, self.url, self.subscriptions)
+        root._protocolFactory._protocol = EpicsSubscriptionProtocol(None, root)
+        self.rootProtocol = root._protocolFactory.buildProtocol(None)
+        self.rootTransport = StringTransport()
+        self.rootProtocol.makeConnection(self.rootTransport)
+        self.rootProtocol.connectionMade()
+        self.patch(device.manager, "buildProvider", lambda url: _ChainProvider(rate))
+        self.wsdp, self.transport = connectWebSocket()
+
+
+    def test_release_chain(self):
+        self.wsdp.dataReceived("SUB " + self.url)
+        self.clock.advance(0)
+        self.assertEqual(sorted(self.subscriptions.keys()), [ "epics:A", self.url ])
+        self.wsdp.dataReceived("UNSUB " + self.url)
+        self.assertEqual(self.wsdp._subscriptions, {})
+        self.assertEqual(self.subscriptions, {})
+        self.assertTrue(self.rootTransport.disconnecting)
+
+
+    def test_cancel_pending(self):
+        self.wsdp.dataReceived(json.stringify([ [ "SUB", self.url ], [ "UNSUB", self.url ] ]))
+        self.clock.advance(0)
+        self.assertEqual(self.wsdp._subscriptions, {})
+        self.assertEqual(self.transport.value(), "")
+        self.assertEqual(self.subscriptions, {})
+        self.assertTrue(self.rootTransport.disconnecting)
+
+
+    def test_unsubscribe_before_connect(self):
+        url = "epics:B?rate=1"
+        root = EpicsSubscription("epics:B", self.subscriptions)
+        root._protocolFactory = EpicsSubscriptionProtocolFactory(root)
+        rate = EpicsRateSubscription(root, 1.0, url, self.subscriptions)
+        self.patch(device.manager, "buildProvider", lambda url: _ChainProvider(rate))
+        self.wsdp.dataReceived("SUB " + url)
+        self.clock.advance(0)
+        self.wsdp.dataReceived("UNSUB " + url)
+        self.assertEqual(self.wsdp._subscriptions, {})
+        # The PV connects after the subscription was cancelled.
+        root._protocolFactory._protocol = EpicsSubscriptionProtocol(None, root)
+        rootProtocol = root._protocolFactory.buildProtocol(None)
+        rootTransport = StringTransport()
+        rootProtocol.makeConnection(rootTransport)
+        rootProtocol.connectionMade()
+        self.clock.advance(0)
+        self.assertNotIn(url, self.subscriptions)
+        self.assertNotIn("epics:B", self.subscriptions)
+        self.assertTrue(rootTransport.disconnecting)
+
+
+    def test_unknown_url(self):
+        self.wsdp.dataReceived("UNSUB epics:B")
+        self.assertEqual(self.wsdp._subscriptions, {})
+
+
+
+class TestRemoteFailure(unittest.TestCase):
+
+    url = "epics:A"
+
+
+    def setUp(self):
+        self.client = DeviceClientFactory()
+        self.patch(device.manager, "buildProvider", lambda url: RemoteDeviceProvider(self.client, url))
+        self.wsdp, self.transport = connectWebSocket()
+        self.wsdp.dataReceived("SUB " + self.url)
+
+
+    def test_failed_after_subscribed(self):
+        self.client.messageReceived([ "SUBSCRIBED", self.url ])
+        self.assertIn(self.url, self.wsdp._subscriptions)
+        self.client.messageReceived([ "ERROR", self.url, "LimitError", "Too many subscriptions" ])
+        self.assertEqual(self.wsdp._subscriptions, {})
+        self.assertEqual(receivedMessages(self.transport),
+                         [ { self.url:{ "connected":False, "error":"Too many subscriptions" } } ])
+
+
+    def test_failed_before_subscribed(self):
+        self.client.messageReceived([ "ERROR", self.url, "ValueError", "Device URL not supported" ])
+        self.assertEqual(self.wsdp._subscriptions, {})
+        self.assertEqual(receivedMessages(self.transport),
+                         [ { self.url:{ "connected":False, "error":"Device URL not supported" } } ])
+
+
+    def test_unsubscribed(self):
+        self.wsdp.dataReceived("UNSUB " + self.url)
+        self.client.messageReceived([ "ERROR", self.url, "ValueError", "Device URL not supported" ])
+        self.assertEqual(self.transport.value(), "")
+
+
+
+class TestDelta(unittest.TestCase):
+
+    url = "epics:TEST:PV"
+
+    def setUp(self):
+        self.connections = [ connectWebSocket() for _ in range(2) ]
+        for wsdp, _ in self.connections:
+            wsdp.dataReceived("OPT delta=true")
+        protocols = [ WSDeviceSubscriptionProtocol(self.url, p) for p, _ in self.connections ]
+        self.distributor = DistributingProtocol(None, protocols)
+        self.distributor.makeConnection(StringTransport())
+        self.data = { "value":1.0, "char_value":"1.0", "units":"mA", "precision":1 }
+
+
+    def _messages(self):
+        return [ receivedMessages(transport)[-1] for _, transport in self.connections ]
+
+
+    def test_full_then_delta(self):
+        self.distributor.dataReceived(self.data)
+        self.assertEqual(self._messages(), [ { self.url:self.data } ] * 2)
+        # The data is updated in place, like the EPICS client does.
+        self.data.update(value=2.0, char_value="2.0")
+        self.distributor.dataReceived(self.data)
+        self.assertEqual(self._messages(), [ { self.url:{ "value":2.0, "char_value":"2.0" } } ] * 2)
+
+
+    def test_removed_keys(self):
+        self.distributor.dataReceived(self.data)
+        self._messages()
+        del self.data["units"]
+        del self.data["precision"]
+        self.distributor.dataReceived(self.data)
+        message = self._messages()[0][self.url]
+        self.assertEqual(sorted(message.pop("-")), [ "precision", "units" ])
+        self.assertEqual(message, {})
+
+
+    def test_full_after_missed_update(self):
+        self.distributor.dataReceived(self.data)
+        self._messages()
+        wsprotocol = self.connections[0][1].producer
+        wsprotocol.pauseProducing()
+        self.data.update(value=2.0)
+        self.distributor.dataReceived(self.data)
+        self.data.update(value=3.0)
+        self.distributor.dataReceived(self.data)
+        wsprotocol.resumeProducing()
+        messages = self._messages()
+        self.assertEqual(messages[0], { self.url:self.data })
+        self.data.update(value=4.0)
+        self.distributor.dataReceived(self.data)
+        self.assertEqual(self._messages(), [ { self.url:{ "value":4.0 } } ] * 2)
+
+
+
+class TestMessagePack(unittest.TestCase):
+
+    if not msgpack.available():
+        skip = "MessagePack library not available"
+
+
+    def setUp(self):
+        self.connections = [ connectWebSocket(codec="msgpack"), connectWebSocket() ]
+        self.distributors = {}
+        for url in ("epics:A", "epics:B"):
+            protocols = [ WSDeviceSubscriptionProtocol(url, p) for p, _ in self.connections ]
+            distributor = DistributingProtocol(None, protocols)
+            distributor.makeConnection(StringTransport())
+            self.distributors[url] = distributor
+
+
+    def test_binary_frame(self):
+        self.distributors["epics:A"].dataReceived({ "value":float("nan"), "units":"mA" })
+        frames, _ = _parseFrames(self.connections[0][1].value())
+        self.assertEqual(len(frames), 1)
+        # The opcode is parsed as NORMAL, so check the header of the frame.
+        self.assertEqual(ord(self.connections[0][1].value()[0]), 0x82)
+        message = msgpack.parse(frames[0][1])
+        self.assertEqual(message.keys(), [ "epics:A" ])
+        self.assertEqual(message["epics:A"]["units"], "mA")
+        self.assertNotEqual(message["epics:A"]["value"], message["epics:A"]["value"])
+        # JSON clients still receive (sanitized) text.
+        self.assertEqual(receivedMessages(self.connections[1][1]), [ { "epics:A":{ "value":"NaN", "units":"mA" } } ])
+
+
+    def test_coalesced(self):
+        self.connections[0][0]._paused = True
+        self.distributors["epics:A"].dataReceived({ "value":1 })
+        self.distributors["epics:B"].dataReceived({ "value":2 })
+        self.connections[0][0].resumeProducing()
+        frames, _ = _parseFrames(self.connections[0][1].value())
+        self.assertEqual(msgpack.parse(frames[0][1]), { "epics:A":{ "value":1 }, "epics:B":{ "value":2 } })
+
+
+
+class TestBinaryArrays(unittest.TestCase):
+
+    if not arrays.available():
+        skip = "NumPy library not available"
+
+    url = "epics:TEST:WAVEFORM"
+
+    def setUp(self):
+        self.connections = [ connectWebSocket() for _ in range(2) ]
+        self.connections[0][0].dataReceived("OPT binary=true&delta=true")
+        protocols = [ WSDeviceSubscriptionProtocol(self.url, p) for p, _ in self.connections ]
+        self.distributor = DistributingProtocol(None, protocols)
+        self.distributor.makeConnection(StringTransport())
+        self.data = { "value":arrays.numpy.arange(4, dtype="<f8"), "units":"mA" }
+
+
+    def test_binary_array(self):
+        self.distributor.dataReceived(self.data)
+        frames, _ = _parseFrames(self.connections[0][1].value())
+        self.assertEqual(ord(self.connections[0][1].value()[0]), 0x82)
+        url, data = arrays.decode(frames[0][1])
+        self.assertEqual(url, self.url)
+        self.assertEqual(data["units"], "mA")
+        self.assertEqual(data["value"].dtype.str, "<f8")
+        self.assertEqual(data["value"].tolist(), [ 0.0, 1.0, 2.0, 3.0 ])
+        # Other clients receive the array as a list.
+        self.assertEqual(receivedMessages(self.connections[1][1]), [ { self.url:{ "value":[ 0.0, 1.0, 2.0, 3.0 ], "units":"mA" } } ])
+
+
+    def test_coalesced(self):
+        wsdp, transport = self.connections[0]
+        wsdp._paused = True
+        self.distributor.dataReceived(self.data)
+        protocol = WSDeviceSubscriptionProtocol("epics:TEST:PV", wsdp)
+        distributor = DistributingProtocol(None, [ protocol ])
+        distributor.makeConnection(StringTransport())
+        distributor.dataReceived({ "value":1.0 })
+        wsdp.resumeProducing()
+        # The array is not joined with other updates.
+        frames, _ = _parseFrames(transport.value())
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(arrays.decode(frames[0][1])[0], self.url)
+        self.assertEqual(json.parse(frames[1][1]), { "epics:TEST:PV":{ "value":1.0 } })
+
+
+    def test_not_supported_dtype(self):
+        self.data["value"] = self.data["value"].astype("<i8")
+        self.distributor.dataReceived(self.data)
+        self.assertEqual(receivedMessages(self.connections[0][1]), [ { self.url:{ "value":[ 0, 1, 2, 3 ], "units":"mA" } } ])
+
+
+    def test_base64(self):
+        wsdp, _ = connectWebSocket(codec="base64")
+        wsdp.dataReceived("OPT binary=true")
+        self.assertFalse(wsdp.binary)
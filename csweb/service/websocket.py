@@ -5,36 +5,189 @@ WebSocket protocol to handles device requests.
 
 from .. import device
 
-from ..util import log, json
+from ..device.provider import LimitError
+from ..util import log, json, msgpack, arrays
 from ..util.request import CSWPRequest
 
-from twisted.internet import protocol
+from collections import OrderedDict, deque
+
+from zope.interface import implementer
+
+from twisted.internet import protocol, reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.python.failure import Failure
 
 _TRACE = log.TRACE
 _DEBUG = log.DEBUG
 _WARN = log.WARN
 
+# Key of the copy of distributed data from which deltas are computed.
+_SNAPSHOT_KEY = ('snapshot',)
+
+# Item of a delta that lists the keys removed since the previous update.
+_REMOVED_KEY = '-'
+
+_TRUE_OPTIONS = ('1', 'true', 'yes', 'on')
+
+# Maximum interval (in seconds) of the rate limit requested by a client.
+_MAX_RATE_LIMIT = 3600.0
+
+# Number of queued requests handled per reactor iteration.
+_QUEUE_BATCH_SIZE = 100
+
+# WebSocket close status when the connection limit is reached (Try Again Later).
+_CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class _JSONCodec:
+    '''
+    Encode messages as JSON text.
+    '''
+    name = 'json'
+
+    def stringify(self, obj):
+        return json.stringify(obj, sanitize=True)
+
+    def member(self, encoded):
+        # Strip the braces of an encoded object with one member.
+        return encoded[1:-1]
+
+    def join(self, members):
+        return "{" + ", ".join(members) + "}"
+
+
+class _MessagePackCodec:
+    '''
+    Encode messages as MessagePack binary, no sanitization is required.
+    '''
+    name = 'msgpack'
+
+    def stringify(self, obj):
+        return msgpack.stringify(obj)
+
+    def member(self, encoded):
+        # Strip the header of an encoded map with one entry.
+        return encoded[1:]
+
+    def join(self, members):
+        return msgpack.mapHeader(len(members)) + "".join(members)
+
+
+_JSON_CODEC = _JSONCodec()
+
+# Codecs negotiated by the WebSocket that serialize messages, other
+# codecs (ie 'base64') transform messages that are encoded as JSON.
+_CODECS = { 'msgpack':_MessagePackCodec() }
+
 
 class WebSocketDeviceProtocolFactory(protocol.Factory):
     '''
     Protocol factory for WebSocketDeviceProtocol.
+
+    If a flush interval (in seconds) is specified then updates are coalesced:
+    all updates for a connection within the interval are sent as one message
+    containing only the latest data for each URL. An interval of zero flushes
+    on the next reactor iteration. By default updates are sent immediately.
+
+    To protect the server from abusive or buggy clients the number of
+    connections, the number of subscriptions per connection and the number
+    of queued requests per connection can be limited (None for no limit).
     '''
 
+    def __init__(self, flushInterval=None, maxConnections=None, maxSubscriptions=None, maxQueuedRequests=None):
+        self._flushInterval = flushInterval
+        self._maxConnections = maxConnections
+        self._maxSubscriptions = maxSubscriptions
+        self._maxQueuedRequests = maxQueuedRequests
+        self._protocols = set()
+
+
     def buildProtocol(self, addr):
-        return WebSocketDeviceProtocol()
+        protocol = WebSocketDeviceProtocol(self._flushInterval, self._maxSubscriptions, self._maxQueuedRequests)
+        protocol.factory = self
+        return protocol
+
 
+    def registerProtocol(self, protocol):
+        '''
+        Register the protocol or return False if the connection limit is reached.
+        '''
+        if self._maxConnections is not None and len(self._protocols) >= self._maxConnections:
+            return False
+        self._protocols.add(protocol)
+        return True
 
+
+    def unregisterProtocol(self, protocol):
+        self._protocols.discard(protocol)
+
+
+    def counters(self):
+        '''
+        Return the flow control counters of every connected protocol by peer address.
+        '''
+        counters = {}
+        for protocol in self._protocols:
+            counters[str(protocol.transport.getPeer())] = protocol.counters()
+        return counters
+
+
+@implementer(IPushProducer)
 class WebSocketDeviceProtocol(protocol.Protocol):
     '''
     Protocol to handle CSWP request from Web Socket clients.
+
+    While the transport is paused, because the client is not keeping up,
+    updates are held and conflated to the latest data for each URL. Updates
+    replaced while paused, or still held when the connection is lost, are
+    counted as dropped, updates replaced while coalescing as conflated.
+
+    If the client requests a rate limit ('OPT ratelimit=<interval>') then
+    updates are coalesced with the requested interval (in seconds), which can
+    only be longer than the flush interval of the factory.
+
+    If the client requests the delta option ('OPT delta=true') then the full
+    data is sent only for the first update of a subscription, after that only
+    the items that changed since the previous update are sent, and the keys
+    removed since the previous update are listed in the item '-'.
+
+    If the client requests the binary option ('OPT binary=true') then data
+    with an array value (ie a waveform) is sent as a binary message with
+    the bytes of the array (see arrays.encode), instead of a list of numbers.
+
+    The requests of a bulk request are handled in one pass and the initial
+    data of every subscription that already has data is sent in one message.
     '''
+
+    factory = None
     
-    def __init__(self):
+    def __init__(self, flushInterval=None, maxSubscriptions=None, maxQueuedRequests=None):
         self._subscriptions = {}
+        self._maxSubscriptions = maxSubscriptions
+        self._maxQueuedRequests = maxQueuedRequests
+        self._queue = deque()
+        self._queueCall = None
+        self._flushInterval = flushInterval
+        self._defaultFlushInterval = flushInterval
+        self._pending = OrderedDict()
+        self._flushCall = None
+        self._batchCall = None
+        self._paused = False
+        self.conflated = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.delta = False
+        self.binary = False
     
 
     def connectionMade(self):
         log.msg("WebSocketDeviceProtocol: connectionMade: Log connection established.", logLevel=_DEBUG)
+        if self.factory is not None and not self.factory.registerProtocol(self):
+            log.msg("WebSocketDeviceProtocol: connectionMade: Connection limit reached", logLevel=_WARN)
+            self.factory = None
+            self.transport.loseConnection(_CLOSE_TRY_AGAIN_LATER, "Connection limit reached")
+            return
+        self.transport.registerProducer(self, True)
         self.transport.write("") # Work-around to finalize connection with on Windows clients.
         
     
@@ -42,10 +195,10 @@ class WebSocketDeviceProtocol(protocol.Protocol):
         log.msg("WebSocketDeviceProtocol: dataReceived: Data type %(t)s", t=type(data), logLevel=_DEBUG)
         request = CSWPRequest(data)
         log.msg("WebSocketDeviceProtocol: dataReceived: CSWP request %(r)s", r=request, logLevel=_TRACE)
-        if request.action == 'SUB':
-            self._handleSubscribe(request)
+        if request.action == 'BULK':
+            self._handleBulk(request)
         else:
-            log.msg("WebSocketDeviceProtocol: dataReceived: Requested action not supported %(r)s", r=request, debugLevel=_WARN)
+            self._enqueue([ request ])
 
 
     def connectionLost(self, reason):
@@ -54,11 +207,221 @@ class WebSocketDeviceProtocol(protocol.Protocol):
             log.msg("WebSocketDeviceProtocol: connectionLost: Call loseConnection %(s)s", s=subscription, logLevel=_TRACE)
             subscription.loseConnection()
         self._subscriptions.clear()  # Clear list of Subscription Protocols.
+        if self._flushCall is not None:
+            self._flushCall.cancel()
+            self._flushCall = None
+        if self._batchCall is not None:
+            self._batchCall.cancel()
+            self._batchCall = None
+        if self._queueCall is not None:
+            self._queueCall.cancel()
+            self._queueCall = None
+        self._queue.clear()
+        self.dropped += len(self._pending)
+        self._pending.clear()
+        if self.factory is not None:
+            self.factory.unregisterProtocol(self)
+        log.msg("WebSocketDeviceProtocol: connectionLost: Counters %(c)s", c=self.counters(), logLevel=_DEBUG)
+
+
+    def counters(self):
+        '''
+        Return the number of conflated and dropped updates, rejected requests,
+        subscriptions and queued requests and if currently paused.
+        '''
+        return { "conflated":self.conflated, "dropped":self.dropped, "paused":self._paused, "rejected":self.rejected,
+                 "subscriptions":len(self._subscriptions), "queued":len(self._queue) }
+
+
+    def pauseProducing(self):
+        log.msg("WebSocketDeviceProtocol: pauseProducing: Client is behind, conflate updates", logLevel=_DEBUG)
+        self._paused = True
+
+
+    def resumeProducing(self):
+        log.msg("WebSocketDeviceProtocol: resumeProducing: Client caught up, %(n)d pending updates", n=len(self._pending), logLevel=_DEBUG)
+        self._paused = False
+        if len(self._pending) > 0 and self._flushCall is None:
+            self._flush()
+
+
+    def stopProducing(self):
+        log.msg("WebSocketDeviceProtocol: stopProducing: Transport is closing", logLevel=_DEBUG)
+
+
+    def writeUpdate(self, subscription):
+        '''
+        Write the data of the specified WSDeviceSubscriptionProtocol, or if
+        coalescing, hold it until the flush interval ends. If paused, hold it
+        until the transport resumes. If handling a bulk request, hold it until
+        the initial data has been received.
+        '''
+        if self._flushInterval is None and not self._paused and self._batchCall is None:
+            self._writeFrame(subscription)
+            return
+        # Only the subscription is kept, so the latest data is sent on flush.
+        if subscription.url in self._pending:
+            if self._paused:
+                self.dropped += 1
+            else:
+                self.conflated += 1
+        self._pending[subscription.url] = subscription
+        if self._flushCall is None and not self._paused and self._flushInterval is not None:
+            log.msg("WebSocketDeviceProtocol: writeUpdate: Schedule flush in %(i)ss", i=self._flushInterval, logLevel=_TRACE)
+            self._flushCall = reactor.callLater(self._flushInterval, self._flush)
+
+
+    def _flush(self):
+        self._flushCall = None
+        if self._paused:
+            log.msg("WebSocketDeviceProtocol: _flush: Paused, hold %(n)d pending updates", n=len(self._pending), logLevel=_TRACE)
+            return
+        pending, self._pending = self._pending, OrderedDict()
+        log.msg("WebSocketDeviceProtocol: _flush: Flush %(n)d pending updates", n=len(pending), logLevel=_TRACE)
+        if len(pending) == 1:
+            # A single update is identical for all connections, so use the shared frame.
+            self._writeFrame(pending.values()[0])
+            return
+        codec = self.codec()
+        members = []
+        for subscription in pending.values():
+            if subscription.isBinary():
+                # Binary arrays cannot be joined, so are sent as separate messages.
+                self._writeFrame(subscription)
+                continue
+            try:
+                members.append(codec.member(subscription.encodeMessage()))
+            except Exception as e:
+                log.msg("WebSocketDeviceProtocol: _flush: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+        if len(members) > 0:
+            self.transport.write(codec.join(members))
+
+
+    def _writeFrame(self, subscription):
+        try:
+            frame = subscription.encodeFrame()
+        except Exception as e:
+            log.msg("WebSocketDeviceProtocol: _writeFrame: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+            return
+        self.transport.writePreparedFrame(frame)
+
+
+    def codec(self):
+        '''
+        Return the codec used to encode messages for this connection.
+        '''
+        return _CODECS.get(self.transport.codec, _JSON_CODEC)
     
 
+    def _handleRequest(self, request):
+        if request.action == 'SUB':
+            self._handleSubscribe(request)
+        elif request.action == 'GET':
+            self._handleGet(request)
+        elif request.action == 'UNSUB':
+            self._handleUnsubscribe(request)
+        elif request.action == 'OPT':
+            self._handleOptions(request)
+        else:
+            log.msg("WebSocketDeviceProtocol: _handleRequest: Requested action not supported %(r)s", r=request, logLevel=_WARN)
+
+
+    def _handleBulk(self, request):
+        log.msg("WebSocketDeviceProtocol: _handleBulk: Handle %(n)d requests", n=len(request.requests), logLevel=_DEBUG)
+        if self._batchCall is None:
+            # Subscribing to an existing subscription delivers the initial data
+            # in the next reactor iteration (see EpicsSubscriptionProtocolFactory),
+            # so flush the batch in the iteration after that.
+            self._batchCall = reactor.callLater(0, self._scheduleBatchFlush)
+        self._enqueue(request.requests)
+
+
+    def _enqueue(self, requests):
+        '''
+        Queue the requests and handle them in order, a limited number per
+        reactor iteration. Requests that exceed the queue limit are rejected.
+        '''
+        for request in requests:
+            if self._maxQueuedRequests is not None and len(self._queue) >= self._maxQueuedRequests:
+                self._reject(request.url, "Request queue limit (%d) reached" % (self._maxQueuedRequests,))
+            else:
+                self._queue.append(request)
+        if self._queueCall is None:
+            self._processQueue()
+
+
+    def _processQueue(self):
+        self._queueCall = None
+        for _ in range(min(_QUEUE_BATCH_SIZE, len(self._queue))):
+            self._handleRequest(self._queue.popleft())
+        if len(self._queue) > 0:
+            log.msg("WebSocketDeviceProtocol: _processQueue: %(n)d requests remaining", n=len(self._queue), logLevel=_TRACE)
+            self._queueCall = reactor.callLater(0, self._processQueue)
+
+
+    def _reject(self, url, message):
+        '''
+        Send a message for the URL that indicates the request was rejected.
+        '''
+        log.msg("WebSocketDeviceProtocol: _reject: %(u)s: %(m)s", u=url, m=message, logLevel=_WARN)
+        self.rejected += 1
+        if url is None:
+            return
+        try:
+            self.transport.write(self.codec().stringify({ url:{ "connected":False, "error":message } }))
+        except Exception as e:
+            log.msg("WebSocketDeviceProtocol: _reject: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+
+
+    def _scheduleBatchFlush(self):
+        self._batchCall = reactor.callLater(0, self._flushBatch)
+
+
+    def _flushBatch(self):
+        if len(self._queue) > 0:
+            # Wait until the queued requests have been handled.
+            self._batchCall = reactor.callLater(0, self._scheduleBatchFlush)
+            return
+        self._batchCall = None
+        log.msg("WebSocketDeviceProtocol: _flushBatch: Flush %(n)d initial updates", n=len(self._pending), logLevel=_TRACE)
+        if len(self._pending) > 0 and self._flushCall is None and not self._paused:
+            self._flush()
+
+
+    def _handleOptions(self, request):
+        if 'delta' in request.options:
+            self.delta = (request.options['delta'].lower() in _TRUE_OPTIONS)
+            log.msg("WebSocketDeviceProtocol: _handleOptions: Delta updates: %(d)s", d=self.delta, logLevel=_DEBUG)
+        if 'binary' in request.options:
+            binary = (request.options['binary'].lower() in _TRUE_OPTIONS)
+            if binary and not arrays.available():
+                log.msg("WebSocketDeviceProtocol: _handleOptions: Binary arrays not supported (numpy not available)", logLevel=_WARN)
+            elif binary and self.transport.codec is not None and self.transport.codec not in _CODECS:
+                # Transform codecs (ie 'base64') are used by clients without binary messages.
+                log.msg("WebSocketDeviceProtocol: _handleOptions: Binary arrays not supported by codec %(c)s", c=self.transport.codec, logLevel=_WARN)
+            else:
+                self.binary = binary
+            log.msg("WebSocketDeviceProtocol: _handleOptions: Binary arrays: %(b)s", b=self.binary, logLevel=_DEBUG)
+        if 'ratelimit' in request.options:
+            try:
+                interval = float(request.options['ratelimit'])
+            except ValueError:
+                interval = -1.0
+            if not (0.0 <= interval < _MAX_RATE_LIMIT):
+                log.msg("WebSocketDeviceProtocol: _handleOptions: Rate limit invalid: %(r)s", r=request.options['ratelimit'], logLevel=_WARN)
+            elif interval == 0.0 or interval <= self._defaultFlushInterval:
+                self._flushInterval = self._defaultFlushInterval
+            else:
+                self._flushInterval = interval
+            log.msg("WebSocketDeviceProtocol: _handleOptions: Flush interval: %(i)s", i=self._flushInterval, logLevel=_DEBUG)
+
+
     def _handleSubscribe(self, request):
         if request.url not in self._subscriptions:
             log.msg("WebSocketDeviceProtocol: _handleSubscribe: No subsciption for URL %(r)s", r=request, logLevel=_DEBUG)
+            if self._maxSubscriptions is not None and len(self._subscriptions) >= self._maxSubscriptions:
+                self._reject(request.url, "Subscription limit (%d) reached" % (self._maxSubscriptions,))
+                return
             try:
                 provider = device.manager.buildProvider(request.url)
             except ValueError as error:
@@ -66,7 +429,11 @@ class WebSocketDeviceProtocol(protocol.Protocol):
                 return
             protocolFactory = WSDeviceSubscriptionProtocolFactory(request.url, self)
             deferred = provider.subscribe(protocolFactory)
-            subscription = _WebSocketDeviceSubscription(deferred)
+            rejected = []
+            deferred.addErrback(self._subscribeErrback, request.url, rejected)
+            subscription = _WebSocketDeviceSubscription(request.url, self, deferred)
+            if len(rejected) > 0:
+                return
             log.msg("WebSocketDeviceProtocol: _handleSubscribe: Add subsciption %(s)s", s=subscription, logLevel=_TRACE)
             self._subscriptions[request.url] = subscription
         else:
@@ -74,10 +441,66 @@ class WebSocketDeviceProtocol(protocol.Protocol):
             self._subscriptions[request.url].writeData()
 
 
+    def _subscribeErrback(self, failure, url, rejected):
+        failure.trap(LimitError)
+        rejected.append(failure)
+        self._subscriptions.pop(url, None)
+        self._reject(url, failure.getErrorMessage())
+
+
+    def subscriptionFailed(self, url, failure):
+        '''
+        Remove the subscription for the URL, that failed after it was requested
+        (ie rejected by a backend process), and notify the client.
+        '''
+        subscription = self._subscriptions.pop(url, None)
+        if subscription is None:
+            return
+        log.msg("WebSocketDeviceProtocol: subscriptionFailed: Remove subscription %(s)s", s=subscription, logLevel=_DEBUG)
+        self._pending.pop(url, None)
+        self._reject(url, failure.getErrorMessage())
+
+
+    def _handleGet(self, request):
+        try:
+            provider = device.manager.buildProvider(request.url)
+            deferred = provider.get()
+        except (ValueError, NotImplementedError) as error:
+            log.msg("WebSocketDeviceProtocol: _handleGet: Error getting data: %(e)s", e=error, logLevel=_WARN)
+            return
+        deferred.addCallbacks(self._getCallback, self._getErrback, callbackArgs=(request.url,), errbackArgs=(request.url,))
+
+
+    def _getCallback(self, data, url):
+        log.msg("WebSocketDeviceProtocol: _getCallback: Write data for URL %(u)s", u=url, logLevel=_TRACE)
+        try:
+            self.transport.write(self.codec().stringify({ url:data }))
+        except Exception as e:
+            log.msg("WebSocketDeviceProtocol: _getCallback: Error encoding message: %(e)s", e=e, logLevel=_WARN)
+
+
+    def _getErrback(self, failure, url):
+        log.msg("WebSocketDeviceProtocol: _getErrback: Error getting data for URL %(u)s: %(f)s", u=url, f=failure.getErrorMessage(), logLevel=_WARN)
+
+
+    def _handleUnsubscribe(self, request):
+        if request.url in self._subscriptions:
+            subscription = self._subscriptions.pop(request.url)
+            log.msg("WebSocketDeviceProtocol: _handleUnsubscribe: Remove subscription %(s)s", s=subscription, logLevel=_DEBUG)
+            # The subscription chain is released as the last protocol of each subscription is removed.
+            subscription.loseConnection()
+            self._pending.pop(request.url, None)
+        else:
+            log.msg("WebSocketDeviceProtocol: _handleUnsubscribe: No subscription for URL %(r)s", r=request, logLevel=_DEBUG)
+
+
 class _WebSocketDeviceSubscription:
 
-    def __init__(self, deferred):
+    def __init__(self, url, wssp, deferred):
+        self._url = url
+        self._wssp = wssp
         self._protocol = None
+        self._cancelled = False
         self._deferred = deferred
         self._deferred.addCallback(self._subscribeCallback)
         self._deferred.addErrback(self._subscribeErrback)
@@ -97,6 +520,7 @@ class _WebSocketDeviceSubscription:
             self._protocol.transport.loseConnection()
         else:
             log.msg("_WebSocketDeviceSubscription: loseConnection: Deferred %(d)s", d=self._deferred, logLevel=_DEBUG)
+            self._cancelled = True
             self._deferred.cancel()
 
 
@@ -107,6 +531,8 @@ class _WebSocketDeviceSubscription:
         
     def _subscribeErrback(self, failure):
         log.msg("_WebSocketDeviceSubscription: _subscribeErrback: Failure %(f)s", f=failure, logLevel=_DEBUG)
+        if not self._cancelled:
+            self._wssp.subscriptionFailed(self._url, failure)
 
 
 
@@ -116,9 +542,10 @@ class WSDeviceSubscriptionProtocol(protocol.Protocol):
     '''
     
     def __init__(self, url, wssp):
-        self._url = url
+        self.url = url
         self._wssp = wssp
         self._data = None
+        self._sentSnapshot = None
 
 
     def connectionMade(self):
@@ -127,13 +554,18 @@ class WSDeviceSubscriptionProtocol(protocol.Protocol):
     
     def dataReceived(self, data):
         log.msg("WSDeviceSubscriptionProtocol: dataReceived: Data type %(t)s", t=type(data), logLevel=_TRACE)
-        self._data = { self._url : data }
+        self._data = data
         self.writeData()
     
 
     def connectionLost(self, reason):
+        '''
+        The device is disconnected, or if the reason is a Failure then the
+        subscription failed (ie rejected by a backend process) and is removed.
+        '''
         log.msg("WSDeviceSubscriptionProtocol: connectionLost: Reason %(r)s", r=reason, logLevel=_DEBUG)
-        #What to do here?
+        if isinstance(reason, Failure):
+            self._wssp.subscriptionFailed(self.url, reason)
 
 
     def makeConnection(self, transport):
@@ -144,17 +576,86 @@ class WSDeviceSubscriptionProtocol(protocol.Protocol):
     def writeData(self):
         if self._data is not None:
             log.msg("WSDeviceSubscriptionProtocol: writeData: Write data to WebSocket as JSON", logLevel=_TRACE)
-            try: 
-                jsondata = json.stringify(self._data, sanitize=True)
-            except Exception as e:
-                log.msg("WSDeviceSubscriptionProtocol: dataReceived: Error dumping JSON: %(e)s", e=e, logLevel=_WARN)
-                return
-            self._wssp.transport.write(jsondata)
-
+            self._wssp.writeUpdate(self)
         else:
             log.msg("WSDeviceSubscriptionProtocol: writeData: Data has not been initialized.", logLevel=_WARN)
 
 
+    def encodeMessage(self):
+        '''
+        Return the data encoded as an object (or map) with the URL as the only key.
+
+        The same data is distributed to every connection subscribed to this URL,
+        so the encoding is shared with all other subscriptions to the same URL
+        that use the same codec.
+        '''
+        key, encoder = self._selectEncoding()
+        return self.transport.encodedData(self._data, key, encoder)
+
+
+    def isBinary(self):
+        '''
+        Return True if the data is sent as a binary array message.
+        '''
+        return self._wssp.binary and arrays.isBinary(self._data)
+
+
+    def encodeFrame(self):
+        '''
+        Return the encoded data as a WebSocket frame, shared with all
+        other connections that encode frames identically (if possible).
+        '''
+        wstransport = self._wssp.transport
+        if self.isBinary():
+            # The full data is sent, so the next delta must follow full data.
+            self._sentSnapshot = None
+            key = (self.url, 'array')
+            encoder = lambda: arrays.encode(self.url, self._data)
+            prepareFrame = lambda: wstransport.prepareBinaryFrame(self.transport.encodedData(self._data, key, encoder))
+        else:
+            key, encoder = self._selectEncoding()
+            prepareFrame = lambda: wstransport.prepareFrame(self.transport.encodedData(self._data, key, encoder))
+        frameKey = wstransport.frameKey()
+        if frameKey is None:
+            # The frame depends on previous frames of the connection (ie compression context).
+            return prepareFrame()
+        return self.transport.encodedData(self._data, (key, frameKey), prepareFrame)
+
+
+    def _selectEncoding(self):
+        '''
+        Select the full or delta encoding of the data for the next message.
+        '''
+        codec = self._wssp.codec()
+        if not self._wssp.delta or not isinstance(self._data, dict):
+            return (self.url, codec.name), lambda: self._encode(codec)
+        # A delta can only be sent if this subscription sent the previous data.
+        snapshot = self.transport.encodedData(self._data, _SNAPSHOT_KEY, lambda: dict(self._data))
+        previous = self.transport.previousEncodedData(_SNAPSHOT_KEY)
+        sent, self._sentSnapshot = self._sentSnapshot, snapshot
+        if sent is None or sent is not previous:
+            return (self.url, codec.name), lambda: self._encode(codec)
+        return (self.url, codec.name, 'delta'), lambda: self._encodeDelta(codec)
+
+
+    def _encode(self, codec):
+        log.msg("WSDeviceSubscriptionProtocol: _encode: Encode data for URL %(u)s as %(c)s", u=self.url, c=codec.name, logLevel=_TRACE)
+        return codec.stringify({ self.url : self._data })
+
+
+    def _encodeDelta(self, codec):
+        log.msg("WSDeviceSubscriptionProtocol: _encodeDelta: Encode delta for URL %(u)s as %(c)s", u=self.url, c=codec.name, logLevel=_TRACE)
+        previous = self.transport.previousEncodedData(_SNAPSHOT_KEY)
+        delta = {}
+        for key, value in self._data.iteritems():
+            if key not in previous or not arrays.equal(previous[key], value):
+                delta[key] = value
+        removed = [ key for key in previous if key not in self._data ]
+        if len(removed) > 0:
+            delta[_REMOVED_KEY] = removed
+        return codec.stringify({ self.url : delta })
+
+
 class WSDeviceSubscriptionProtocolFactory(protocol.Factory):
     '''
     Protocol factory for WSDeviceSubscriptionProtocol.
@@ -0,0 +1,55 @@
+# coding=UTF-8
+'''
+Benchmark WebSockets unmasking over payload sizes from 16 B to 1 MB.
+
+Compares the original per-byte loop with the integer and NumPy
+implementations used by '_mask'.
+
+Usage: python -m csweb.twisted.test.bench_mask
+'''
+
+import os, time
+
+from .. import websockets
+
+
+def _maskBytes(buf, key):
+    '''
+    The original implementation, XOR one character at a time.
+    '''
+    key = [ord(i) for i in key]
+    buf = list(buf)
+    for i, char in enumerate(buf):
+        buf[i] = chr(ord(char) ^ key[i % 4])
+    return "".join(buf)
+
+
+def _bench(mask, buf, key, minTime=0.2):
+    count = 0
+    start = time.time()
+    while True:
+        mask(buf, key)
+        count += 1
+        elapsed = time.time() - start
+        if elapsed >= minTime:
+            return elapsed / count
+
+
+def main(sizes=(16, 128, 1024, 4096, 16384, 65536, 262144, 1048576)):
+    key = os.urandom(4)
+    impls = [ ("bytes", _maskBytes), ("integer", websockets._maskInteger) ]
+    if websockets.numpy is not None:
+        impls.append(("numpy", websockets._maskNumpy))
+    print "%10s" % ("size (B)",) + "".join([ "%16s" % (name + " (MB/s)",) for name, _ in impls ])
+    for size in sizes:
+        buf = os.urandom(size)
+        expected = _maskBytes(buf, key)
+        row = "%10d" % (size,)
+        for name, mask in impls:
+            assert mask(buf, key) == expected, name
+            row += "%16.1f" % (size / _bench(mask, buf, key) / 1e6,)
+        print row
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+# coding=UTF-8
+'''
+Tests for the WebSockets protocol.
+'''
+
+import zlib
+
+from struct import pack
+
+from .. import websockets
+from ..websockets import _makeFrame, _makeHeader, _parseFrames, _negotiateDeflate, _mask
+from ..websockets import _WebSocketsFactory, _FrameParser, _WSException, _CONTROLS
+
+from twisted.internet import protocol, task
+from twisted.trial import unittest
+from twisted.test.proto_helpers import StringTransport
+
+
+
+class _RecordingProtocol(protocol.Protocol):
+
+    def __init__(self):
+        self.received = []
+
+    def dataReceived(self, data):
+        self.received.append(data)
+
+
+class _RecordingFactory(protocol.Factory):
+
+    protocol = _RecordingProtocol
+
+
+
+class _PausingTransport(StringTransport):
+    '''
+    Transport which pauses its producer when the written bytes exceed its buffer size.
+    '''
+    bufferSize = 2 ** 16
+
+    def write(self, data):
+        StringTransport.write(self, data)
+        if self.producer is not None and len(self.value()) > self.bufferSize:
+            self.producer.pauseProducing()
+
+    def writeSequence(self, data):
+        self.write("".join(data))
+
+
+
+class _BufferingTransport(_PausingTransport):
+    '''
+    Transport which holds the written bytes, like a TCP transport while the socket is not writable.
+    '''
+    offset = 0
+    _tempDataLen = 0
+
+    @property
+    def dataBuffer(self):
+        return self.value()
+
+
+
+class _RecordingProducer(object):
+
+    def __init__(self):
+        self.events = []
+
+    def pauseProducing(self):
+        self.events.append("pause")
+
+    def resumeProducing(self):
+        self.events.append("resume")
+
+    def stopProducing(self):
+        self.events.append("stop")
+
+
+
+def connect(deflate=None, transport=None):
+    wsprotocol = _WebSocketsFactory(_RecordingFactory()).buildProtocol(None)
+    wsprotocol.deflate = deflate
+    if transport is None:
+        transport = StringTransport()
+    wsprotocol.makeConnection(transport)
+    return wsprotocol, transport
+
+
+
+def clientFrame(buf, key="abcd", header=0x81):
+    '''
+    Build a masked frame as sent by a client.
+    '''
+    length = len(buf)
+    if length > 0xffff:
+        length = "\xff" + pack(">Q", length)
+    elif length > 0x7d:
+        length = "\xfe" + pack(">H", length)
+    else:
+        length = chr(0x80 | length)
+    return chr(header) + length + key + _mask(buf, key)
+
+
+
+def inflate(buf):
+    return zlib.decompressobj(-15).decompress(buf + "\x00\x00\xff\xff")
+
+
+
+class TestFrames(unittest.TestCase):
+
+    def test_roundtrip(self):
+        for size in (0, 1, 125, 126, 0xffff, 0x10000):
+            buf = "x" * size
+            frames, rest = _parseFrames(_makeFrame(buf))
+            self.assertEqual(frames, [ (_CONTROLS.NORMAL, buf, False) ])
+            self.assertEqual(rest, "")
+
+
+    def test_partial(self):
+        frame = _makeFrame("y" * 300)
+        frames, rest = _parseFrames(frame[:100])
+        self.assertEqual(frames, [])
+        self.assertEqual(rest, frame[:100])
+
+
+    def test_masked(self):
+        frames, _ = _parseFrames(clientFrame("SUB epics:PV"))
+        self.assertEqual(frames, [ (_CONTROLS.NORMAL, "SUB epics:PV", False) ])
+
+
+    def test_mask(self):
+        key = "\x01\x80\xff\x00"
+        for size in (0, 1, 3, 4, 5, 127, 128, 129, 4099):
+            buf = "".join([ chr(i % 256) for i in range(size) ])
+            expected = "".join([ chr(ord(c) ^ ord(key[i % 4])) for i, c in enumerate(buf) ])
+            self.assertEqual(_mask(buf, key), expected)
+            self.assertEqual(websockets._maskInteger(buf, key) if size else "", expected)
+            self.assertEqual(_mask(expected, key), buf)
+
+
+    def test_prepared_frame(self):
+        wsprotocol, transport = connect()
+        data = "x" * 200
+        header, payload = wsprotocol.prepareFrame(data)
+        # The payload is written after the header without being copied.
+        self.assertIdentical(payload, data)
+        self.assertEqual(header + payload, _makeFrame(data))
+        sequences = []
+        transport.writeSequence = sequences.append
+        wsprotocol.writeSequence([ "a", data ])
+        self.assertEqual(sequences, [ [ _makeFrame("a")[:2], "a", header, data ] ])
+
+
+    def test_prepared_binary_frame(self):
+        wsprotocol, transport = connect()
+        wsprotocol.codec = "base64"
+        parts = [ "header", "\x00" * 200 ]
+        frame = wsprotocol.prepareBinaryFrame(parts)
+        # The parts are neither encoded nor joined.
+        self.assertIdentical(frame[2], parts[1])
+        self.assertEqual("".join(frame), _makeHeader(206, _CONTROLS.BINARY) + "".join(parts))
+
+
+    def test_reserved_flag(self):
+        frame = _makeFrame("data", _compressed=True)
+        self.assertRaises(Exception, _parseFrames, frame)
+        frames, _ = _parseFrames(frame, compression=True)
+        self.assertEqual(frames, [ (_CONTROLS.NORMAL, "data", True) ])
+
+
+
+class TestFrameParser(unittest.TestCase):
+
+    def test_incremental(self):
+        data = clientFrame("SUB epics:PV") + clientFrame("x" * 300)
+        parser = _FrameParser()
+        frames = []
+        for c in data:
+            frames.extend(parser.feed(c))
+        self.assertEqual(frames, [ (_CONTROLS.NORMAL, "SUB epics:PV", False),
+                                   (_CONTROLS.NORMAL, "x" * 300, False) ])
+        self.assertEqual(parser.pending(), "")
+
+
+    def test_fragmented(self):
+        parser = _FrameParser()
+        frames = parser.feed(clientFrame("SUB ", header=0x01) + clientFrame("epics:", header=0x00))
+        self.assertEqual(frames, [])
+        # Control frames may be interleaved with fragments.
+        frames = parser.feed(clientFrame("", header=0x89) + clientFrame("PV", header=0x80))
+        self.assertEqual(frames, [ (_CONTROLS.PING, "", False),
+                                   (_CONTROLS.NORMAL, "SUB epics:PV", False) ])
+
+
+    def test_invalid_fragments(self):
+        self.assertRaises(_WSException, _FrameParser().feed, clientFrame("PV", header=0x80))
+        parser = _FrameParser()
+        parser.feed(clientFrame("SUB ", header=0x01))
+        self.assertRaises(_WSException, parser.feed, clientFrame("SUB ", header=0x01))
+        self.assertRaises(_WSException, _FrameParser().feed, clientFrame("", header=0x09))
+
+
+    def test_max_message_size(self):
+        parser = _FrameParser(maxMessageSize=100)
+        parser.feed(clientFrame("x" * 60, header=0x01))
+        # The size is checked before the payload has been received.
+        self.assertRaises(_WSException, parser.feed, clientFrame("x" * 60, header=0x80)[:8])
+        self.assertRaises(_WSException, _FrameParser(maxMessageSize=100).feed, clientFrame("x" * 101)[:4])
+
+
+    def test_connection_closed(self):
+        wsprotocol, transport = connect()
+        wsprotocol.factory.maxMessageSize = 100
+        wsprotocol._parser.maxMessageSize = 100
+        wsprotocol.dataReceived(clientFrame("x" * 200))
+        self.assertEqual(len(self.flushLoggedErrors(_WSException)), 1)
+        self.assertTrue(transport.disconnecting)
+        frames, _ = _parseFrames(transport.value())
+        self.assertEqual(frames[-1][:2], (_CONTROLS.CLOSE, (1009, "Message exceeds the maximum size (100 bytes)")))
+
+
+    def test_compressed_flag(self):
+        # The compressed flag is only valid on the first frame of a data message.
+        parser = _FrameParser(compression=True)
+        self.assertRaises(_WSException, parser.feed, clientFrame("", header=0xc9))
+        parser = _FrameParser(compression=True)
+        parser.feed(clientFrame("SUB ", header=0x41))
+        self.assertRaises(_WSException, parser.feed, clientFrame("PV", header=0xc0))
+        wsprotocol, transport = connect(_negotiateDeflate("permessage-deflate"))
+        wsprotocol.dataReceived(clientFrame("", header=0xc9))
+        self.assertEqual(len(self.flushLoggedErrors(_WSException)), 1)
+        self.assertTrue(transport.disconnecting)
+        frames, _ = _parseFrames(transport.value())
+        self.assertEqual(frames[-1][:2], (_CONTROLS.CLOSE, (1002, "Compressed flag in control frame")))
+
+
+
+class TestPerMessageDeflate(unittest.TestCase):
+
+    def test_negotiate(self):
+        self.assertIdentical(_negotiateDeflate(None), None)
+        self.assertIdentical(_negotiateDeflate("x-webkit-deflate-frame"), None)
+        deflate = _negotiateDeflate("permessage-deflate; client_max_window_bits")
+        self.assertEqual(deflate.response(), "permessage-deflate; server_no_context_takeover")
+        deflate = _negotiateDeflate("permessage-deflate; server_max_window_bits=8, permessage-deflate; server_max_window_bits=10", True)
+        self.assertEqual(deflate.response(), "permessage-deflate; server_max_window_bits=10")
+        self.assertIdentical(deflate.key(), None)
+        deflate = _negotiateDeflate("permessage-deflate; server_no_context_takeover", True)
+        self.assertFalse(deflate.contextTakeover)
+
+
+    def test_shared_frames(self):
+        data = '{"epics:PV": {"value": 1.0, "units": "mA", "pvname": "PV"}}' * 4
+        protocols = [ connect(_negotiateDeflate("permessage-deflate", minSize=16))[0] for _ in range(2) ]
+        self.assertEqual(protocols[0].frameKey(), protocols[1].frameKey())
+        frames = [ "".join(p.prepareFrame(data)) for p in protocols ]
+        self.assertEqual(frames[0], frames[1])
+        self.assertEqual(frames[0], "".join(protocols[0].prepareFrame(data)))
+        parsed, _ = _parseFrames(frames[0], compression=True)
+        self.assertEqual(len(parsed), 1)
+        self.assertTrue(parsed[0][2])
+        self.assertEqual(inflate(parsed[0][1]), data)
+
+
+    def test_context_takeover(self):
+        wsprotocol, transport = connect(_negotiateDeflate("permessage-deflate", True))
+        self.assertIdentical(wsprotocol.frameKey(), None)
+        data = "a repeated message " * 8
+        wsprotocol.write(data)
+        wsprotocol.write(data)
+        frames, _ = _parseFrames(transport.value(), compression=True)
+        self.assertTrue(len(frames[1][1]) < len(frames[0][1]))
+        inflater = zlib.decompressobj(-15)
+        for frame in frames:
+            self.assertEqual(inflater.decompress(frame[1] + "\x00\x00\xff\xff"), data)
+
+
+    def test_min_size(self):
+        wsprotocol, transport = connect(_negotiateDeflate("permessage-deflate", minSize=128))
+        wsprotocol.write("small")
+        frames, _ = _parseFrames(transport.value(), compression=True)
+        self.assertEqual(frames, [ (_CONTROLS.NORMAL, "small", False) ])
+
+
+    def test_receive_compressed(self):
+        wsprotocol, _ = connect(_negotiateDeflate("permessage-deflate"))
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        buf = compressor.compress("SUB epics:PV") + compressor.flush(zlib.Z_SYNC_FLUSH)
+        wsprotocol.dataReceived(clientFrame(buf[:-4], header=0xc1))
+        self.assertEqual(wsprotocol.wrappedProtocol.received, [ "SUB epics:PV" ])
+
+
+
+class TestFlowControl(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(websockets, "reactor", self.clock)
+        self.wsprotocol, self.transport = connect(transport=_BufferingTransport())
+        self.producer = _RecordingProducer()
+        self.wsprotocol.registerProducer(self.producer, True)
+
+
+    def test_watermarks(self):
+        factory = self.wsprotocol.factory
+        self.assertEqual((factory.highWatermark, factory.lowWatermark), (64 * 1024, 16 * 1024))
+        self.assertEqual(self.transport.bufferSize, 64 * 1024)
+        self.wsprotocol.write("x" * 32 * 1024)
+        self.assertEqual(self.producer.events, [])
+        self.wsprotocol.write("x" * 32 * 1024)
+        self.assertTrue(self.wsprotocol.paused)
+        self.assertEqual(self.producer.events, [ "pause" ])
+        # Still above the low watermark.
+        self.transport.io.seek(0)
+        self.transport.io.truncate()
+        self.transport.io.write("x" * 20 * 1024)
+        self.clock.advance(self.wsprotocol.drainInterval)
+        self.assertEqual(self.producer.events, [ "pause" ])
+        self.transport.io.seek(0)
+        self.transport.io.truncate()
+        self.transport.io.write("x" * 16 * 1024)
+        self.clock.advance(self.wsprotocol.drainInterval)
+        self.assertFalse(self.wsprotocol.paused)
+        self.assertEqual(self.producer.events, [ "pause", "resume" ])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_transport_resumes(self):
+        self.wsprotocol.write("x" * 64 * 1024)
+        self.transport.clear()
+        # The transport resumes its producer once the buffer is empty.
+        self.wsprotocol.resumeProducing()
+        self.assertEqual(self.producer.events, [ "pause", "resume" ])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.wsprotocol.resumeProducing()
+        self.assertEqual(self.producer.events, [ "pause", "resume" ])
+
+
+    def test_connection_lost(self):
+        self.wsprotocol.write("x" * 64 * 1024)
+        self.wsprotocol.connectionLost(None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_unbuffered_transport(self):
+        wsprotocol, transport = connect(transport=_PausingTransport())
+        wsprotocol.registerProducer(self.producer, True)
+        wsprotocol.write("x" * 128 * 1024)
+        self.assertTrue(wsprotocol.paused)
+        # The pending bytes are unknown, so resumed by the transport.
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        transport.clear()
+        wsprotocol.resumeProducing()
+        self.assertEqual(self.producer.events, [ "pause", "resume" ])
+
+
+    def test_no_flow_control(self):
+        wsprotocol, _ = connect()
+        wsprotocol.registerProducer(self.producer, True)
+        wsprotocol.write("x" * 128 * 1024)
+        self.assertFalse(wsprotocol.paused)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_invalid_watermarks(self):
+        self.assertRaises(ValueError, websockets.WebSocketsResource, _RecordingFactory(), highWatermark=1024, lowWatermark=2048)
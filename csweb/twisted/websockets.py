@@ -1,4 +1,4 @@
-# -*- test-case-name: twisted.web.test.test_websockets -*-
+# -*- test-case-name: csweb.twisted.test.test_websockets -*-
 # Copyright (c) Twisted Matrix Laboratories.
 #               2011-2012 Oregon State University Open Source Lab
 #               2011-2012 Corbin Simpson
@@ -12,12 +12,27 @@ factory.
 
 __all__ = ["WebSocketsResource"]
 
+import zlib
+
 from base64 import b64encode, b64decode
+from binascii import hexlify, unhexlify
 from hashlib import sha1
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
 
 from zope.interface import implementer
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
 from twisted.protocols.policies import ProtocolWrapper, WrappingFactory
 from twisted.python import log
 from twisted.python.constants import NamedConstant, Names
@@ -26,11 +41,23 @@ from twisted.web.server import NOT_DONE_YET
 
 
 
+# 7.4.1 Status codes of closing frames.
+_CLOSE_PROTOCOL_ERROR = 1002
+_CLOSE_MESSAGE_TOO_BIG = 1009
+
+
+
 class _WSException(Exception):
     """
     Internal exception for control flow inside the WebSockets frame parser.
+
+    @ivar code: The status code of the closing frame.
     """
 
+    def __init__(self, message, code=_CLOSE_PROTOCOL_ERROR):
+        Exception.__init__(self, message)
+        self.code = code
+
 
 
 # Control frame specifiers. Some versions of WS have control signals sent
@@ -42,13 +69,15 @@ class _CONTROLS(Names):
     """
 
     NORMAL = NamedConstant()
+    CONTINUATION = NamedConstant()
+    BINARY = NamedConstant()
     CLOSE = NamedConstant()
     PING = NamedConstant()
     PONG = NamedConstant()
 
 
 _opcodeTypes = {
-    0x0: _CONTROLS.NORMAL,
+    0x0: _CONTROLS.CONTINUATION,
     0x1: _CONTROLS.NORMAL,
     0x2: _CONTROLS.NORMAL,
     0x8: _CONTROLS.CLOSE,
@@ -58,6 +87,7 @@ _opcodeTypes = {
 
 _opcodeForType = {
     _CONTROLS.NORMAL: 0x1,
+    _CONTROLS.BINARY: 0x2,
     _CONTROLS.CLOSE: 0x8,
     _CONTROLS.PING: 0x9,
     _CONTROLS.PONG: 0xa}
@@ -70,6 +100,146 @@ _encoders = {
 _decoders = {
     "base64": b64decode}
 
+
+# Codecs which serialize application data, rather than transform bytes, are
+# implemented by the wrapped protocol (using the negotiated codec) and their
+# frames are sent with the binary opcode.
+_binaryCodecs = set()
+
+
+def _identity(buf):
+    return buf
+
+
+if msgpack is not None:
+    _encoders["msgpack"] = _identity
+    _decoders["msgpack"] = _identity
+    _binaryCodecs.add("msgpack")
+
+# Extensions for WS.
+
+# The trailing bytes of a block flushed with Z_SYNC_FLUSH, which RFC 7692
+# requires to be removed from each compressed message.
+_DEFLATE_TAIL = "\x00\x00\xff\xff"
+
+
+
+class _PerMessageDeflate(object):
+    """
+    The state of the permessage-deflate extension (RFC 7692) of a connection.
+
+    @ivar contextTakeover: C{True} if the compression context is kept between
+        messages, otherwise every message is compressed independently and
+        identical messages produce identical compressed output.
+
+    @ivar minSize: Messages smaller than this are not compressed.
+    """
+
+    def __init__(self, contextTakeover=False, windowBits=15, minSize=0):
+        self.contextTakeover = contextTakeover
+        self.windowBits = windowBits
+        self.minSize = minSize
+        self._compressor = None
+        self._decompressor = zlib.decompressobj(-15)
+
+
+    def key(self):
+        """
+        Identify the compression of messages, or C{None} if the compressed
+        output depends on the previous messages of the connection.
+        """
+        if self.contextTakeover:
+            return None
+        return ("permessage-deflate", self.windowBits, self.minSize)
+
+
+    def response(self):
+        """
+        The value of the Sec-WebSocket-Extensions response header.
+        """
+        params = ["permessage-deflate"]
+        if not self.contextTakeover:
+            params.append("server_no_context_takeover")
+        if self.windowBits != 15:
+            params.append("server_max_window_bits=%d" % self.windowBits)
+        return "; ".join(params)
+
+
+    def compress(self, buf):
+        """
+        Compress a message.
+        """
+        if self._compressor is None or not self.contextTakeover:
+            self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                                zlib.DEFLATED, -self.windowBits)
+        buf = self._compressor.compress(buf) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return buf[:-len(_DEFLATE_TAIL)]
+
+
+    def decompress(self, buf, maxSize=None):
+        """
+        Decompress a message.
+
+        @raise _WSException: The decompressed message exceeds the maximum size.
+        """
+        if maxSize is None:
+            return self._decompressor.decompress(buf + _DEFLATE_TAIL)
+        buf = self._decompressor.decompress(buf + _DEFLATE_TAIL, maxSize + 1)
+        if len(buf) > maxSize:
+            raise _WSException("Message exceeds the maximum size (%d bytes)" % maxSize, _CLOSE_MESSAGE_TOO_BIG)
+        return buf
+
+
+
+def _negotiateDeflate(header, contextTakeover=False, minSize=0):
+    """
+    Accept the first acceptable permessage-deflate offer of a client.
+
+    @type header: C{str}
+    @param header: The Sec-WebSocket-Extensions request header.
+
+    @type contextTakeover: C{bool}
+    @param contextTakeover: Keep the compression context between messages,
+        unless the client requests otherwise.
+
+    @type minSize: C{int}
+    @param minSize: Messages smaller than this are not compressed.
+
+    @rtype: L{_PerMessageDeflate} or C{None}
+    @return: The extension state, or C{None} if nothing was accepted.
+    """
+    if not header:
+        return None
+
+    for offer in header.split(","):
+        params = [param.strip() for param in offer.split(";")]
+        if params[0] != "permessage-deflate":
+            continue
+
+        takeover = contextTakeover
+        windowBits = 15
+        acceptable = True
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            name, value = name.strip(), value.strip().strip('"')
+            if name == "server_no_context_takeover":
+                takeover = False
+            elif name == "server_max_window_bits":
+                # Raw deflate with a window of 8 bits is not supported by zlib.
+                if not value.isdigit() or not 9 <= int(value) <= 15:
+                    acceptable = False
+                else:
+                    windowBits = int(value)
+            elif name not in ("client_no_context_takeover", "client_max_window_bits"):
+                acceptable = False
+
+        if acceptable:
+            return _PerMessageDeflate(takeover, windowBits, minSize)
+
+    return None
+
+
+
 # Authentication for WS.
 
 # The GUID for WebSockets, from RFC 6455.
@@ -114,15 +284,79 @@ def _mask(buf, key):
     """
 
     # This is super-secure, I promise~
-    key = [ord(i) for i in key]
-    buf = list(buf)
-    for i, char in enumerate(buf):
-        buf[i] = chr(ord(char) ^ key[i % 4])
-    return "".join(buf)
+    length = len(buf)
+    if length == 0:
+        return ""
+    if numpy is not None and length >= _NUMPY_MASK_SIZE:
+        return _maskNumpy(buf, key)
+    return _maskInteger(buf, key)
 
 
 
-def _makeFrame(buf, _opcode=_CONTROLS.NORMAL):
+# Below this size the overhead of creating arrays exceeds the benefit.
+_NUMPY_MASK_SIZE = 128
+
+
+
+def _maskInteger(buf, key):
+    """
+    Mask a buffer by XOR of the whole buffer, and the repeated key, as one
+    (arbitrary precision) integer.
+    """
+    length = len(buf)
+    key = (key * (length // 4 + 1))[:length]
+    masked = int(hexlify(buf), 16) ^ int(hexlify(key), 16)
+    return unhexlify("%0*x" % (length * 2, masked))
+
+
+
+def _maskNumpy(buf, key):
+    """
+    Mask a buffer by vector XOR of 32-bit words with the key.
+    """
+    words = len(buf) // 4
+    masked = numpy.frombuffer(buf, dtype=numpy.uint32, count=words)
+    masked = masked ^ numpy.frombuffer(key, dtype=numpy.uint32)[0]
+    tail = buf[words * 4:]
+    if tail:
+        return masked.tostring() + _maskInteger(tail, key)
+    return masked.tostring()
+
+
+
+def _makeHeader(bufferLength, _opcode=_CONTROLS.NORMAL, _compressed=False):
+    """
+    Make the header of a frame.
+
+    The header is built separately so that the payload can be written after
+    it without being copied into a single string.
+
+    @type bufferLength: C{int}
+    @param bufferLength: The length of the payload.
+
+    @type _opcode: C{_CONTROLS}
+    @param _opcode: Which type of frame to create.
+
+    @type _compressed: C{bool}
+    @param _compressed: Set the flag (RSV1) of a compressed message.
+
+    @rtype: C{str}
+    @return: A packed header.
+    """
+    # Always make a final packet.
+    header = 0x80 | _opcodeForType[_opcode]
+    if _compressed:
+        header |= 0x40
+
+    if bufferLength > 0xffff:
+        return pack(">BBQ", header, 0x7f, bufferLength)
+    elif bufferLength > 0x7d:
+        return pack(">BBH", header, 0x7e, bufferLength)
+    return pack(">BB", header, bufferLength)
+
+
+
+def _makeFrame(buf, _opcode=_CONTROLS.NORMAL, _compressed=False):
     """
     Make a frame.
 
@@ -135,49 +369,146 @@ def _makeFrame(buf, _opcode=_CONTROLS.NORMAL):
     @type _opcode: C{_CONTROLS}
     @param _opcode: Which type of frame to create.
 
+    @type _compressed: C{bool}
+    @param _compressed: Set the flag (RSV1) of a compressed message.
+
     @rtype: C{str}
     @return: A packed frame.
     """
-    bufferLength = len(buf)
+    return _makeHeader(len(buf), _opcode, _compressed) + buf
 
-    if bufferLength > 0xffff:
-        length = "\x7f%s" % pack(">Q", bufferLength)
-    elif bufferLength > 0x7d:
-        length = "\x7e%s" % pack(">H", bufferLength)
-    else:
-        length = chr(bufferLength)
 
-    # Always make a normal packet.
-    header = chr(0x80 | _opcodeForType[_opcode])
-    frame = "%s%s%s" % (header, length, buf)
-    return frame
 
+class _FrameParser(object):
+    """
+    Incremental parser of frames received from a client.
 
+    Received data is appended to a buffer and parsed from a cursor, the state
+    of a partially received frame is kept between calls so that the header of
+    a frame is parsed only once, and the buffer is only compacted after frames
+    have been consumed. Fragmented messages are reassembled.
 
-def _parseFrames(buf):
+    @ivar compression: Permit the flag (RSV1) of compressed messages.
+
+    @ivar maxMessageSize: The maximum size of a message (including all of its
+        fragments), or C{None} for no limit.
     """
-    Parse frames in a highly compliant manner.
 
-    @type buf: C{str}
-    @param buf: A buffer of bytes.
+    def __init__(self, compression=False, maxMessageSize=None):
+        self.compression = compression
+        self.maxMessageSize = maxMessageSize
+        self._buffer = bytearray()
+        self._offset = 0
+        # The parsed header of the current frame (opcode, fin, compressed,
+        # header size, payload length, key).
+        self._frame = None
+        # The fragments of the current message, its opcode and compressed flag.
+        self._fragments = []
+        self._fragmentsSize = 0
+        self._message = None
+
+
+    def pending(self):
+        """
+        Return the received data that has not yet been parsed as frames.
+        """
+        return str(self._buffer[self._offset:])
 
-    @rtype: C{list}
-    @return: A list of frames.
-    """
-    start = 0
-    frames = []
 
-    while True:
+    def feed(self, data):
+        """
+        Parse the data received so far.
+
+        @type data: C{str}
+        @param data: The received bytes.
+
+        @rtype: C{list}
+        @return: A list of complete messages and control frames as tuples of
+            opcode, data and compressed flag.
+
+        @raise _WSException: The frames are invalid or too large.
+        """
+        self._buffer.extend(data)
+        frames = []
+
+        while True:
+            if self._frame is None:
+                self._frame = self._parseHeader()
+                if self._frame is None:
+                    break
+
+            opcode, fin, compressed, size, length, key = self._frame
+            start = self._offset + size
+            if len(self._buffer) - start < length:
+                break
+
+            data = memoryview(self._buffer)[start:start + length].tobytes()
+            self._offset = start + length
+            self._frame = None
+
+            if key is not None:
+                data = _mask(data, key)
+
+            if opcode == _CONTROLS.CLOSE:
+                if len(data) >= 2:
+                    # Gotta unpack the opcode and return usable data here.
+                    data = unpack(">H", data[:2])[0], data[2:]
+                else:
+                    # No reason given; use generic data.
+                    data = 1000, "No reason given"
+                frames.append((opcode, data, False))
+
+            elif opcode in (_CONTROLS.PING, _CONTROLS.PONG):
+                frames.append((opcode, data, False))
+
+            elif fin and opcode != _CONTROLS.CONTINUATION:
+                # Business as usual, an unfragmented message.
+                frames.append((opcode, data, compressed))
+
+            else:
+                if opcode != _CONTROLS.CONTINUATION:
+                    self._message = (opcode, compressed)
+                self._fragments.append(data)
+                self._fragmentsSize += len(data)
+                if fin:
+                    opcode, compressed = self._message
+                    frames.append((opcode, "".join(self._fragments), compressed))
+                    self._fragments = []
+                    self._fragmentsSize = 0
+                    self._message = None
+
+        # Compact the buffer only after frames have been consumed.
+        if self._offset > 0:
+            del self._buffer[:self._offset]
+            self._offset = 0
+
+        return frames
+
+
+    def _parseHeader(self):
+        """
+        Parse the header of the next frame.
+
+        @return: The header as a tuple of opcode, FIN flag, compressed flag,
+            header size, payload length and masking key, or C{None} if
+            incomplete.
+        """
+        buf = self._buffer
+        start = self._offset
+        available = len(buf) - start
+
         # If there's not at least two bytes in the buffer, bail.
-        if len(buf) - start < 2:
-            break
+        if available < 2:
+            return None
 
-        # Grab the header. This single byte holds some flags nobody cares
-        # about, and an opcode which nobody cares about.
-        header = ord(buf[start])
-        if header & 0x70:
+        # Grab the header. This single byte holds the FIN flag, the reserved
+        # flags and an opcode.
+        header = buf[start]
+        if header & (0x30 if self.compression else 0x70):
             # At least one of the reserved flags is set. Pork chop sandwiches!
             raise _WSException("Reserved flag in frame (%d)" % header)
+        fin = bool(header & 0x80)
+        compressed = bool(header & 0x40)
 
         # Get the opcode, and translate it to a local enum which we actually
         # care about.
@@ -189,7 +520,7 @@ def _parseFrames(buf):
 
         # Get the payload length and determine whether we need to look for an
         # extra length.
-        length = ord(buf[start + 1])
+        length = buf[start + 1]
         masked = length & 0x80
         length &= 0x7f
 
@@ -200,93 +531,193 @@ def _parseFrames(buf):
 
         # Extra length fields.
         if length == 0x7e:
-            if len(buf) - start < 4:
-                break
-
-            length = buf[start + 2:start + 4]
-            length = unpack(">H", length)[0]
+            if available < 4:
+                return None
+            length = unpack_from(">H", buf, start + 2)[0]
             offset += 2
         elif length == 0x7f:
-            if len(buf) - start < 10:
-                break
-
+            if available < 10:
+                return None
             # Protocol bug: The top bit of this long long *must* be cleared;
-            # that is, it is expected to be interpreted as signed. That's
-            # fucking stupid, if you don't mind me saying so, and so we're
-            # interpreting it as unsigned anyway. If you wanna send exabytes
-            # of data down the wire, then go ahead!
-            length = buf[start + 2:start + 10]
-            length = unpack(">Q", length)[0]
+            # we're interpreting it as unsigned anyway, the maximum message
+            # size protects us from exabytes of data.
+            length = unpack_from(">Q", buf, start + 2)[0]
             offset += 8
 
+        if opcode in (_CONTROLS.CLOSE, _CONTROLS.PING, _CONTROLS.PONG):
+            # 5.5 Control frames must not be fragmented or exceed 125 bytes.
+            if not fin or length > 0x7d:
+                raise _WSException("Invalid control frame (%d bytes)" % length)
+            # 7.2 of RFC 7692, the compressed flag is only valid on the first
+            # frame of a data message.
+            if compressed:
+                raise _WSException("Compressed flag in control frame")
+        elif opcode == _CONTROLS.CONTINUATION:
+            if self._message is None:
+                raise _WSException("Continuation frame without a message")
+            if compressed:
+                raise _WSException("Compressed flag in continuation frame")
+        elif self._message is not None:
+            raise _WSException("New message before the previous message is complete")
+
+        if self.maxMessageSize is not None:
+            if self._fragmentsSize + length > self.maxMessageSize:
+                raise _WSException("Message exceeds the maximum size (%d bytes)" % self.maxMessageSize,
+                                   _CLOSE_MESSAGE_TOO_BIG)
+
+        key = None
         if masked:
-            if len(buf) - (start + offset) < 4:
+            if available - offset < 4:
                 # This is not strictly necessary, but it's more explicit so
                 # that we don't create an invalid key.
-                break
-
-            key = buf[start + offset:start + offset + 4]
+                return None
+            key = str(buf[start + offset:start + offset + 4])
             offset += 4
 
-        if len(buf) - (start + offset) < length:
-            break
+        return opcode, fin, compressed, offset, length, key
 
-        data = buf[start + offset:start + offset + length]
 
-        if masked:
-            data = _mask(data, key)
 
-        if opcode == _CONTROLS.CLOSE:
-            if len(data) >= 2:
-                # Gotta unpack the opcode and return usable data here.
-                data = unpack(">H", data[:2])[0], data[2:]
-            else:
-                # No reason given; use generic data.
-                data = 1000, "No reason given"
+def _parseFrames(buf, compression=False):
+    """
+    Parse frames in a highly compliant manner.
 
-        frames.append((opcode, data))
-        start += offset + length
+    @type buf: C{str}
+    @param buf: A buffer of bytes.
 
-    return frames, buf[start:]
+    @type compression: C{bool}
+    @param compression: Permit the flag (RSV1) of compressed messages.
+
+    @rtype: C{tuple}
+    @return: A list of frames as tuples of opcode, data and compressed flag,
+        and the remaining bytes of an incomplete frame.
+    """
+    parser = _FrameParser(compression)
+    frames = parser.feed(buf)
+    return frames, parser.pending()
 
 
 
+@implementer(IPushProducer)
 class _WebSocketsProtocol(ProtocolWrapper):
     """
     Protocol which wraps another protocol to provide a WebSockets transport
     layer.
+
+    The protocol registers itself as a streaming producer with the transport
+    and relays flow control to a producer registered by the wrapped protocol,
+    so that the wrapped protocol can stop writing while the client is behind.
+
+    The buffer size of the transport is set to the high watermark of the
+    factory, so the transport pauses the protocol once the pending bytes reach
+    the high watermark and resumes it when they have all been written out.
+    While paused, the protocol resumes as soon as the pending bytes fall to the
+    low watermark, if the transport exposes its buffer (see L{_pendingBytes}).
+
+    @ivar paused: C{True} while the transport has more pending bytes than it
+        is willing to buffer.
+
+    @ivar drainInterval: The interval (in seconds) to check the pending bytes
+        of the transport while paused.
     """
-    _buffer = None
+    _parser = None
+    _producer = None
+    _drainCall = None
     codec = None
+    deflate = None
+    paused = False
+    drainInterval = 0.01
 
 
     def connectionMade(self):
         """
-        Log the new connection and initialize the buffer list.
+        Log the new connection, initialize the frame parser and register for
+        flow control with the transport.
         """
         ProtocolWrapper.connectionMade(self)
         log.msg("Opening connection with %s" % self.transport.getPeer())
-        self._buffer = []
+        self._parser = _FrameParser(self.deflate is not None, self.factory.maxMessageSize)
+
+        # The transport pauses its producer when the pending bytes exceed
+        # its buffer size and resumes it once they have all been written out.
+        try:
+            self.transport.registerProducer(self, True)
+        except RuntimeError:
+            # The HTTP channel is still registered as the producer.
+            self.transport.unregisterProducer()
+            self.transport.registerProducer(self, True)
+        if self.factory.highWatermark is not None and hasattr(self.transport, "bufferSize"):
+            self.transport.bufferSize = self.factory.highWatermark
+
 
+    def connectionLost(self, reason):
+        """
+        Stop checking the pending bytes of the transport.
+        """
+        if self._drainCall is not None:
+            self._drainCall.cancel()
+            self._drainCall = None
+        ProtocolWrapper.connectionLost(self, reason)
+
+
+    def _pendingBytes(self):
+        """
+        Count the bytes written to the transport but not yet sent.
+
+        This is the only use of the private buffer of a TCP transport
+        (L{twisted.internet.abstract.FileDescriptor}), any other transport
+        is resumed by itself once all the pending bytes are written out.
+
+        @rtype: C{int}
+        @return: The number of pending bytes, or C{None} if the transport does
+            not expose its buffer (ie a TLS transport).
+        """
+        transport = self.transport
+        try:
+            return len(transport.dataBuffer) - transport.offset + transport._tempDataLen
+        except (AttributeError, TypeError):
+            return None
+
+
+    def _checkDrain(self):
+        """
+        Resume the wrapped producer if the pending bytes fell to the low
+        watermark, otherwise check again later.
+        """
+        self._drainCall = None
+        pending = self._pendingBytes()
+        if pending is None:
+            return
+        if pending <= self.factory.lowWatermark:
+            self.resumeProducing()
+        else:
+            self._drainCall = reactor.callLater(self.drainInterval, self._checkDrain)
 
-    def _parseFrames(self):
+
+    def _parseFrames(self, data):
         """
         Find frames in incoming data and pass them to the underlying protocol.
         """
         try:
-            frames, rest = _parseFrames("".join(self._buffer))
-        except _WSException:
+            frames = self._parser.feed(data)
+        except _WSException as e:
             # Couldn't parse all the frames, something went wrong, let's bail.
             log.err()
-            self.loseConnection()
+            self.loseConnection(e.code, str(e))
             return
 
-        self._buffer[:] = [rest]
-
         for frame in frames:
-            opcode, data = frame
-            if opcode == _CONTROLS.NORMAL:
-                # Business as usual. Decode the frame, if we have a decoder.
+            opcode, data, compressed = frame
+            if opcode in (_CONTROLS.NORMAL, _CONTROLS.BINARY):
+                # Business as usual. Decompress and decode the frame, if we
+                # have a decoder.
+                if compressed:
+                    try:
+                        data = self.deflate.decompress(data, self.factory.maxMessageSize)
+                    except _WSException as e:
+                        log.err()
+                        self.loseConnection(e.code, str(e))
+                        return
                 if self.codec:
                     data = _decoders[self.codec](data)
                 # Pass the frame to the underlying protocol.
@@ -308,26 +739,94 @@ class _WebSocketsProtocol(ProtocolWrapper):
 
     def _sendFrames(self, frames):
         """
-        Send all pending frames.
+        Send all pending frames with a single vectored write.
 
         @param frames: A list of byte strings to send.
         @type frames: C{list}
         """
+        seq = []
         for frame in frames:
-            # Encode the frame before sending it.
-            if self.codec:
-                frame = _encoders[self.codec](frame)
-            packet = _makeFrame(frame)
-            self.transport.write(packet)
+            seq.extend(self.prepareFrame(frame))
+        self.transport.writeSequence(seq)
 
 
-    def dataReceived(self, data):
+    def frameKey(self):
         """
-        Append the data to the buffer list and parse the whole.
+        Identify the encoding applied by L{prepareFrame}.
+
+        Connections with equal keys produce identical frames for identical
+        data, so a prepared frame may be shared between them.
+
+        @rtype: hashable
+        @return: A key for the frame encoding of this connection, or C{None}
+            if frames depend on previous frames and must not be shared.
         """
-        self._buffer.append(data)
+        if self.deflate is None:
+            return self.codec
+        deflateKey = self.deflate.key()
+        if deflateKey is None:
+            return None
+        return (self.codec, deflateKey)
 
-        self._parseFrames()
+
+    def prepareFrame(self, data):
+        """
+        Encode and frame data without sending it.
+
+        @type data: C{str}
+        @param data: A buffer of bytes.
+
+        @rtype: C{tuple}
+        @return: The packed header and the payload of the frame, suitable
+            for L{writePreparedFrame}.
+        """
+        # Encode the frame before sending it.
+        if self.codec:
+            data = _encoders[self.codec](data)
+        compressed = self.deflate is not None and len(data) >= self.deflate.minSize
+        if compressed:
+            data = self.deflate.compress(data)
+        if self.codec in _binaryCodecs:
+            return _makeHeader(len(data), _CONTROLS.BINARY, compressed), data
+        return _makeHeader(len(data), _CONTROLS.NORMAL, compressed), data
+
+
+    def prepareBinaryFrame(self, parts):
+        """
+        Frame binary data without encoding or joining it.
+
+        The codec is not applied, so this must only be used by protocols
+        that know the client accepts binary messages.
+
+        @type parts: C{list}
+        @param parts: Buffers of bytes sent as a single binary message.
+
+        @rtype: C{tuple}
+        @return: The packed header and the parts of the payload of the frame,
+            suitable for L{writePreparedFrame}.
+        """
+        length = sum(len(part) for part in parts)
+        if self.deflate is not None and length >= self.deflate.minSize:
+            data = self.deflate.compress("".join(parts))
+            return _makeHeader(len(data), _CONTROLS.BINARY, True), data
+        return (_makeHeader(length, _CONTROLS.BINARY),) + tuple(parts)
+
+
+    def writePreparedFrame(self, frame):
+        """
+        Write a frame built by L{prepareFrame} to the transport.
+
+        @type frame: C{tuple}
+        @param frame: The packed header and the payload (or its parts) of the frame.
+        """
+        self.transport.writeSequence(frame)
+
+
+    def dataReceived(self, data):
+        """
+        Parse the data incrementally.
+        """
+        self._parseFrames(data)
 
 
     def write(self, data):
@@ -348,7 +847,64 @@ class _WebSocketsProtocol(ProtocolWrapper):
         self._sendFrames(data)
 
 
-    def loseConnection(self):
+    def registerProducer(self, producer, streaming):
+        """
+        Register a producer of the wrapped protocol to be paused and resumed
+        along with this protocol.
+
+        Only streaming producers are supported.
+        """
+        if not streaming:
+            raise ValueError("WebSockets only supports streaming producers")
+        self._producer = producer
+        if self.paused:
+            producer.pauseProducing()
+
+
+    def unregisterProducer(self):
+        """
+        Unregister the producer of the wrapped protocol.
+        """
+        self._producer = None
+
+
+    def pauseProducing(self):
+        """
+        The transport has too many pending bytes, pause the wrapped producer.
+        """
+        if self.paused:
+            return
+        self.paused = True
+        if self._producer is not None:
+            self._producer.pauseProducing()
+        if self.factory.lowWatermark and self._pendingBytes() is not None:
+            self._drainCall = reactor.callLater(self.drainInterval, self._checkDrain)
+
+
+    def resumeProducing(self):
+        """
+        The transport has written its pending bytes, resume the wrapped
+        producer.
+        """
+        if self._drainCall is not None:
+            self._drainCall.cancel()
+            self._drainCall = None
+        if not self.paused:
+            return
+        self.paused = False
+        if self._producer is not None:
+            self._producer.resumeProducing()
+
+
+    def stopProducing(self):
+        """
+        The transport is going away, stop the wrapped producer.
+        """
+        if self._producer is not None:
+            self._producer.stopProducing()
+
+
+    def loseConnection(self, code=None, reason=""):
         """
         Close the connection.
 
@@ -358,11 +914,20 @@ class _WebSocketsProtocol(ProtocolWrapper):
         then we might not see their last message, but since their last message
         should, according to the spec, be a simple acknowledgement, it
         shouldn't be a problem.
+
+        @type code: C{int}
+        @param code: The optional status code of the closing frame.
+
+        @type reason: C{str}
+        @param reason: The reason for closing, if a status code is specified.
         """
         # Send a closing frame. It's only polite. (And might keep the browser
         # from hanging.)
         if not self.disconnecting:
-            frame = _makeFrame("", _opcode=_CONTROLS.CLOSE)
+            payload = ""
+            if code is not None:
+                payload = pack(">H", code) + reason[:0x7b]
+            frame = _makeFrame(payload, _opcode=_CONTROLS.CLOSE)
             self.transport.write(frame)
 
             ProtocolWrapper.loseConnection(self)
@@ -376,8 +941,33 @@ class _WebSocketsFactory(WrappingFactory):
 
     This factory does not provide the HTTP headers required to perform a
     WebSockets handshake; see C{WebSocketsResource}.
+
+    @ivar highWatermark: The buffer size of the transport, the number of bytes
+        pending at which protocols are paused, or C{None} to keep the buffer
+        size of the transport.
+
+    @ivar lowWatermark: The number of bytes pending in the transport at which
+        paused protocols are resumed (if the transport exposes its buffer),
+        otherwise they are resumed once all the pending bytes are written.
+
+    @ivar deflate: C{True} to accept the permessage-deflate extension.
+
+    @ivar deflateContextTakeover: C{True} to keep the compression context
+        between messages (unless a client requests otherwise). Compressed
+        frames can then not be shared between connections.
+
+    @ivar deflateMinSize: Messages smaller than this are not compressed.
+
+    @ivar maxMessageSize: The maximum size of a received message, or C{None}
+        for no limit.
     """
     protocol = _WebSocketsProtocol
+    maxMessageSize = 4 * 1024 * 1024
+    highWatermark = 64 * 1024
+    lowWatermark = 16 * 1024
+    deflate = False
+    deflateContextTakeover = False
+    deflateMinSize = 128
 
 
 
@@ -396,8 +986,18 @@ class WebSocketsResource(object):
     """
     isLeaf = True
 
-    def __init__(self, factory):
+    def __init__(self, factory, highWatermark=64 * 1024, lowWatermark=16 * 1024,
+                 deflate=False, deflateContextTakeover=False, deflateMinSize=128,
+                 maxMessageSize=4 * 1024 * 1024):
+        if highWatermark is not None and lowWatermark > highWatermark:
+            raise ValueError("Low watermark exceeds the high watermark")
         self._factory = _WebSocketsFactory(factory)
+        self._factory.maxMessageSize = maxMessageSize
+        self._factory.highWatermark = highWatermark
+        self._factory.lowWatermark = lowWatermark
+        self._factory.deflate = deflate
+        self._factory.deflateContextTakeover = deflateContextTakeover
+        self._factory.deflateMinSize = deflateMinSize
 
 
     def getChildWithDefault(self, name, request):
@@ -474,20 +1074,37 @@ class WebSocketsResource(object):
         # We probably should remove this altogether, but I'd rather leave it
         # because it will prove to be a useful reference if/when extensions
         # are added, and it *does* work as advertised.
-        codec = request.getHeader("Sec-WebSocket-Protocol")
-
-        if codec == 'undefined':
-            codec = None
-
-        if codec:
-            if codec not in _encoders or codec not in _decoders:
-                log.msg("Codec %s is not implemented" % codec)
+        #
+        # Clients may offer several codecs in order of preference, so select
+        # the first one that is implemented.
+        codec = None
+        codecs = request.getHeader("Sec-WebSocket-Protocol")
+
+        if codecs == 'undefined':
+            codecs = None
+
+        if codecs:
+            for offered in codecs.split(","):
+                offered = offered.strip()
+                if offered in _encoders and offered in _decoders:
+                    codec = offered
+                    break
+            else:
+                log.msg("Codec %s is not implemented" % codecs)
                 failed = True
 
         if failed:
             request.setResponseCode(400)
             return ""
 
+        # Extensions are optional, offers that are not acceptable are ignored.
+        deflate = None
+        if self._factory.deflate:
+            deflate = _negotiateDeflate(
+                request.getHeader("Sec-WebSocket-Extensions"),
+                self._factory.deflateContextTakeover,
+                self._factory.deflateMinSize)
+
         # Create the protocol. This could fail, in which case we deliver an
         # error status. Status 502 was decreed by glyph; blame him.
         protocol = self._factory.buildProtocol(request.transport.getPeer())
@@ -510,6 +1127,10 @@ class WebSocketsResource(object):
             request.setHeader("Sec-WebSocket-Protocol", codec)
         if codec:
             protocol.codec = codec
+        # 4.2.2.5.6 Optional extension declaration
+        if deflate is not None:
+            request.setHeader("Sec-WebSocket-Extensions", deflate.response())
+            protocol.deflate = deflate
 
         # Provoke request into flushing headers and finishing the handshake.
         request.write("")
@@ -0,0 +1,129 @@
+# coding=UTF-8
+'''
+Utility functions for array (ie waveform) values.
+
+The 'numpy' library is optional, use available() to check for support.
+
+An array is encoded as a binary message with a JSON header that describes
+the array, followed by the raw bytes of the array (in C order):
+    magic (4s), header length (I), header, padding to 8 bytes, array bytes
+
+The header is an object with the 'url', the 'data' (without the 'value'),
+the 'dtype' (ie '<f8') and the 'shape' (ie [1000]) of the array, and any
+additional fields (ie the 'sequence' of an update sent between processes).
+'''
+
+from __future__ import absolute_import
+
+from struct import Struct
+
+from . import json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_MAGIC = "CSWA"
+
+_PREFIX = Struct("<4sI")
+
+_ALIGN = 8
+
+# Types supported by JS typed arrays, other arrays are not encoded as binary.
+_DTYPES = frozenset(('|i1', '|u1', '<i2', '<u2', '<i4', '<u4', '<f4', '<f8'))
+
+
+def available():
+    return numpy is not None
+
+
+def isArray(obj):
+    return numpy is not None and isinstance(obj, numpy.ndarray)
+
+
+def isBinary(data):
+    '''
+    Return True if the data has an array value that can be encoded as binary.
+    '''
+    if not isinstance(data, dict):
+        return False
+    value = data.get("value")
+    return isArray(value) and value.dtype.str in _DTYPES
+
+
+def equal(a, b):
+    '''
+    Return True if the values are equal, the values may be arrays.
+    '''
+    if a is b:
+        return True
+    if isArray(a) or isArray(b):
+        return numpy.array_equal(a, b)
+    return a == b
+
+
+def decimate(value, points):
+    '''
+    Return the value reduced to at most the specified number of points.
+
+    An array is divided into points/2 intervals and the minimum and maximum
+    of each interval are kept, so peaks are not lost. A list is sampled.
+    '''
+    if len(value) <= points:
+        return value
+    if not isArray(value) or value.ndim != 1:
+        step = -(-len(value) // points)
+        return value[::step]
+    intervals = points // 2
+    size = len(value) // intervals
+    # The remainder is included in the last interval.
+    envelope = numpy.empty(intervals * 2, dtype=value.dtype)
+    envelope[0::2] = numpy.minimum.reduceat(value, numpy.arange(0, intervals * size, size))
+    envelope[1::2] = numpy.maximum.reduceat(value, numpy.arange(0, intervals * size, size))
+    return envelope
+
+
+def isEncoded(message):
+    '''
+    Return True if the message is an encoded array (see encode).
+    '''
+    return message[:len(_MAGIC)] == _MAGIC
+
+
+def encode(url, data, **fields):
+    '''
+    Return the data with an array value encoded as a list of
+    byte strings, which are sent as a single binary message.
+    '''
+    value = numpy.ascontiguousarray(data["value"])
+    header = dict(data)
+    del header["value"]
+    fields.update(url=url, data=header, dtype=value.dtype.str, shape=value.shape)
+    header = json.stringify(fields)
+    length = _PREFIX.size + len(header)
+    padding = " " * (-length % _ALIGN)
+    # The bytes of the array are copied once, not converted per element.
+    return [ _PREFIX.pack(_MAGIC, len(header) + len(padding)) + header + padding, value.tobytes() ]
+
+
+def decode(message):
+    '''
+    Return the URL and the data of a binary message, the value is an array.
+    '''
+    header = decodeHeader(message)
+    return header["url"], header["data"]
+
+
+def decodeHeader(message):
+    '''
+    Return the header of a binary message, including any additional fields,
+    with the array as the 'value' of the 'data'.
+    '''
+    magic, length = _PREFIX.unpack_from(message, 0)
+    if magic != _MAGIC:
+        raise ValueError("Message is not an encoded array")
+    header = json.parse(message[_PREFIX.size:_PREFIX.size + length])
+    value = numpy.frombuffer(message, dtype=header["dtype"], offset=_PREFIX.size + length)
+    header["data"]["value"] = value.reshape(header["shape"])
+    return header
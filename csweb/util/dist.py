@@ -5,12 +5,24 @@ Utility classes for multiplexing Protocols.
 
 from ..util import log
 
+from itertools import count
+
 from twisted.internet import protocol
 
 _TRACE = log.TRACE
 _DEBUG = log.DEBUG
 _WARN = log.WARN
 
+# Sequence numbers are unique for all distributed data in this process.
+_sequence = count(1)
+
+
+def nextSequence():
+    '''
+    Return the next update sequence number.
+    '''
+    return next(_sequence)
+
 
 class DistributingProtocolFactoryCanceller:
 
@@ -51,11 +63,22 @@ class DistributingProtocol(protocol.Protocol):
         self._address = address
         self._protocols = protocols
         self._connected = False
+        self._encoded = {}
+        self._encodedData = None
+        self._previousEncoded = {}
+        self._lastData = None
+        self._lastSequence = None
         self.transport = None
     
 
     def dataReceived(self, data):
         log.msg('DistributingProtocol: dataReceived: Data type: %(t)s', t=type(data), logLevel=_TRACE)
+        # Encodings of the previous data are no longer valid.
+        self._previousEncoded = self._encoded
+        self._encoded = {}
+        self._encodedData = data
+        self._lastData = data
+        self._lastSequence = nextSequence()
         for protocol in self._protocols:
             log.msg('DistributingProtocol: dataReceived: Distribute to %(p)s', p=protocol, logLevel=_TRACE)
             protocol.dataReceived(data)
@@ -74,7 +97,7 @@ class DistributingProtocol(protocol.Protocol):
         log.msg('DistributingProtocol: makeConnection: Transport is %(t)s', t=transport, logLevel=_TRACE)
         for protocol in self._protocols:
             log.msg('DistributingProtocol: makeConnection: Distribute to %(p)s', p=protocol, logLevel=_TRACE)
-            protocol.makeConnection(DistributingTransport(transport))
+            protocol.makeConnection(DistributingTransport(transport, self))
     
 
     def connectionMade(self):
@@ -85,13 +108,57 @@ class DistributingProtocol(protocol.Protocol):
             protocol.connectionMade()
 
 
+    def lastData(self):
+        '''
+        Return the data most recently distributed, or None if no data has been distributed.
+        '''
+        return self._lastData
+
+
+    def lastSequence(self):
+        '''
+        Return the sequence number of the data most recently distributed, or None.
+        '''
+        return self._lastSequence
+
+
+    def encodedData(self, data, key, encoder):
+        '''
+        Return the encoding, identified by the given key, of the data being distributed.
+
+        The encoder is only called for the first protocol requesting the key,
+        all other protocols receive the same (immutable) result until new data
+        is distributed.
+        '''
+        if data is not self._encodedData:
+            # Data delivered outside of a distribution (ie initial data).
+            self._encoded = {}
+            self._encodedData = data
+        elif key in self._encoded:
+            log.msg('DistributingProtocol: encodedData: Encoding found for key: %(k)s', k=key, logLevel=_TRACE)
+            return self._encoded[key]
+        encoded = encoder()
+        self._encoded[key] = encoded
+        return encoded
+
+
+    def previousEncodedData(self, key):
+        '''
+        Return the encoding, identified by the given key, of the previously distributed data.
+
+        If the previous data was not encoded with the given key then return None.
+        '''
+        return self._previousEncoded.get(key)
+
+
 class DistributingTransport:
     '''
     Transport to properly handle removing protocol from a DistributingProtocol.
     '''
  
-    def __init__(self, transport):
+    def __init__(self, transport, distributor=None):
         self._transport = transport
+        self._distributor = distributor
  
  
     def write(self, data):
@@ -107,6 +174,24 @@ class DistributingTransport:
     def loseConnection(self):
         log.msg("DistributingTransport: loseConnection: Delegate to transport %(t)s", t=self._transport, logLevel=_DEBUG)
         self._transport.loseConnection()
+
+
+    def encodedData(self, data, key, encoder):
+        if self._distributor is None:
+            return encoder()
+        return self._distributor.encodedData(data, key, encoder)
+
+
+    def previousEncodedData(self, key):
+        if self._distributor is None:
+            return None
+        return self._distributor.previousEncodedData(key)
+
+
+    def lastSequence(self):
+        if self._distributor is None:
+            return None
+        return self._distributor.lastSequence()
                 
 
     def getPeer(self):
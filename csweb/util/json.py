@@ -7,6 +7,11 @@ from __future__ import absolute_import
 
 import math, json
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def stringify(obj, sanitize=True):
     if sanitize:
@@ -50,5 +55,9 @@ def _sanitize(obj, level=0):
             result.append(_sanitize(v, level+1))
         return result
 
+    elif numpy is not None and isinstance(obj, (numpy.ndarray, numpy.generic)):
+        # Arrays (and scalars) are converted to (nested) lists of Python types.
+        return _sanitize(obj.tolist(), level)
+
     else:
         raise TypeError("Sanitization of type %s not supported" % (type(obj),))
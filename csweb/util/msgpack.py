@@ -0,0 +1,53 @@
+# coding=UTF-8
+'''
+Utility functions for MessagePack stringify.
+
+The 'msgpack' library is optional, use available() to check for support.
+'''
+
+from __future__ import absolute_import
+
+from struct import pack
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def available():
+    return msgpack is not None
+
+
+def stringify(obj):
+    # Strings are packed with the 'str' type (not 'bin') for JS clients. 
+    return msgpack.packb(obj, use_bin_type=False, default=_default)
+
+
+def parse(obj):
+    return msgpack.unpackb(obj, raw=False)
+
+
+def _default(obj):
+    # Arrays (and scalars) are packed as (nested) lists of Python types.
+    if numpy is not None and isinstance(obj, (numpy.ndarray, numpy.generic)):
+        return obj.tolist()
+    raise TypeError("Packing of type %s not supported" % (type(obj),))
+
+
+def mapHeader(size):
+    '''
+    Return the header of a map with the specified number of entries,
+    the entries must follow as alternating packed keys and values.
+    '''
+    if size < 16:
+        return chr(0x80 | size)
+    elif size < 0x10000:
+        return "\xde" + pack(">H", size)
+    else:
+        return "\xdf" + pack(">I", size)
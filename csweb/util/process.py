@@ -0,0 +1,98 @@
+# coding=UTF-8
+'''
+Utility classes to serve a listening port from multiple worker processes.
+
+The listening socket is created by the parent process and inherited by the
+workers, so the kernel distributes the connections between the workers.
+'''
+
+import os, sys, socket
+
+from ..util import log
+
+from twisted.internet import error, protocol, reactor
+
+_TRACE = log.TRACE
+_DEBUG = log.DEBUG
+_WARN = log.WARN
+
+
+def adoptPort(fileno, factory):
+    '''
+    Listen with the specified factory on the socket inherited from the parent process.
+    '''
+    port = reactor.adoptStreamPort(fileno, socket.AF_INET, factory)
+    # The port uses a duplicate of the file descriptor.
+    os.close(fileno)
+    return port
+
+
+class WorkerPool:
+    '''
+    Start the specified number of worker processes that share the listening port.
+
+    Each worker runs the script with the arguments and the option '--worker-fd'
+    followed by the file descriptor of the listening socket. A worker that
+    exits is restarted after the restart delay (in seconds).
+    '''
+
+    def __init__(self, workers, args, port, interface='', backlog=50, restartDelay=1.0):
+        self._workers = workers
+        self._args = args
+        self._port = port
+        self._interface = interface
+        self._backlog = backlog
+        self._restartDelay = restartDelay
+        self._socket = None
+        self._processes = {}
+        self._stopping = False
+
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self._interface, self._port))
+        self._socket.listen(self._backlog)
+        self._socket.setblocking(False)
+        log.msg("WorkerPool: start: Listening on port %(p)d with %(n)d workers", p=self._port, n=self._workers, logLevel=_DEBUG)
+        for index in range(self._workers):
+            self._spawn(index)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+
+    def stop(self):
+        self._stopping = True
+        for process in self._processes.values():
+            try:
+                process.signalProcess('TERM')
+            except error.ProcessExitedAlready:
+                pass
+
+
+    def workerEnded(self, index, reason):
+        self._processes.pop(index, None)
+        if self._stopping:
+            return
+        log.msg("WorkerPool: workerEnded: Worker %(i)d ended, restart: %(r)s", i=index, r=reason.getErrorMessage(), logLevel=_WARN)
+        reactor.callLater(self._restartDelay, self._spawn, index)
+
+
+    def _spawn(self, index):
+        if self._stopping:
+            return
+        fileno = self._socket.fileno()
+        args = [ sys.executable ] + self._args + [ "--worker-fd", str(fileno) ]
+        childFDs = { 0:0, 1:1, 2:2, fileno:fileno }
+        self._processes[index] = reactor.spawnProcess(_WorkerProcessProtocol(self, index), sys.executable, args, env=os.environ, childFDs=childFDs)
+        log.msg("WorkerPool: _spawn: Worker %(i)d started: %(p)s", i=index, p=self._processes[index], logLevel=_DEBUG)
+
+
+class _WorkerProcessProtocol(protocol.ProcessProtocol):
+
+    def __init__(self, pool, index):
+        self._pool = pool
+        self._index = index
+
+
+    def processEnded(self, reason):
+        self._pool.workerEnded(self._index, reason)
@@ -5,12 +5,64 @@ CSWeb Protocol Request parser utility.
 
 import re
 
+from urlparse import parse_qsl
+
+from . import json
+
+_REQUEST = re.compile(r"^(GET|SUB|UNSUB|OPT) (.*)")
+
+_ACTIONS = ('GET', 'SUB', 'UNSUB', 'OPT')
+
+
 class CSWPRequest():
     '''
     Basic implementation. Much more required as the requests become more complicated.
+
+    The 'UNSUB' action releases the subscription to a URL made by 'SUB'.
+
+    The 'OPT' action sets options of the connection, for example 'OPT delta=true',
+    the options are available as a dictionary.
+
+    A bulk request is a JSON array of action and URL pairs, for example
+    '[["SUB", "epics:PV1"], ["SUB", "epics:PV2"]]', the action is 'BULK'
+    and the requests are available as a list.
     '''
     def __init__(self, data):
-        m = re.match(r"^(GET|SUB) (.*)", data)
+        self.action = None
+        self.url = None
+        self.options = {}
+        self.requests = []
+        if data.startswith('['):
+            self._parseBulk(data)
+            return
+        m = _REQUEST.match(data)
         if m:
-            self.action = m.group(1)
-            self.url = m.group(2)
+            self._setAction(m.group(1), m.group(2))
+
+
+    def _setAction(self, action, url):
+        self.action = action
+        self.url = url
+        if self.action == 'OPT':
+            self.options = dict(parse_qsl(self.url))
+
+
+    def _parseBulk(self, data):
+        try:
+            items = json.parse(data)
+        except ValueError:
+            return
+        if not isinstance(items, list):
+            return
+        for item in items:
+            if not isinstance(item, list) or len(item) != 2:
+                continue
+            action, url = item
+            if action not in _ACTIONS or not isinstance(url, basestring):
+                continue
+            if isinstance(url, unicode):
+                url = url.encode('utf-8')
+            request = CSWPRequest("")
+            request._setAction(str(action), url)
+            self.requests.append(request)
+        self.action = 'BULK'
@@ -0,0 +1,211 @@
+# coding=UTF-8
+'''
+Utility classes for a memory-mapped ring buffer of encoded updates shared between processes.
+
+A single writer (ie the backend process) appends records, each with a sequence
+number, a key (ie the subscription URL) and an encoded payload, and any number
+of readers (ie the front-end processes) follow the records in order. Readers
+get the payloads as buffers of the memory-mapped file without copying them.
+
+The writer never waits for readers, so a reader that falls behind by more
+than the capacity of the ring is overrun and must resynchronize. The records
+read are only valid until validate() is called after they have been used.
+
+The header of the file is followed by the records:
+    magic (4s), version (I), capacity (Q), reserved (Q), head (Q), sequence (Q)
+
+The position of the head is the total number of bytes written, the reserved
+position is the head after the record being written, so a reader can detect
+a record that is being overwritten. A record is aligned to 8 bytes:
+    length (I), sequence (Q), key length (H), key, payload
+
+A record with zero length marks the unused space at the end of the ring.
+The ordering of the stores to the memory-mapped file is guaranteed by the
+x86 (TSO) memory model, other architectures are not supported.
+'''
+
+import os, mmap
+
+from struct import Struct
+
+_MAGIC = "CSWR"
+_VERSION = 1
+
+_HEADER = Struct("<4sIQQQQ")
+_POSITIONS = Struct("<QQQ")
+_POSITIONS_OFFSET = 16
+_HEADER_SIZE = 64
+
+_RECORD = Struct("<IQH")
+_LENGTH = Struct("<I")
+
+_ALIGN = 8
+
+
+def _align(size):
+    return (size + _ALIGN - 1) & ~(_ALIGN - 1)
+
+
+class RingOverrun(Exception):
+    '''
+    The reader has fallen behind the writer and the specified number of records are lost.
+    '''
+
+    def __init__(self, lost):
+        Exception.__init__(self, "Ring buffer overrun, %d records lost" % (lost,))
+        self.lost = lost
+
+
+class RingWriter:
+    '''
+    Write records to a ring buffer of the specified capacity (in bytes) at the specified path.
+
+    An existing file is replaced, readers of the existing file are not affected.
+    '''
+
+    def __init__(self, path, capacity=16*1024*1024):
+        if capacity % _ALIGN != 0 or capacity < 1024:
+            raise ValueError("Capacity (%d) must be a multiple of %d and >= 1024" % (capacity, _ALIGN))
+        self.path = path
+        self._capacity = capacity
+        self._head = 0
+        self._sequence = 0
+        if os.path.exists(path):
+            os.unlink(path)
+        self._file = open(path, "w+b")
+        self._file.truncate(_HEADER_SIZE + capacity)
+        self._mmap = mmap.mmap(self._file.fileno(), _HEADER_SIZE + capacity)
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, _VERSION, capacity, 0, 0, 0)
+
+
+    def sequence(self):
+        '''
+        Return the sequence number of the last record written.
+        '''
+        return self._sequence
+
+
+    def maxPayloadSize(self, key):
+        return self._capacity // 4 - _RECORD.size - len(key)
+
+
+    def publish(self, key, payload):
+        '''
+        Write the record and return the sequence number, or raise ValueError if the payload is too large.
+        '''
+        if len(key) > 0xffff:
+            raise ValueError("Key length (%d) exceeds the maximum (%d)" % (len(key), 0xffff))
+        length = _RECORD.size + len(key) + len(payload)
+        if len(payload) > self.maxPayloadSize(key):
+            raise ValueError("Payload (%d) exceeds the maximum size (%d)" % (len(payload), self.maxPayloadSize(key)))
+        size = _align(length)
+        head = self._head
+        offset = head % self._capacity
+        if self._capacity - offset < size:
+            # Not enough space at the end of the ring, so mark it unused.
+            head += self._capacity - offset
+            offset = 0
+        self._sequence += 1
+        # Readers of the space about to be overwritten must see the reserved position first.
+        _POSITIONS.pack_into(self._mmap, _POSITIONS_OFFSET, head + size, self._head, self._sequence - 1)
+        if head != self._head:
+            _LENGTH.pack_into(self._mmap, _HEADER_SIZE + self._head % self._capacity, 0)
+        start = _HEADER_SIZE + offset
+        _RECORD.pack_into(self._mmap, start, length, self._sequence, len(key))
+        start += _RECORD.size
+        self._mmap[start:start + len(key)] = key
+        start += len(key)
+        self._mmap[start:start + len(payload)] = payload
+        self._head = head + size
+        _POSITIONS.pack_into(self._mmap, _POSITIONS_OFFSET, self._head, self._head, self._sequence)
+        return self._sequence
+
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class RingReader:
+    '''
+    Read the records of the ring buffer at the specified path, starting at the current head.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._capacity, _, _, _ = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Unsupported ring buffer file: %s" % (path,))
+        _, self._position, self._sequence = _POSITIONS.unpack_from(self._mmap, _POSITIONS_OFFSET)
+        self._start = self._position
+        self._startSequence = self._sequence
+
+
+    def sequence(self):
+        '''
+        Return the sequence number of the last record read.
+        '''
+        return self._sequence
+
+
+    def read(self):
+        '''
+        Return the records written since the last read as a list of
+        (sequence, key, payload) tuples, the payloads are buffers.
+
+        Raise RingOverrun if records have been overwritten before being read.
+        '''
+        _, head, _ = _POSITIONS.unpack_from(self._mmap, _POSITIONS_OFFSET)
+        self._start = self._position
+        self._startSequence = self._sequence
+        if head - self._position > self._capacity:
+            self._overrun()
+        records = []
+        position = self._position
+        sequence = self._sequence
+        while position < head:
+            offset = position % self._capacity
+            start = _HEADER_SIZE + offset
+            length, = _LENGTH.unpack_from(self._mmap, start)
+            if length == 0:
+                position += self._capacity - offset
+                continue
+            if length < _RECORD.size or length > self._capacity - offset:
+                # The record must have been overwritten.
+                self.validate()
+                raise ValueError("Invalid record length (%d) at position %d" % (length, position))
+            _, sequence, keyLength = _RECORD.unpack_from(self._mmap, start)
+            start += _RECORD.size
+            key = self._mmap[start:start + keyLength]
+            start += keyLength
+            records.append((sequence, key, buffer(self._mmap, start, length - _RECORD.size - keyLength)))
+            position += _align(length)
+        self.validate()
+        self._position = position
+        self._sequence = sequence
+        return records
+
+
+    def validate(self):
+        '''
+        Raise RingOverrun if any record of the last read may have been overwritten.
+        '''
+        reserved, _, _ = _POSITIONS.unpack_from(self._mmap, _POSITIONS_OFFSET)
+        if reserved - self._start > self._capacity:
+            self._overrun()
+
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+    def _overrun(self):
+        # Skip to the current head, the records since the last read are lost.
+        _, self._position, self._sequence = _POSITIONS.unpack_from(self._mmap, _POSITIONS_OFFSET)
+        lost = self._sequence - self._startSequence
+        self._start = self._position
+        self._startSequence = self._sequence
+        raise RingOverrun(lost)
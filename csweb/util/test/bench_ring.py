@@ -0,0 +1,73 @@
+# coding=UTF-8
+'''
+Benchmark the ring buffer with reader processes over payload sizes from 64 B to 16 KB.
+
+The writer publishes updates for 100 keys as fast as possible while each
+reader process follows the ring and touches every payload. Reports the
+updates per second written, and read per reader, and the overruns per reader.
+
+Usage: python -m csweb.util.test.bench_ring
+'''
+
+import os, time, tempfile
+
+from ..ring import RingWriter, RingReader, RingOverrun
+
+
+def _reader(path, duration, result):
+    reader = RingReader(path)
+    count = 0
+    overruns = 0
+    end = time.time() + duration
+    while time.time() < end:
+        try:
+            records = reader.read()
+            for sequence, key, payload in records:
+                payload[-1]
+            reader.validate()
+            count += len(records)
+        except RingOverrun:
+            overruns += 1
+    os.write(result, "%d %d\n" % (count, overruns))
+    os._exit(0)
+
+
+def _bench(path, size, readers, duration, capacity):
+    writer = RingWriter(path, capacity)
+    payload = os.urandom(size)
+    keys = [ "epics:PV%d" % (n,) for n in range(100) ]
+    results = []
+    for _ in range(readers):
+        r, w = os.pipe()
+        if os.fork() == 0:
+            _reader(path, duration, w)
+        results.append(r)
+    count = 0
+    start = time.time()
+    while time.time() - start < duration:
+        for key in keys:
+            writer.publish(key, payload)
+        count += len(keys)
+    elapsed = time.time() - start
+    read = []
+    for r in results:
+        read.append([ int(v) for v in os.read(r, 100).split() ])
+        os.wait()
+    writer.close()
+    return count / elapsed, [ (n / elapsed, overruns) for n, overruns in read ]
+
+
+def main(sizes=(64, 1024, 16384), readers=(1, 2, 4), duration=1.0, capacity=64*1024*1024):
+    path = os.path.join(tempfile.mkdtemp(), "bench.ring")
+    print "%10s%10s%16s%20s%16s" % ("size (B)", "readers", "written (up/s)", "read (up/s/reader)", "overruns")
+    for size in sizes:
+        for n in readers:
+            written, read = _bench(path, size, n, duration, capacity)
+            rate = sum([ r for r, _ in read ]) / len(read)
+            overruns = sum([ o for _, o in read ]) / float(len(read))
+            print "%10d%10d%16.0f%20.0f%16.1f" % (size, n, written, rate, overruns)
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# coding=UTF-8
+'''
+Tests for util 'arrays'.
+'''
+
+from .. import arrays, json
+
+from twisted.trial import unittest
+
+
+
+class TestArrays(unittest.TestCase):
+
+    if not arrays.available():
+        skip = "NumPy library not available"
+
+
+    def test_encode(self):
+        value = arrays.numpy.arange(12, dtype="<i2").reshape(3, 4)
+        parts = arrays.encode("epics:PV", { "value":value, "severity":0 })
+        # The array follows the header aligned to 8 bytes.
+        self.assertEqual(len(parts[0]) % 8, 0)
+        self.assertEqual(parts[1], value.tobytes())
+        url, data = arrays.decode("".join(parts))
+        self.assertEqual(url, "epics:PV")
+        self.assertEqual(data["severity"], 0)
+        self.assertEqual(data["value"].shape, (3, 4))
+        self.assertTrue(arrays.equal(data["value"], value))
+
+
+    def test_fields(self):
+        message = "".join(arrays.encode("epics:PV", { "value":arrays.numpy.zeros(2) }, sequence=5))
+        self.assertTrue(arrays.isEncoded(message))
+        self.assertFalse(arrays.isEncoded('["DATA"]'))
+        header = arrays.decodeHeader(message)
+        self.assertEqual(header["sequence"], 5)
+        self.assertEqual(list(header["data"]["value"]), [ 0.0, 0.0 ])
+
+
+    def test_is_binary(self):
+        self.assertTrue(arrays.isBinary({ "value":arrays.numpy.zeros(2, dtype="<f4") }))
+        self.assertFalse(arrays.isBinary({ "value":arrays.numpy.zeros(2, dtype="<c16") }))
+        self.assertFalse(arrays.isBinary({ "value":[ 0.0, 0.0 ] }))
+        self.assertFalse(arrays.isBinary(None))
+
+
+    def test_decimate(self):
+        value = arrays.numpy.zeros(1000)
+        value[501] = 5.0
+        value[999] = -1.0
+        result = arrays.decimate(value, 10)
+        self.assertEqual(len(result), 10)
+        # The minimum and maximum of each interval are kept.
+        self.assertEqual(result.tolist(), [ 0.0 ] * 5 + [ 5.0, 0.0, 0.0, -1.0, 0.0 ])
+        self.assertIdentical(arrays.decimate(value, 1000), value)
+        self.assertEqual(arrays.decimate(range(100), 10), range(0, 100, 10))
+
+
+    def test_json(self):
+        value = arrays.numpy.array([ 1.0, float("nan") ])
+        self.assertEqual(json.parse(json.stringify({ "value":value, "count":arrays.numpy.int32(2) })), { "value":[ 1.0, "NaN" ], "count":2 })
@@ -0,0 +1,41 @@
+# coding=UTF-8
+'''
+Tests for utility 'request'.
+'''
+
+from ..request import CSWPRequest
+
+from twisted.trial import unittest
+
+
+
+class TestCSWPRequest(unittest.TestCase):
+
+    def test_subscribe(self):
+        request = CSWPRequest("SUB epics:PV?rate=1")
+        self.assertEqual(request.action, "SUB")
+        self.assertEqual(request.url, "epics:PV?rate=1")
+
+
+    def test_options(self):
+        request = CSWPRequest("OPT delta=true")
+        self.assertEqual(request.action, "OPT")
+        self.assertEqual(request.options, { "delta":"true" })
+
+
+    def test_unsupported(self):
+        request = CSWPRequest("PUT epics:PV")
+        self.assertEqual(request.action, None)
+        self.assertEqual(request.url, None)
+
+
+    def test_bulk(self):
+        request = CSWPRequest('[["SUB", "epics:PV1"], ["GET", "epics:PV2"], ["PUT", "epics:PV3"], "SUB epics:PV4"]')
+        self.assertEqual(request.action, "BULK")
+        self.assertEqual([ (r.action, r.url) for r in request.requests ], [ ("SUB", "epics:PV1"), ("GET", "epics:PV2") ])
+        self.assertIsInstance(request.requests[0].url, str)
+
+
+    def test_bulk_invalid(self):
+        self.assertEqual(CSWPRequest('[["SUB", "epics:PV1"]').action, None)
+        self.assertEqual(CSWPRequest('["SUB"]').requests, [])
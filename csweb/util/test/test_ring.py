@@ -0,0 +1,81 @@
+# coding=UTF-8
+'''
+Tests for utility 'ring'.
+'''
+
+import os
+
+from ..ring import RingWriter, RingReader, RingOverrun
+
+from twisted.trial import unittest
+
+
+
+class TestRing(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+        self.writer = RingWriter(self.path, capacity=1024)
+        self.addCleanup(self.writer.close)
+
+
+    def _reader(self):
+        reader = RingReader(self.path)
+        self.addCleanup(reader.close)
+        return reader
+
+
+    def _read(self, reader):
+        return [ (sequence, key, str(payload)) for sequence, key, payload in reader.read() ]
+
+
+    def test_read(self):
+        self.writer.publish("epics:A", "1")
+        reader = self._reader()
+        self.assertEqual(reader.read(), [])
+        self.writer.publish("epics:B", "22")
+        self.writer.publish("epics:A", "333")
+        records = reader.read()
+        self.assertIsInstance(records[0][2], buffer)
+        self.assertEqual([ (s, k, str(p)) for s, k, p in records ], [ (2, "epics:B", "22"), (3, "epics:A", "333") ])
+        self.assertEqual(reader.sequence(), 3)
+        reader.validate()
+
+
+    def test_wrap(self):
+        reader = self._reader()
+        for n in range(100):
+            payload = str(n) * (n % 7 + 1)
+            self.assertEqual(self.writer.publish("epics:A", payload), n + 1)
+            self.assertEqual(self._read(reader), [ (n + 1, "epics:A", payload) ])
+
+
+    def test_overrun(self):
+        reader = self._reader()
+        for n in range(50):
+            self.writer.publish("epics:A", "x" * 40)
+        error = self.assertRaises(RingOverrun, reader.read)
+        self.assertEqual(error.lost, 50)
+        # The reader continues from the current head.
+        self.writer.publish("epics:A", "y")
+        self.assertEqual(self._read(reader), [ (51, "epics:A", "y") ])
+
+
+    def test_overwritten(self):
+        reader = self._reader()
+        self.writer.publish("epics:A", "x" * 40)
+        records = reader.read()
+        for n in range(20):
+            self.writer.publish("epics:A", "z" * 40)
+        # The records read have been overwritten while being used.
+        error = self.assertRaises(RingOverrun, reader.validate)
+        self.assertEqual(error.lost, 21)
+
+
+    def test_limits(self):
+        self.assertRaises(ValueError, self.writer.publish, "epics:A", "x" * 1024)
+        self.assertRaises(ValueError, RingWriter, self.mktemp(), capacity=1001)
+        path = self.mktemp()
+        with open(path, "wb") as f:
+            f.write("\0" * 128)
+        self.assertRaises(ValueError, RingReader, path)
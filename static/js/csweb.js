@@ -202,6 +202,36 @@ var csweb = {};
 // conveniences such as auto-reconnect
 // and specialized send methods.
 //
+	var isPlainObj = function(obj) {
+		return (obj !== undefined) && (obj !== null) &&
+				(typeof obj === 'object') && (obj.length === undefined);
+	};
+
+	// Typed arrays by the type (dtype) of binary array messages.
+	var arrayTypes = {
+		'|i1':Int8Array, '|u1':Uint8Array, '<i2':Int16Array, '<u2':Uint16Array,
+		'<i4':Int32Array, '<u4':Uint32Array, '<f4':Float32Array, '<f8':Float64Array
+	};
+
+	// Decode a binary array message: 'CSWA', header length (uint32),
+	// JSON header (url, data, dtype, shape), then the bytes of the array.
+	// Returns undefined if the message is not a binary array message.
+	var decodeArray = function(buffer) {
+		if( (buffer.byteLength < 8) || (String.fromCharCode.apply(null, new Uint8Array(buffer, 0, 4)) !== 'CSWA') ) {
+			return undefined;
+		}
+		var length = new DataView(buffer).getUint32(4, true);
+		var header = JSON.parse(String.fromCharCode.apply(null, new Uint8Array(buffer, 8, length)));
+		var record = header.data;
+		record.value = new arrayTypes[header.dtype](buffer, 8 + length);
+		if( header.shape.length !== 1 ) {
+			record.shape = header.shape;
+		}
+		var data = {};
+		data[header.url] = record;
+		return data;
+	};
+
 	var Socket = function(url, protocol) {
 		
 		if( !(this instanceof Socket) ) {
@@ -216,6 +246,8 @@ var csweb = {};
 
 		this._socket = null;
 		this._pending = [];
+		this._records = {};
+		this._requests = [];
 		this._reconnectDelay = Socket.reconnectDelay*1000; // convert seconds to milliseconds
 		this._reconnectAttempts = Socket.reconnectAttempts;
 
@@ -232,6 +264,14 @@ var csweb = {};
 	Socket.autoReconnect = true; 	// Try to auto-reconnect?
 	Socket.reconnectDelay = 5;		// Minimum delay between attempts in seconds (10s, 20s, 40s,...).
 	Socket.reconnectAttempts = 20;	// Maximum number of times to attempt to reconnect socket.
+	Socket.deltaUpdates = true;		// Request only changed properties after the first update.
+	Socket.rateLimit = 0;			// Minimum interval between updates in seconds (ie 1 for slow links).
+
+	// Functions to decode binary messages (ArrayBuffer) by negotiated protocol,
+	// for example with a MessagePack library: decoders['msgpack'] = msgpack.decode;
+	Socket.decoders = {};
+
+	Socket.binaryArrays = (typeof DataView !== 'undefined');	// Request array values (ie waveforms) as typed arrays.
 
 	Socket.CONNECTING = WebSocket.CONNECTING;	//  0 	The connection is not yet open.
 	Socket.OPEN       = WebSocket.OPEN;			//	1 	The connection is open and ready to communicate.
@@ -253,6 +293,7 @@ var csweb = {};
 		}
 
 		this.readyState = this._socket.readyState;
+		this._socket.binaryType = 'arraybuffer';
 
 		var self = this;
 
@@ -278,6 +319,22 @@ var csweb = {};
 		// Reset the auto reconnect properties. //
 		this._reconnectDelay = Socket.reconnectDelay*1000; // convert seconds to milliseconds
 		this._reconnectAttempts = Socket.reconnectAttempts;
+		// The server sends the full record again for each new subscription.
+		this._records = {};
+
+		var options = [];
+		if( Socket.deltaUpdates ) {
+			options.push('delta=true');
+		}
+		if( Socket.binaryArrays ) {
+			options.push('binary=true');
+		}
+		if( Socket.rateLimit > 0 ) {
+			options.push('ratelimit='+Socket.rateLimit);
+		}
+		if( options.length > 0 ) {
+			this._socket.send('OPT '+options.join('&'));
+		}
 		
 		for( var idx=0; idx<this._pending.length; idx++ ) {
 			this._socket.send(this._pending[idx]);
@@ -296,15 +353,51 @@ var csweb = {};
 		this.dispatchEvent(event);
 		// Attempt to parse data and dispatch the events. //
 		try {
-			var data = JSON.parse(event.data);
+			var data;
+			if( typeof event.data === 'string' ) {
+				data = JSON.parse(event.data);
+			} else if( (data = decodeArray(event.data)) !== undefined ) {
+				// Binary array message, already decoded.
+			} else if( this._socket.protocol in Socket.decoders ) {
+				data = Socket.decoders[this._socket.protocol](event.data);
+			} else {
+				console.log('No decoder for binary message with protocol: ' + this._socket.protocol);
+				return;
+			}
 			for( var url in data ) {
-				this.dispatchEvent({ type:url, data:data[url] });
+				this.dispatchEvent({ type:url, data:this._mergeRecord(url, data[url]) });
 			}
 		} catch(e) {
-			console.log('Unable to parse message as JSON.');
+			console.log('Unable to parse message: ' + e);
 		}
 	};
 
+	// With delta updates the server sends the full record for the first
+	// update and then only the changed properties, and the removed
+	// properties listed in '-', so merge them into a copy of the last
+	// record received for the URL.
+	Socket.prototype._mergeRecord = function(url, data) {
+		var record = this._records[url];
+		if( isPlainObj(data) && isPlainObj(record) ) {
+			var merged = {};
+			for( var key in record ) {
+				merged[key] = record[key];
+			}
+			for( var key in data ) {
+				if( key !== '-' ) {
+					merged[key] = data[key];
+				}
+			}
+			var removed = data['-'] || [];
+			for( var idx=0; idx<removed.length; idx++ ) {
+				delete merged[removed[idx]];
+			}
+			data = merged;
+		}
+		this._records[url] = data;
+		return data;
+	};
+
 	Socket.prototype._socketOnError = function(event) {
 		// Browser log the cause of this error to console. //
 		this.readyState = this._socket.readyState;
@@ -351,8 +444,38 @@ var csweb = {};
 		}
 	};
 
+	// Subscriptions requested together (ie while building a page)
+	// are sent as a single bulk request: [["SUB", uri], ["UNSUB", uri], ...]
 	Socket.prototype.subscribe = function(uri) {
-		this.send('SUB '+uri);
+		this._request('SUB', uri);
+	};
+
+	// Request the most recent data without subscribing.
+	Socket.prototype.get = function(uri) {
+		this._request('GET', uri);
+	};
+
+	Socket.prototype.unsubscribe = function(uri) {
+		delete this._records[uri];
+		this._request('UNSUB', uri);
+	};
+
+	Socket.prototype._request = function(action, uri) {
+		this._requests.push([action, uri]);
+		if( this._requests.length === 1 ) {
+			var self = this;
+			setTimeout(function() { self._sendRequests(); }, 0);
+		}
+	};
+
+	Socket.prototype._sendRequests = function() {
+		var requests = this._requests;
+		this._requests = [];
+		if( requests.length === 1 ) {
+			this.send(requests[0][0]+' '+requests[0][1]);
+			return;
+		}
+		this.send(JSON.stringify(requests));
 	};
 
 })();